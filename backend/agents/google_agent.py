@@ -2,12 +2,16 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Iterable, List, Mapping, Optional
+from typing import AsyncIterator, Iterable, Iterator, List, Mapping, Optional
 
 import google.generativeai as genai
 
 from config import settings
 
+# generate() / generate_async() answer with these instead of raising
+FILTERED_RESPONSE = "I could not generate a response. The model may have filtered the content."
+ERROR_RESPONSE_PREFIX = "Error generating response"
+
 
 class GoogleDocAgent:
 
@@ -64,6 +68,7 @@ class GoogleDocAgent:
         chunks: Iterable[Mapping[str, str]],
         metadata: Optional[Mapping[str, str]] = None,
         include_static_refs: bool = False,  # Changed to False by default
+        max_chunk_chars: Optional[int] = 2000,
     ) -> str:
         """
         Create a prompt string that embeds retrieved document chunks and optional metadata.
@@ -73,6 +78,8 @@ class GoogleDocAgent:
             chunks: Retrieved document chunks (should be limited to 5-10 chunks)
             metadata: Optional metadata about the job/document
             include_static_refs: Whether to include static reference files (default: False)
+            max_chunk_chars: Per-chunk character cap; None when the chunks are
+                already packed to a token budget (see context_packer.py)
         """
         references = []
         
@@ -83,8 +90,8 @@ class GoogleDocAgent:
                 continue
                 
             # Allow longer chunks for better context (up to 2000 chars)
-            if len(text) > 2000:
-                text = text[:2000] + "...[truncated]"
+            if max_chunk_chars is not None and len(text) > max_chunk_chars:
+                text = text[:max_chunk_chars] + "...[truncated]"
             
             doc_id = chunk.get("document_id", "unknown")
             chunk_idx = chunk.get("chunk_index", "unknown")
@@ -140,6 +147,7 @@ class GoogleDocAgent:
         chunks: Iterable[Mapping[str, str]],
         metadata: Optional[Mapping[str, str]] = None,
         include_static_refs: bool = False,
+        max_chunk_chars: Optional[int] = 2000,
     ) -> str:
         """
         Generate a response to the question based on document chunks.
@@ -149,8 +157,9 @@ class GoogleDocAgent:
             chunks: Retrieved document chunks (max 5-10 recommended)
             metadata: Optional metadata
             include_static_refs: Whether to include static reference files (default: False)
+            max_chunk_chars: Per-chunk character cap passed to build_prompt
         """
-        prompt = self.build_prompt(question, chunks, metadata, include_static_refs)
+        prompt = self.build_prompt(question, chunks, metadata, include_static_refs, max_chunk_chars)
         
         # Debug: show prompt length
         print(f"Prompt length: {len(prompt)} characters ({len(prompt.split())} words)")
@@ -159,7 +168,75 @@ class GoogleDocAgent:
             response = self.model.generate_content(prompt)
             if response.candidates and len(response.candidates) > 0:
                 return response.text.strip()
-            return "I could not generate a response. The model may have filtered the content."
+            return FILTERED_RESPONSE
+        except Exception as exc:
+            print(f"Gemini generation error: {exc}")
+            return f"{ERROR_RESPONSE_PREFIX}: {str(exc)}"
+
+    def generate_stream(
+        self,
+        question: str,
+        chunks: Iterable[Mapping[str, str]],
+        metadata: Optional[Mapping[str, str]] = None,
+        include_static_refs: bool = False,
+        max_chunk_chars: Optional[int] = 2000,
+    ) -> Iterator[str]:
+        """
+        Stream the response text as Gemini produces it.
+        
+        Unlike generate(), errors are raised so the caller can fall back to
+        another model before anything has been sent.
+        """
+        prompt = self.build_prompt(question, chunks, metadata, include_static_refs, max_chunk_chars)
+        print(f"Prompt length: {len(prompt)} characters ({len(prompt.split())} words)")
+        
+        for part in self.model.generate_content(prompt, stream=True):
+            try:
+                text = part.text
+            except ValueError:
+                # Parts without text, e.g. a safety-filtered final part
+                continue
+            if text:
+                yield text
+
+    async def generate_async(
+        self,
+        question: str,
+        chunks: Iterable[Mapping[str, str]],
+        metadata: Optional[Mapping[str, str]] = None,
+        include_static_refs: bool = False,
+        max_chunk_chars: Optional[int] = 2000,
+    ) -> str:
+        """generate() on the asyncio event loop instead of a blocking HTTP call."""
+        prompt = self.build_prompt(question, chunks, metadata, include_static_refs, max_chunk_chars)
+        print(f"Prompt length: {len(prompt)} characters ({len(prompt.split())} words)")
+        
+        try:
+            response = await self.model.generate_content_async(prompt)
+            if response.candidates and len(response.candidates) > 0:
+                return response.text.strip()
+            return FILTERED_RESPONSE
         except Exception as exc:
             print(f"Gemini generation error: {exc}")
-            return f"Error generating response: {str(exc)}"
+            return f"{ERROR_RESPONSE_PREFIX}: {str(exc)}"
+
+    async def generate_stream_async(
+        self,
+        question: str,
+        chunks: Iterable[Mapping[str, str]],
+        metadata: Optional[Mapping[str, str]] = None,
+        include_static_refs: bool = False,
+        max_chunk_chars: Optional[int] = 2000,
+    ) -> AsyncIterator[str]:
+        """generate_stream() on the asyncio event loop; errors are raised as well."""
+        prompt = self.build_prompt(question, chunks, metadata, include_static_refs, max_chunk_chars)
+        print(f"Prompt length: {len(prompt)} characters ({len(prompt.split())} words)")
+        
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for part in response:
+            try:
+                text = part.text
+            except ValueError:
+                continue
+            if text:
+                yield text
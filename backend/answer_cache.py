@@ -0,0 +1,241 @@
+"""
+Semantic cache of /chat answers.
+
+Analysts on one team keep asking the same things about the same job ("who
+are the suspects", "summarize the timeline"), and every ask re-ran retrieval
+plus a 10-30 s generation. Answers are cached per scope and matched by query
+embedding: a question hits when its cosine similarity to a cached question in
+the same scope is at least CHAT_ANSWER_CACHE_THRESHOLD.
+
+The scope is the job_id and the sorted document_ids of the request. Job and
+document access are checked before the cache is consulted, so scoped answers
+are shared by everyone allowed to see that job; unscoped questions are also
+keyed by the asker's RBAC scope (their own rows, or a manager's team).
+
+Entries carry a fingerprint of their scope: the number of indexed documents
+and the latest document_vectors.updated_at, which vectorise_and_store_alloydb
+bumps whenever a document is (re)indexed. A lookup whose fingerprint differs
+drops the scope's entries, so a reprocessed document, new chunks or a new
+document in scope invalidate cached answers in every API process without any
+cross-process messaging.
+
+Usage:
+    from answer_cache import answer_scope_key, get_answer_cache, scope_fingerprint
+
+    cache = get_answer_cache()
+    scope = answer_scope_key(user, job_id, document_ids)
+    fingerprint = scope_fingerprint(db, user, job_id, document_ids)
+    answer = cache.lookup(scope, query_embedding, fingerprint)
+    if answer is None:
+        answer = {...}
+        cache.store(scope, query_embedding, fingerprint, answer)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from rbac import filter_owned_rows
+import models
+
+Fingerprint = Tuple[int, Optional[str]]
+
+
+def answer_scope_key(
+    user: Optional[models.User],
+    job_id: Optional[str],
+    document_ids: Optional[Sequence[int]]
+) -> str:
+    """Cache scope for a chat request; see the module docstring for the sharing rules."""
+    documents = ",".join(str(doc_id) for doc_id in sorted(set(document_ids or [])))
+    if job_id or documents:
+        owner = "*"
+    elif user is None or user.rbac_level == models.RBACLevel.ADMIN:
+        owner = "all"
+    elif user.rbac_level == models.RBACLevel.MANAGER:
+        owner = f"manager:{user.id}"
+    else:
+        owner = f"user:{user.id}"
+    return f"{owner}|job={job_id or '*'}|docs={documents or '*'}"
+
+
+def scope_fingerprint(
+    db: Session,
+    user: Optional[models.User],
+    job_id: Optional[str],
+    document_ids: Optional[Sequence[int]]
+) -> Fingerprint:
+    """(indexed document count, latest index time) over the documents in scope."""
+    vector = models.DocumentVector
+    query = filter_owned_rows(
+        db.query(func.count(vector.document_id), func.max(vector.updated_at)),
+        user,
+        vector
+    )
+    if job_id:
+        query = query.filter(vector.job_id == job_id)
+    if document_ids:
+        query = query.filter(vector.document_id.in_(list(document_ids)))
+    count, latest = query.one()
+    return int(count or 0), latest.isoformat() if latest else None
+
+
+class ChatAnswerCache:
+    """In-process, per-scope cache of answers matched by query embedding similarity."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_entries_per_scope: int = 64,
+        ttl_seconds: int = 1800,
+        threshold: float = 0.95
+    ):
+        self.max_entries = max(1, max_entries)
+        self.max_entries_per_scope = max(1, max_entries_per_scope)
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        # scope -> {"fingerprint", "vectors" (n x d, unit rows), "answers", "expires"}
+        self._scopes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def lookup(
+        self,
+        scope: str,
+        embedding: Sequence[float],
+        fingerprint: Fingerprint
+    ) -> Optional[Dict[str, Any]]:
+        """Cached answer for the closest question above the threshold, else None."""
+        query = _unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is not None and bucket["fingerprint"] != fingerprint:
+                self._drop_scope(scope)
+                self._stats["invalidations"] += 1
+                bucket = None
+            if bucket is not None:
+                self._expire(scope, bucket, now)
+                bucket = self._scopes.get(scope)
+            if bucket is None or query is None:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = bucket["vectors"] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            self._scopes.move_to_end(scope)
+            self._stats["hits"] += 1
+            return {**bucket["answers"][best], "cached": True, "cache_similarity": round(similarity, 4)}
+
+    def store(
+        self,
+        scope: str,
+        embedding: Sequence[float],
+        fingerprint: Fingerprint,
+        answer: Dict[str, Any]
+    ) -> None:
+        query = _unit(embedding)
+        if query is None:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is not None and bucket["fingerprint"] != fingerprint:
+                self._drop_scope(scope)
+                bucket = None
+            if bucket is None:
+                bucket = {
+                    "fingerprint": fingerprint,
+                    "vectors": np.empty((0, query.shape[0]), dtype=np.float32),
+                    "answers": [],
+                    "expires": [],
+                }
+                self._scopes[scope] = bucket
+            if bucket["vectors"].shape[1] != query.shape[0]:
+                return
+
+            bucket["vectors"] = np.vstack([bucket["vectors"], query[None, :]])
+            bucket["answers"].append(dict(answer))
+            bucket["expires"].append(expires_at)
+            self._size += 1
+            if len(bucket["answers"]) > self.max_entries_per_scope:
+                self._remove(bucket, [0])
+            self._scopes.move_to_end(scope)
+
+            # Evict least recently used scopes until the cache fits
+            while self._size > self.max_entries and self._scopes:
+                oldest = next(iter(self._scopes))
+                self._stats["evictions"] += len(self._scopes[oldest]["answers"])
+                self._drop_scope(oldest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+            self._size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._size
+            stats["scopes"] = len(self._scopes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _expire(self, scope: str, bucket: Dict[str, Any], now: float) -> None:
+        expired = [i for i, expires_at in enumerate(bucket["expires"]) if expires_at <= now]
+        if expired:
+            self._remove(bucket, expired)
+        if not bucket["answers"]:
+            self._drop_scope(scope)
+
+    def _remove(self, bucket: Dict[str, Any], indexes: List[int]) -> None:
+        drop = set(indexes)
+        keep = [i for i in range(len(bucket["answers"])) if i not in drop]
+        bucket["vectors"] = bucket["vectors"][keep]
+        bucket["answers"] = [bucket["answers"][i] for i in keep]
+        bucket["expires"] = [bucket["expires"][i] for i in keep]
+        self._size -= len(drop)
+
+    def _drop_scope(self, scope: str) -> None:
+        bucket = self._scopes.pop(scope, None)
+        if bucket is not None:
+            self._size -= len(bucket["answers"])
+
+
+def _unit(embedding: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+    if embedding is None:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    if vector.ndim != 1 or norm == 0.0:
+        return None
+    return vector / norm
+
+
+_answer_cache: Optional[ChatAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> ChatAnswerCache:
+    """Return the process-wide chat answer cache."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = ChatAnswerCache(
+                    max_entries=settings.CHAT_ANSWER_CACHE_SIZE,
+                    ttl_seconds=settings.CHAT_ANSWER_CACHE_TTL_SECONDS,
+                    threshold=settings.CHAT_ANSWER_CACHE_THRESHOLD
+                )
+    return _answer_cache
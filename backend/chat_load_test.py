@@ -0,0 +1,204 @@
+"""
+Load test: /jobs/{id}/status latency while /chat requests run concurrently.
+
+/chat used to run its DB queries, query embedding and Ollama call on the
+event loop, so a handful of slow chats stalled every other request served by
+the same API worker, including the status polls the upload page makes every
+few seconds. This script drives the FastAPI app in-process and reports the
+status latency with no chat traffic and again while N chats are in flight.
+
+The slow parts of a chat are stubbed so no model or embedding server is
+needed:
+- retrieval (_retrieve_chat_context) sleeps --retrieval-ms, blocking, as the
+  real SQLAlchemy queries and embedding HTTP call do;
+- the chat LLM is an async client that answers after --llm-ms.
+--blocking-llm makes the stub LLM sleep on the event loop instead, which is
+what the status latency looks like when a chat blocks the loop.
+
+A throwaway analyst user and job are created in the configured database and
+removed at the end; run it against the SQLite dev database.
+
+Usage:
+    USE_SQLITE_FOR_DEV=true python chat_load_test.py --chats 32 --llm-ms 2000
+    USE_SQLITE_FOR_DEV=true python chat_load_test.py --chats 32 --blocking-llm
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import settings
+from database import SessionLocal, init_db
+from llm_clients import get_llm_clients
+from security import get_current_user
+import main
+import models
+
+
+class SlowChatClient:
+    """Stands in for ollama.AsyncClient: answers every chat after `latency_ms`."""
+
+    def __init__(self, latency_ms: float, blocking: bool = False):
+        self.latency_ms = latency_ms
+        self.blocking = blocking
+        self.calls = 0
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, **kwargs):
+        self.calls += 1
+        if self.blocking:
+            time.sleep(self.latency_ms / 1000.0)
+        else:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        return {"message": {"content": f"stub answer from {model}"}}
+
+
+def _stub_retrieval(retrieval_ms: float):
+    def retrieve(db, current_user, message, job_id, doc_id_list) -> Dict[str, Any]:
+        time.sleep(retrieval_ms / 1000.0)
+        results = [{
+            "chunk_text": f"Excerpt {i} relevant to: {message}",
+            "document_id": 1,
+            "chunk_index": i,
+            "metadata": {},
+            "score": 1.0 - i / 10,
+        } for i in range(8)]
+        return {"cached": None, "results": results, "cache_probe": None}
+    return retrieve
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+async def _poll_status(client: httpx.AsyncClient, job_id: str, interval: float, stop: asyncio.Event) -> List[float]:
+    """
+    Poll the status endpoint on a fixed schedule. Latency is measured from
+    when each poll was due, so time spent waiting for a blocked event loop
+    to even send the request is counted too.
+    """
+    latencies = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        response = await client.get(f"{settings.API_PREFIX}/jobs/{job_id}/status")
+        latencies.append((time.perf_counter() - due) * 1000)
+        response.raise_for_status()
+        due += interval
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=max(0.0, due - time.perf_counter()))
+        except asyncio.TimeoutError:
+            pass
+    return latencies
+
+
+async def _chat(client: httpx.AsyncClient, job_id: str, index: int) -> float:
+    started = time.perf_counter()
+    response = await client.post(
+        f"{settings.API_PREFIX}/chat",
+        params={"message": f"load test question {index}", "job_id": job_id}
+    )
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+async def run_load_test(
+    job_id: str,
+    chats: int,
+    baseline_seconds: float,
+    interval: float
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        stop = asyncio.Event()
+        poller = asyncio.create_task(_poll_status(client, job_id, interval, stop))
+        await asyncio.sleep(baseline_seconds)
+        stop.set()
+        baseline = await poller
+
+        stop = asyncio.Event()
+        poller = asyncio.create_task(_poll_status(client, job_id, interval, stop))
+        started = time.perf_counter()
+        chat_latencies = await asyncio.gather(*(_chat(client, job_id, i) for i in range(chats)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        under_load = await poller
+
+    return {
+        "status_baseline": _percentiles(baseline),
+        "status_under_load": _percentiles(under_load),
+        "chat": _percentiles(list(chat_latencies)),
+        "chat_wall_seconds": round(elapsed, 2),
+    }
+
+
+def _create_fixture(db) -> models.ProcessingJob:
+    suffix = uuid.uuid4().hex[:8]
+    user = models.User(
+        email=f"loadtest-{suffix}@example.com",
+        username=f"loadtest-{suffix}",
+        hashed_password="!",
+        rbac_level=models.RBACLevel.ANALYST
+    )
+    db.add(user)
+    db.flush()
+    job = models.ProcessingJob(
+        id=f"loadtest/{user.username}/{uuid.uuid4()}",
+        user_id=user.id,
+        status=models.JobStatus.PROCESSING,
+        gcs_prefix="loadtest/",
+        total_files=4,
+        processed_files=1
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /jobs/{id}/status latency under concurrent /chat load")
+    parser.add_argument("--chats", type=int, default=32, help="concurrent /chat requests")
+    parser.add_argument("--llm-ms", type=float, default=2000.0, help="simulated chat LLM latency")
+    parser.add_argument("--retrieval-ms", type=float, default=100.0, help="simulated blocking retrieval time")
+    parser.add_argument("--blocking-llm", action="store_true", help="stub LLM blocks the event loop")
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    parser.add_argument("--interval-ms", type=float, default=50.0, help="status poll period")
+    args = parser.parse_args()
+
+    init_db()
+    settings.USE_GEMINI_FOR_DEV = False
+    llm = SlowChatClient(args.llm_ms, blocking=args.blocking_llm)
+    get_llm_clients()._async_ollama[settings.CHAT_LLM_URL] = llm
+    main._retrieve_chat_context = _stub_retrieval(args.retrieval_ms)
+
+    db = SessionLocal()
+    job: Optional[models.ProcessingJob] = None
+    try:
+        job = _create_fixture(db)
+        user = job.user
+        main.app.dependency_overrides[get_current_user] = lambda: user
+        report = asyncio.run(run_load_test(job.id, args.chats, args.baseline_seconds, args.interval_ms / 1000.0))
+    finally:
+        if job is not None:
+            owner = job.user
+            db.delete(job)
+            db.delete(owner)
+            db.commit()
+        db.close()
+
+    print(f"{args.chats} concurrent chats (LLM {args.llm_ms:.0f}ms{', blocking' if args.blocking_llm else ''}, "
+          f"retrieval {args.retrieval_ms:.0f}ms) in {report['chat_wall_seconds']}s")
+    print(f"Chat latency:              {report['chat']}")
+    print(f"Status latency, idle:      {report['status_baseline']}")
+    print(f"Status latency, with chat: {report['status_under_load']}")
+    print(f"LLM stub calls: {llm.calls}, limiter: {get_llm_clients().get_stats()}")
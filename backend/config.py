@@ -40,6 +40,13 @@ class Settings(BaseSettings):
     
     USE_SQLITE_FOR_DEV: bool = os.getenv("USE_SQLITE_FOR_DEV", "false").lower() == "true"
     SQLITE_DB_PATH: str = os.getenv("SQLITE_DB_PATH", "./sentinel_dev.db")
+
+    # Vector search backend: 'auto' (pgvector on PostgreSQL, embedded index otherwise),
+    # 'pgvector' or 'local' (memory-mapped NumPy segments, see local_vector_index.py)
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "auto")
+    LOCAL_VECTOR_INDEX_PATH: str = os.getenv("LOCAL_VECTOR_INDEX_PATH", "./.local_vector_index")
+    LOCAL_VECTOR_INDEX_DTYPE: str = os.getenv("LOCAL_VECTOR_INDEX_DTYPE", "float32")
+    LOCAL_VECTOR_INDEX_MAX_SEGMENTS: int = int(os.getenv("LOCAL_VECTOR_INDEX_MAX_SEGMENTS", "16"))
     
     MAX_UPLOAD_FILES: int = int(os.getenv("MAX_UPLOAD_FILES", "10"))
     MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "4"))
@@ -75,6 +82,30 @@ class Settings(BaseSettings):
     REDIS_QUEUE_AUDIO: str = "audio_queue"
     REDIS_QUEUE_VIDEO: str = "video_queue"
     REDIS_QUEUE_GRAPH: str = "graph_queue"
+
+    # Reliable queues (reliable_queue.py): per-worker processing lists, redelivery, dead letters
+    QUEUE_RELIABLE: bool = os.getenv("QUEUE_RELIABLE", "true").lower() == "true"
+    QUEUE_VISIBILITY_TIMEOUT_SECONDS: int = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", "60"))
+    QUEUE_MAX_ATTEMPTS: int = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+
+    # Processor worker runtime (worker_runtime.py)
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "1"))
+    WORKER_PREFETCH: int = int(os.getenv("WORKER_PREFETCH", "1"))
+    # 0 = consume in the main process; N = supervise N forked worker processes
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", "0"))
+    WORKER_MAX_TASKS_PER_CHILD: int = int(os.getenv("WORKER_MAX_TASKS_PER_CHILD", "0"))
+    WORKER_DRAIN_TIMEOUT_SECONDS: float = float(os.getenv("WORKER_DRAIN_TIMEOUT_SECONDS", "300"))
+
+    # Tenant-fair scheduling of upload queues (fair_queue.py); needs QUEUE_RELIABLE, and every
+    # consumer of these queues must run TenantFairQueue or tenant sub-queues are never read
+    QUEUE_TENANT_FAIR: bool = os.getenv("QUEUE_TENANT_FAIR", "false").lower() == "true"
+    QUEUE_TENANT_FAIR_QUEUES: str = os.getenv("QUEUE_TENANT_FAIR_QUEUES", "document_queue,audio_queue,video_queue")
+    # 'manager' (one lane per team) or 'analyst' (one lane per uploader)
+    QUEUE_TENANT_KEY: str = os.getenv("QUEUE_TENANT_KEY", "analyst")
+    # Deficit round-robin credit per turn in cost units (TXT page ~0.5, 1 MB PDF ~5), times tenant weight
+    QUEUE_TENANT_QUANTUM: float = float(os.getenv("QUEUE_TENANT_QUANTUM", "4"))
+    # e.g. "alice=2,bob/carol=0.5"; tenants not listed weigh 1
+    QUEUE_TENANT_WEIGHTS: str = os.getenv("QUEUE_TENANT_WEIGHTS", "")
     
     # AlloyDB Configuration
     ALLOYDB_HOST: str = os.getenv("ALLOYDB_HOST", "localhost")
@@ -119,6 +150,8 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
     RBAC_LEVELS: List[str] = ["admin", "manager", "analyst"]
+    # Cache each manager's team (accessible user IDs) for this many seconds; 0 uses SQL subqueries only
+    RBAC_SCOPE_CACHE_TTL_SECONDS: float = float(os.getenv("RBAC_SCOPE_CACHE_TTL_SECONDS", "0"))
     
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
     # CORS_ORIGINS: List[str] = ["http://nodejsapp.enter-mnemon.com/", "http://localhost:3000"]
@@ -129,8 +162,84 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "embeddinggemma:latest")
     EMBEDDING_LLM_HOST: str = os.getenv("EMBEDDING_LLM_HOST", "localhost")
     EMBEDDING_LLM_PORT: int = int(os.getenv("EMBEDDING_LLM_PORT", "11434"))
-    
+
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "768"))
+
+    # Ingestion: number of chunks sent per embedding request
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+    # Reprocessing diffs chunks by content hash instead of deleting and re-embedding them all
+    INCREMENTAL_REINDEX: bool = os.getenv("INCREMENTAL_REINDEX", "true").lower() == "true"
+    # Reuse stored chunk embeddings keyed by sha256(chunk_text) + model at ingestion
+    CHUNK_EMBEDDING_CACHE: bool = os.getenv("CHUNK_EMBEDDING_CACHE", "true").lower() == "true"
+
+    # Embedding gateway: 'ollama' or 'fake' (in-process, for load tests)
+    EMBEDDING_ENGINE: str = os.getenv("EMBEDDING_ENGINE", "ollama")
+    EMBEDDING_GATEWAY_MAX_BATCH: int = int(os.getenv("EMBEDDING_GATEWAY_MAX_BATCH", "64"))
+    EMBEDDING_GATEWAY_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_GATEWAY_MAX_WAIT_MS", "5"))
+    # Callers of a batch the engine has not answered by then get TimeoutError
+    EMBEDDING_GATEWAY_TIMEOUT_SECONDS: float = float(os.getenv("EMBEDDING_GATEWAY_TIMEOUT_SECONDS", "120"))
+
+    # Shared LLM clients (llm_clients.py): keep-alive pools and per-backend concurrency limits
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+    LLM_HTTP_MAX_KEEPALIVE: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+    OLLAMA_MAX_CONCURRENCY: int = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+    # Query embedding cache (in-process LRU, optionally shared through Redis)
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+    QUERY_EMBEDDING_CACHE_REDIS: bool = os.getenv("QUERY_EMBEDDING_CACHE_REDIS", "false").lower() == "true"
+
+    # Semantic /chat answer cache (answer_cache.py): per scope, matched by query cosine similarity
+    CHAT_ANSWER_CACHE: bool = os.getenv("CHAT_ANSWER_CACHE", "true").lower() == "true"
+    CHAT_ANSWER_CACHE_SIZE: int = int(os.getenv("CHAT_ANSWER_CACHE_SIZE", "512"))
+    CHAT_ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("CHAT_ANSWER_CACHE_TTL_SECONDS", "1800"))
+    CHAT_ANSWER_CACHE_THRESHOLD: float = float(os.getenv("CHAT_ANSWER_CACHE_THRESHOLD", "0.95"))
+
+    # GET /jobs/{id}/events: seconds between keep-alive comments on an idle stream
+    JOB_EVENTS_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+    # Vector index on document_chunks: 'hnsw' or 'ivfflat' (see vector_index.py)
+    VECTOR_INDEX_TYPE: str = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    IVFFLAT_LISTS: int = int(os.getenv("IVFFLAT_LISTS", "100"))
+    # Per-query defaults; similarity_search can override them per call
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", "40"))
+    IVFFLAT_PROBES: int = int(os.getenv("IVFFLAT_PROBES", "10"))
+
+    # Similarity search: 'auto' picks exact search for small scoped candidate sets
+    VECTOR_SEARCH_STRATEGY: str = os.getenv("VECTOR_SEARCH_STRATEGY", "auto")
+    EXACT_SEARCH_MAX_CANDIDATES: int = int(os.getenv("EXACT_SEARCH_MAX_CANDIDATES", "20000"))
+    # pgvector >= 0.8 iterative index scans for filtered ANN queries: off, relaxed_order, strict_order
+    VECTOR_ITERATIVE_SCAN: str = os.getenv("VECTOR_ITERATIVE_SCAN", "off")
+    # Quantized first pass for ANN search: 'none', 'halfvec' or 'binary' (see vector_index.py)
+    VECTOR_QUANTIZATION: str = os.getenv("VECTOR_QUANTIZATION", "none")
+    QUANTIZED_RERANK_MULTIPLIER: int = int(os.getenv("QUANTIZED_RERANK_MULTIPLIER", "8"))
+
+    # Two-stage retrieval: wide searches first pick the closest documents by centroid
+    TWO_STAGE_RETRIEVAL: bool = os.getenv("TWO_STAGE_RETRIEVAL", "true").lower() == "true"
+    TWO_STAGE_TOP_DOCUMENTS: int = int(os.getenv("TWO_STAGE_TOP_DOCUMENTS", "50"))
+
+    # Retrieval mode: 'vector', 'lexical' or 'hybrid' (vector + full-text, fused with RRF)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    LEXICAL_TS_CONFIG: str = os.getenv("LEXICAL_TS_CONFIG", "simple")
+    HYBRID_CANDIDATE_MULTIPLIER: int = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+
+    # Chat context selection: MMR over MMR_FETCH_K candidates (1.0 = relevance only)
+    MMR_FETCH_K: int = int(os.getenv("MMR_FETCH_K", "24"))
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", "0.6"))
+    MMR_DUPLICATE_THRESHOLD: float = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+
     GOOGLE_CHAT_MODEL: str = os.getenv("GOOGLE_CHAT_MODEL", "gemini-2.0-flash-exp")
+
+    # Token budget for retrieved excerpts per chat model (see context_packer.py)
+    CHAT_LLM_CONTEXT_TOKENS: int = int(os.getenv("CHAT_LLM_CONTEXT_TOKENS", "1500"))
+    GOOGLE_CHAT_CONTEXT_TOKENS: int = int(os.getenv("GOOGLE_CHAT_CONTEXT_TOKENS", "6000"))
     GOOGLE_AGENT_REFERENCE_PATHS_RAW: str = os.getenv("GOOGLE_AGENT_REFERENCE_PATHS", "")
     
     @property
@@ -157,6 +266,10 @@ class Settings(BaseSettings):
     def allowed_extensions_list(self) -> List[str]:
         return [ext.strip() for ext in self.ALLOWED_EXTENSIONS.split(",")]
     
+    @property
+    def tenant_fair_queues_list(self) -> List[str]:
+        return [name.strip() for name in self.QUEUE_TENANT_FAIR_QUEUES.split(",") if name.strip()]
+    
     @property
     def max_file_size_bytes(self) -> int:
         return self.MAX_FILE_SIZE_MB * 1024 * 1024
@@ -0,0 +1,131 @@
+"""
+Token-budgeted context packing for RAG prompts.
+
+Chat used to cut every chunk to a fixed number of characters (800 for Ollama,
+1500 / 2000 for Gemini) no matter how relevant it was or how large the
+model's context is. The packer instead gets a token budget per chat model
+and fills it greedily by relevance per token: whole chunks first, then the
+best remaining chunk trimmed at a sentence boundary to the space left.
+
+Token counts are estimated from characters (no tokenizer ships with the
+local Gemma models): about 4 characters per token for Latin script and 2 for
+other scripts such as Devanagari.
+
+Usage:
+    from context_packer import get_context_budget, pack_context
+
+    packed = pack_context(results, get_context_budget(settings.CHAT_LLM_MODEL))
+    for chunk in packed["chunks"]:
+        ...
+    print(packed["tokens_used"], packed["budget"])
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import settings
+
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.0
+# Tokens spent on the "[Source n] (Document ..., Chunk ...)" header of each excerpt
+CHUNK_OVERHEAD_TOKENS = 12
+# Do not bother adding a trimmed chunk shorter than this
+MIN_CHUNK_TOKENS = 32
+
+# Sentence ends: . ! ? and the Devanagari danda
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?।])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    other_chars = len(text) - ascii_chars
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN + other_chars / OTHER_CHARS_PER_TOKEN)
+
+
+def get_context_budget(model: Optional[str] = None) -> int:
+    """Token budget for retrieved excerpts in prompts to `model`."""
+    if model and model == settings.GOOGLE_CHAT_MODEL:
+        return settings.GOOGLE_CHAT_CONTEXT_TOKENS
+    return settings.CHAT_LLM_CONTEXT_TOKENS
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Longest prefix of whole sentences within max_tokens; falls back to whole
+    words, then characters, when the first sentence alone is too long.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    kept: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        tokens = estimate_tokens(sentence) + (1 if kept else 0)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept:
+        return " ".join(kept)
+
+    words: List[str] = []
+    used = 0
+    for word in text.split():
+        tokens = estimate_tokens(word) + (1 if words else 0)
+        if used + tokens > max_tokens:
+            break
+        words.append(word)
+        used += tokens
+    if words:
+        return " ".join(words) + "..."
+    return text[:int(max_tokens * OTHER_CHARS_PER_TOKEN)]
+
+
+def pack_context(
+    results: Sequence[Dict[str, Any]],
+    budget_tokens: int,
+    chunk_overhead_tokens: int = CHUNK_OVERHEAD_TOKENS,
+    min_chunk_tokens: int = MIN_CHUNK_TOKENS
+) -> Dict[str, Any]:
+    """
+    Select and trim search results to fit `budget_tokens`.
+
+    `results` are similarity_search dicts in relevance order; their "score"
+    is used as relevance when present, otherwise the rank. Packed chunks keep
+    that order and gain "tokens" and "truncated" keys. Returns
+    {"chunks", "tokens_used", "budget", "dropped"}.
+    """
+    candidates = []
+    for rank, result in enumerate(results):
+        text = (result.get("chunk_text") or "").strip()
+        if not text:
+            continue
+        tokens = estimate_tokens(text) + chunk_overhead_tokens
+        score = result.get("score")
+        relevance = float(score) if score is not None else 1.0 / (rank + 1)
+        candidates.append((rank, result, text, tokens, relevance))
+
+    # Greedy by relevance per token; ties go to the better-ranked chunk
+    by_density = sorted(candidates, key=lambda item: (-item[4] / item[3], item[0]))
+    remaining = budget_tokens
+    packed: Dict[int, Dict[str, Any]] = {}
+    for rank, result, text, tokens, _ in by_density:
+        if tokens <= remaining:
+            packed[rank] = {**result, "chunk_text": text, "tokens": tokens, "truncated": False}
+            remaining -= tokens
+        elif remaining - chunk_overhead_tokens >= min_chunk_tokens:
+            trimmed = trim_to_tokens(text, remaining - chunk_overhead_tokens)
+            if trimmed:
+                trimmed_tokens = estimate_tokens(trimmed) + chunk_overhead_tokens
+                packed[rank] = {**result, "chunk_text": trimmed, "tokens": trimmed_tokens, "truncated": True}
+                remaining -= trimmed_tokens
+
+    chunks = [packed[rank] for rank in sorted(packed)]
+    return {
+        "chunks": chunks,
+        "tokens_used": budget_tokens - remaining,
+        "budget": budget_tokens,
+        "dropped": len(candidates) - len(chunks),
+    }
@@ -1,7 +1,7 @@
 """
 Database configuration with AlloyDB and pgvector support
 """
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
@@ -37,6 +37,20 @@ def get_db():
         db.close()
 
 
+def upsert_insert(bind):
+    """
+    Dialect-specific `insert` supporting ON CONFLICT (on_conflict_do_nothing /
+    on_conflict_do_update) for PostgreSQL and SQLite.
+    """
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"ON CONFLICT inserts are not supported on {bind.dialect.name}")
+    return insert
+
+
 def init_db():
     """
     Initialize database tables and pgvector extension
@@ -54,3 +68,81 @@ def init_db():
     # Create all tables
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created")
+    
+    # create_all skips existing tables; add columns and indexes declared on the models since
+    _add_missing_columns()
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"⚠️  Could not create index {index.name}: {e}")
+    
+    # Vector index on document_chunks (HNSW/IVFFlat, see vector_index.py)
+    from vector_index import ensure_vector_index
+    try:
+        ensure_vector_index(engine)
+    except Exception as e:
+        print(f"⚠️  Could not create vector index: {e}")
+    
+    # Full-text and trigram indexes on document_chunks; created by `python lexical_index.py migrate`
+    from lexical_index import ensure_lexical_index
+    try:
+        ensure_lexical_index(engine)
+    except Exception as e:
+        print(f"⚠️  Could not check lexical indexes: {e}")
+    
+    # Per-document centroid index for two-stage retrieval (see document_vectors.py)
+    from document_vectors import backfill_document_vectors, ensure_document_vector_index
+    try:
+        ensure_document_vector_index(engine)
+    except Exception as e:
+        print(f"⚠️  Could not create document vector index: {e}")
+    
+    # Backfill denormalised ownership on chunks written before it existed
+    from rbac import sync_chunk_ownership
+    db = SessionLocal()
+    try:
+        updated = sync_chunk_ownership(db, only_missing=True)
+        db.commit()
+        if updated:
+            print(f"✅ Backfilled ownership on {updated} document chunks")
+        created = backfill_document_vectors(db)
+        if created:
+            print(f"✅ Backfilled {created} document vectors")
+        from job_progress import backfill_graph_progress
+        initialised = backfill_graph_progress(db)
+        db.commit()
+        if initialised:
+            print(f"✅ Backfilled graph progress on {initialised} jobs")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Could not backfill chunk ownership / document vectors / job progress: {e}")
+    finally:
+        db.close()
+
+
+def _add_missing_columns():
+    """
+    Add nullable model columns that are missing from existing tables.
+    
+    Lightweight stand-in for a migration: only nullable columns are added,
+    without foreign key constraints.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"✅ Added column {table.name}.{column.name}")
+            except Exception as e:
+                print(f"⚠️  Could not add column {table.name}.{column.name}: {e}")
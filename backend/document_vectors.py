@@ -0,0 +1,122 @@
+"""
+Per-document centroid vectors for two-stage retrieval.
+
+A manager's scope can cover hundreds of analysts' documents, and ranking
+every accessible chunk means a filtered ANN scan over a huge candidate set.
+Each document therefore also gets one vector in `document_vectors`: the
+normalised mean of its chunk embeddings, with the same denormalised
+ownership columns as document_chunks and its own HNSW index.
+
+similarity_search uses it as a coarse first stage for wide (unscoped)
+queries: `top_documents` picks the TWO_STAGE_TOP_DOCUMENTS closest documents
+the user may access, and chunk-level search then runs only inside them.
+
+Usage:
+    from document_vectors import refresh_document_vector, top_documents
+
+    refresh_document_vector(db, document_id)   # after (re)indexing its chunks
+    db.commit()
+    document_ids = top_documents(db, query_embedding, user, limit=50)
+"""
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import exists, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import upsert_insert
+from rbac import chunk_ownership, filter_owned_rows
+from vector_index import OPCLASS, build_index_sql
+import models
+
+TABLE_NAME = "document_vectors"
+INDEX_NAME = "ix_document_vectors_embedding"
+
+
+def ensure_document_vector_index(engine: Engine) -> None:
+    """Create the HNSW index on document_vectors.embedding if missing (PostgreSQL only)."""
+    if engine.dialect.name != "postgresql":
+        return
+    create_sql = build_index_sql(
+        index_name=INDEX_NAME,
+        index_type="hnsw",
+        table_name=TABLE_NAME,
+        column_name="embedding",
+        opclass=OPCLASS
+    )
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        conn.execute(text(create_sql))
+
+
+def refresh_document_vector(db: Session, document_id: int) -> bool:
+    """
+    Recompute a document's centroid from its chunk embeddings. The caller commits.
+
+    Returns False (and drops the row) when the document has no embedded chunks.
+    """
+    rows = db.query(models.DocumentChunk.embedding).filter(
+        models.DocumentChunk.document_id == document_id,
+        models.DocumentChunk.embedding.isnot(None)
+    ).all()
+    if not rows:
+        delete_document_vector(db, document_id)
+        return False
+
+    matrix = np.asarray([row[0] for row in rows], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    centroid = (matrix / norms).mean(axis=0)
+    centroid /= np.linalg.norm(centroid) or 1.0
+
+    values = {
+        "document_id": document_id,
+        "embedding": centroid.tolist(),
+        "chunk_count": len(rows),
+        "updated_at": datetime.utcnow(),
+        **chunk_ownership(db, document_id),
+    }
+    insert = upsert_insert(db.get_bind())
+    stmt = insert(models.DocumentVector.__table__).values(values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["document_id"],
+        set_={key: value for key, value in values.items() if key != "document_id"}
+    ))
+    return True
+
+
+def delete_document_vector(db: Session, document_id: int) -> None:
+    db.query(models.DocumentVector).filter(
+        models.DocumentVector.document_id == document_id
+    ).delete(synchronize_session=False)
+
+
+def backfill_document_vectors(db: Session, batch_size: int = 100) -> int:
+    """Create centroids for documents indexed before document_vectors existed."""
+    chunk = models.DocumentChunk
+    missing = [
+        row[0] for row in db.query(chunk.document_id).filter(
+            chunk.embedding.isnot(None),
+            ~exists().where(models.DocumentVector.document_id == chunk.document_id)
+        ).distinct()
+    ]
+    for start in range(0, len(missing), batch_size):
+        for document_id in missing[start:start + batch_size]:
+            refresh_document_vector(db, document_id)
+        db.commit()
+    return len(missing)
+
+
+def top_documents(
+    db: Session,
+    query_embedding: List[float],
+    user: Optional[models.User],
+    limit: int
+) -> List[int]:
+    """Ids of the `limit` accessible documents whose centroid is closest to the query."""
+    vector = models.DocumentVector
+    distance = vector.embedding.cosine_distance(query_embedding)
+    query = filter_owned_rows(db.query(vector.document_id), user, vector)
+    rows = query.filter(vector.embedding.isnot(None)).order_by(distance).limit(limit).all()
+    return [row[0] for row in rows]
@@ -0,0 +1,220 @@
+"""
+Caches for embedding vectors.
+
+QueryEmbeddingCache keeps the embeddings of recent chat queries so that
+re-asking the same (or trivially re-worded) question does not pay the
+embedding round-trip again. Entries are keyed by the normalised query text
+and the embedding model name, held in a bounded in-process LRU with a TTL,
+and optionally mirrored to Redis so several API replicas share them.
+
+ChunkEmbeddingCache is the ingestion-side counterpart: chunk embeddings are
+stored in the `embedding_cache` table keyed by sha256(chunk_text) and model
+name, so re-uploading the same report reuses its vectors instead of
+re-embedding every chunk. Lookups and inserts are done in bulk per document.
+
+Usage:
+    from embedding_cache import get_query_embedding_cache
+
+    cache = get_query_embedding_cache()
+    vector = cache.get(query, model_name)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        cache.put(query, model_name, vector)
+
+    chunk_cache = ChunkEmbeddingCache(db)
+    cached = chunk_cache.get_many([content_hash(text) for text in chunks], model_name)
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import upsert_insert
+import models
+
+# Redis key prefix for shared query embeddings
+QUERY_EMBEDDING_PREFIX = "sentinel:embedding:query:"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    text = _WHITESPACE_RE.sub(" ", (text or "").strip().lower())
+    return text.rstrip("?!. ")
+
+
+def _cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU + TTL cache of query embeddings with an optional Redis tier."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: int = 3600,
+        redis_client=None
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.redis_client = redis_client
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "redis_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = _cache_key(text, model)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return vector
+                del self._entries[key]
+
+        vector = self._redis_get(key)
+        with self._lock:
+            if vector is not None:
+                self._stats["redis_hits"] += 1
+                self._store(key, vector, now)
+            else:
+                self._stats["misses"] += 1
+        return vector
+
+    def put(self, text: str, model: str, vector: List[float]) -> None:
+        if vector is None:
+            return
+        key = _cache_key(text, model)
+        with self._lock:
+            self._store(key, list(vector), time.monotonic())
+        self._redis_set(key, vector)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["redis_hits"]) / lookups, 4) if lookups else 0.0
+        stats["redis_enabled"] = self.redis_client is not None
+        return stats
+
+    def _store(self, key: str, vector: List[float], now: float) -> None:
+        self._entries[key] = (vector, now + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _redis_get(self, key: str) -> Optional[List[float]]:
+        if self.redis_client is None:
+            return None
+        try:
+            raw = self.redis_client.get(f"{QUERY_EMBEDDING_PREFIX}{key}")
+        except RedisError as exc:
+            print(f"Redis lookup failed for query embedding cache: {exc}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def _redis_set(self, key: str, vector: List[float]) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.setex(f"{QUERY_EMBEDDING_PREFIX}{key}", self.ttl_seconds, json.dumps(list(vector)))
+        except RedisError as exc:
+            print(f"Failed to store query embedding in Redis: {exc}")
+
+
+def content_hash(text: str) -> str:
+    """sha256 of the exact chunk text; unlike queries, chunks are not normalised."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Content-addressed chunk embeddings in the embedding_cache table."""
+
+    # Keep IN lists well below SQLite's bound parameter limit
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_many(self, hashes: Iterable[str], model: str) -> Dict[str, List[float]]:
+        """Return {content_hash: embedding} for the hashes already cached for `model`."""
+        hashes = list(dict.fromkeys(hashes))
+        entry = models.EmbeddingCacheEntry
+        found: Dict[str, List[float]] = {}
+        for start in range(0, len(hashes), self.LOOKUP_BATCH_SIZE):
+            rows = self.db.query(entry.content_hash, entry.embedding).filter(
+                entry.model == model,
+                entry.content_hash.in_(hashes[start:start + self.LOOKUP_BATCH_SIZE])
+            ).all()
+            found.update({row[0]: row[1] for row in rows})
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]], model: str) -> None:
+        """Store new {content_hash: embedding} pairs; hashes cached concurrently are skipped."""
+        rows = [
+            {"content_hash": key, "model": model, "embedding": vector}
+            for key, vector in vectors.items()
+            if vector is not None
+        ]
+        if not rows:
+            return
+
+        insert = upsert_insert(self.db.get_bind())
+        table = models.EmbeddingCacheEntry.__table__
+        self.db.execute(
+            insert(table).values(rows).on_conflict_do_nothing(
+                index_elements=["content_hash", "model"]
+            )
+        )
+
+
+def record_job_cache_stats(db: Session, job_id: str, hits: int, misses: int) -> None:
+    """Add one document's chunk cache hits / misses to its job's counters."""
+    job = models.ProcessingJob
+    db.execute(
+        update(job).where(job.id == job_id).values(
+            embedding_cache_hits=func.coalesce(job.embedding_cache_hits, 0) + hits,
+            embedding_cache_misses=func.coalesce(job.embedding_cache_misses, 0) + misses
+        )
+    )
+
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Return the process-wide query embedding cache."""
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                redis_client = None
+                if settings.QUERY_EMBEDDING_CACHE_REDIS:
+                    from redis_pubsub import redis_pubsub
+                    redis_client = redis_pubsub.redis_client
+                _query_cache = QueryEmbeddingCache(
+                    max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                    ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+                    redis_client=redis_client
+                )
+    return _query_cache
@@ -0,0 +1,280 @@
+"""
+Micro-batching gateway in front of the embedding server.
+
+Every VectorStore, processor service and /chat request used to talk to
+settings.EMBEDDING_LLM_URL on its own, one text per HTTP request. The gateway
+is a process-wide singleton: callers enqueue texts, a dispatcher thread
+collects whatever arrives within EMBEDDING_GATEWAY_MAX_WAIT_MS (up to
+EMBEDDING_GATEWAY_MAX_BATCH texts), sends them as one batched request and fans
+the vectors back to the waiting callers. A batch that the engine has not
+answered within EMBEDDING_GATEWAY_TIMEOUT_SECONDS fails every caller in it
+with TimeoutError, so a hung embedding server cannot hold ingestion or /chat
+threads forever.
+
+The engine behind the gateway is pluggable:
+- 'ollama': OllamaEmbeddings against settings.EMBEDDING_LLM_URL (default)
+- 'fake':   deterministic in-process vectors, for load tests without Ollama
+
+Usage:
+    from embedding_gateway import get_embedding_gateway
+
+    gateway = get_embedding_gateway()
+    vector = gateway.embed_query("who owns the white van?")
+    vectors = gateway.embed_documents(["chunk one", "chunk two"])
+
+Load test (no Ollama needed):
+    python embedding_gateway.py --threads 32 --requests 20
+"""
+import hashlib
+import math
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+
+class EmbeddingEngine(ABC):
+    """Backend that embeds a batch of texts in a single call."""
+
+    model_name: str = ""
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Return one vector per input text, in order."""
+        pass
+
+
+class OllamaEmbeddingEngine(EmbeddingEngine):
+    """Embeds through the Ollama server at settings.EMBEDDING_LLM_URL."""
+
+    def __init__(self, model: Optional[str] = None, base_url: Optional[str] = None):
+        from langchain_ollama import OllamaEmbeddings
+
+        self.model_name = model or settings.EMBEDDING_MODEL
+        self.client = OllamaEmbeddings(
+            model=self.model_name,
+            base_url=base_url or settings.EMBEDDING_LLM_URL
+        )
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts)
+
+
+class FakeEmbeddingEngine(EmbeddingEngine):
+    """
+    Deterministic in-process engine for tests and load generation.
+
+    Vectors are derived from a hash of the text and L2-normalised, so equal
+    texts always map to equal vectors. `latency_ms` simulates the fixed cost
+    of one request to the embedding server.
+    """
+
+    def __init__(self, dimension: int = 768, latency_ms: float = 0.0):
+        self.model_name = f"fake-{dimension}"
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            values.extend((byte - 127.5) / 127.5 for byte in digest)
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+
+def create_embedding_engine(engine_type: Optional[str] = None) -> EmbeddingEngine:
+    """Create the embedding engine named by settings.EMBEDDING_ENGINE."""
+    engine_type = (engine_type or settings.EMBEDDING_ENGINE).lower()
+    if engine_type == "ollama":
+        return OllamaEmbeddingEngine()
+    if engine_type == "fake":
+        return FakeEmbeddingEngine(dimension=settings.EMBEDDING_DIMENSION)
+    raise ValueError(f"Unknown embedding engine: {engine_type}. Available: ollama, fake")
+
+
+class EmbeddingGateway:
+    """
+    Collects concurrent embed calls and sends them as batched requests.
+
+    Exposes the LangChain `embed_query` / `embed_documents` interface so it can
+    be used anywhere an OllamaEmbeddings instance was used before.
+    """
+
+    def __init__(
+        self,
+        engine: EmbeddingEngine,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        timeout: Optional[float] = None
+    ):
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size or settings.EMBEDDING_GATEWAY_MAX_BATCH)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_GATEWAY_MAX_WAIT_MS) / 1000.0
+        self.timeout = timeout or settings.EMBEDDING_GATEWAY_TIMEOUT_SECONDS
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        # Engine calls run here so the dispatcher can give up on a hung one;
+        # spare threads keep serving while an abandoned call is still stuck
+        self._engine_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embedding-engine")
+        self._stats_lock = threading.Lock()
+        self._stats = {"texts": 0, "batches": 0, "errors": 0, "timeouts": 0}
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-gateway", daemon=True)
+        self._worker.start()
+
+    @property
+    def model_name(self) -> str:
+        return self.engine.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed many texts; they may be merged with other callers' texts."""
+        if not texts:
+            return []
+        if self._closed:
+            raise RuntimeError("Embedding gateway is closed")
+        futures = []
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        deadline = time.monotonic() + self.timeout
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except FutureTimeoutError:
+            # Texts still queued are skipped by the dispatcher
+            for future in futures:
+                future.cancel()
+            raise TimeoutError(f"Embedding gateway timed out after {self.timeout:.0f}s")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["texts"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+        self._engine_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _collect_batch(self, first) -> List[tuple]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the shutdown marker so the run loop sees it
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            # Callers that timed out cancelled their futures; skip those texts
+            batch = [item for item in self._collect_batch(first) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self._engine_pool.submit(self.engine.embed, texts).result(timeout=self.timeout)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"Embedding engine returned {len(vectors)} vectors for {len(texts)} texts")
+            except Exception as exc:
+                if isinstance(exc, FutureTimeoutError):
+                    # The engine call keeps its thread until it returns; its result is dropped
+                    exc = TimeoutError(f"Embedding engine did not answer {len(texts)} text(s) within {self.timeout:.0f}s")
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+                    if isinstance(exc, TimeoutError):
+                        self._stats["timeouts"] += 1
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+
+            with self._stats_lock:
+                self._stats["texts"] += len(texts)
+                self._stats["batches"] += 1
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+_gateway: Optional[EmbeddingGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_embedding_gateway() -> EmbeddingGateway:
+    """Return the process-wide gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = EmbeddingGateway(create_embedding_engine())
+    return _gateway
+
+
+def set_embedding_gateway(gateway: Optional[EmbeddingGateway]) -> None:
+    """Replace the process-wide gateway (e.g. with a fake engine for load tests)."""
+    global _gateway
+    with _gateway_lock:
+        previous, _gateway = _gateway, gateway
+    if previous is not None and previous is not gateway:
+        previous.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Load-test the embedding gateway with the fake engine")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="embed_query calls per thread")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated server latency per request")
+    args = parser.parse_args()
+
+    engine = FakeEmbeddingEngine(latency_ms=args.latency_ms)
+    gateway = EmbeddingGateway(engine)
+
+    def worker(thread_idx: int):
+        for i in range(args.requests):
+            gateway.embed_query(f"thread {thread_idx} question {i}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    total = args.threads * args.requests
+    print(f"{total} embed calls in {elapsed:.2f}s ({total / elapsed:.1f} calls/sec)")
+    print(f"Engine requests: {engine.calls} (vs {total} unbatched)")
+    print(f"Gateway stats: {gateway.get_stats()}")
+    gateway.close()
@@ -0,0 +1,279 @@
+"""
+Tenant-fair, cost-aware scheduling for the upload queues.
+
+Uploads used to go straight into the shared document/audio/video lists in
+FIFO order, so one manager's 10-file OCR-heavy batch held every other
+analyst's one-page TXT upload behind it. With QUEUE_TENANT_FAIR each message
+of a queue in QUEUE_TENANT_FAIR_QUEUES is pushed to a per-tenant sub-queue,
+`<queue>:tenant:<tenant>`, and workers choose the next message by deficit
+round-robin (DRR) between tenants:
+
+- The tenant comes from the job_id prefix (`manager/analyst/uuid`): the
+  manager with QUEUE_TENANT_KEY=manager, `manager/analyst` with 'analyst'.
+- On its turn a tenant earns QUEUE_TENANT_QUANTUM x weight credit
+  (QUEUE_TENANT_WEIGHTS) and is served while the cost of its next message
+  fits its credit. Costs are estimated at upload from file type and size
+  (a scanned PDF costs far more than a TXT), so a tenant of short files gets
+  several messages per turn and a large batch cannot starve them.
+- Tenants whose sub-queue is empty are dropped from `<queue>:tenants` (and
+  lose their credit); push_fair adds them back with their next message.
+  Rounds in which nobody can afford their next message are skipped in one
+  step, so a fetch costs a few round-trips whatever the quantum.
+- Per-tenant wait (enqueue to first delivery) is recorded in
+  `<queue>:tenant-waits` and reported by get_stats with each tenant's backlog.
+
+TenantFairQueue extends ReliableQueue: a message is LMOVEd from its tenant
+sub-queue into the worker's processing list, and acks, retries, redelivery
+and dead letters are unchanged. Retried and re-delivered messages go back
+to the shared list, which is served before any tenant.
+
+DRR credit is kept per worker, so fairness holds per worker and therefore
+across the fleet without any coordination beyond the Redis lists.
+
+Usage:
+    from fair_queue import open_reliable_queue
+
+    queue = open_reliable_queue(redis_client, settings.REDIS_QUEUE_DOCUMENT)
+    raw = queue.fetch(timeout=1)
+
+    python reliable_queue.py status document_queue   # includes per-tenant waits
+"""
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from reliable_queue import ReliableQueue
+
+DEFAULT_TENANT = "default"
+
+# Cost units: fixed per-file work plus per-MB work by extension (OCR and
+# transcription dominate); one unit is roughly a few seconds of worker time
+_BASE_COST = {
+    "txt": 0.5, "docx": 1.0, "pdf": 3.0,
+    "mp3": 4.0, "wav": 4.0, "m4a": 4.0,
+    "mp4": 8.0, "avi": 8.0, "mov": 8.0,
+}
+_COST_PER_MB = {
+    "txt": 0.2, "docx": 0.5, "pdf": 2.0,
+    "mp3": 1.5, "wav": 1.5, "m4a": 1.5,
+    "mp4": 3.0, "avi": 3.0, "mov": 3.0,
+}
+
+
+def tenant_of(job_id: Optional[str]) -> str:
+    """Scheduling tenant for a `manager/analyst/uuid` job_id."""
+    parts = (job_id or "").split("/")
+    if len(parts) < 3:
+        return DEFAULT_TENANT
+    if settings.QUEUE_TENANT_KEY == "manager":
+        return parts[0]
+    return f"{parts[0]}/{parts[1]}"
+
+
+def estimate_cost(filename: Optional[str], size_bytes: Optional[int] = None) -> float:
+    """Relative processing cost of a file, from its extension and size."""
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    size_mb = (size_bytes or 0) / (1024 * 1024)
+    return round(_BASE_COST.get(ext, 1.0) + _COST_PER_MB.get(ext, 1.0) * size_mb, 3)
+
+
+def message_cost(raw) -> float:
+    try:
+        message = json.loads(raw)
+    except (TypeError, ValueError):
+        return 1.0
+    if "cost" in message:
+        return float(message["cost"])
+    return estimate_cost(message.get("filename"), message.get("size_bytes"))
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """"alice=2,bob/carol=0.5" -> {"alice": 2.0, "bob/carol": 0.5}"""
+    weights = {}
+    for item in (spec or "").split(","):
+        tenant, _, weight = item.partition("=")
+        if tenant.strip() and weight.strip():
+            weights[tenant.strip()] = max(0.01, float(weight))
+    return weights
+
+
+def is_fair_queue(queue_name: str) -> bool:
+    return (
+        settings.QUEUE_RELIABLE
+        and settings.QUEUE_TENANT_FAIR
+        and queue_name in settings.tenant_fair_queues_list
+    )
+
+
+def push_fair(redis_client, queue_name: str, message_json: str, tenant: str) -> int:
+    """Append a message to the tenant's sub-queue and register the tenant."""
+    pipe = redis_client.pipeline()
+    pipe.lpush(f"{queue_name}:tenant:{tenant}", message_json)
+    pipe.sadd(f"{queue_name}:tenants", tenant)
+    return pipe.execute()[0]
+
+
+class TenantFairQueue(ReliableQueue):
+    """ReliableQueue that fetches across per-tenant sub-queues by deficit round-robin."""
+
+    def __init__(self, redis_client, queue_name: str, **kwargs):
+        super().__init__(redis_client, queue_name, **kwargs)
+        self.tenants_key = f"{queue_name}:tenants"
+        self.waits_key = f"{queue_name}:tenant-waits"
+        self.quantum = max(0.1, settings.QUEUE_TENANT_QUANTUM)
+        self.weights = parse_weights(settings.QUEUE_TENANT_WEIGHTS)
+        self._deficit: Dict[str, float] = {}
+        self._current: Optional[str] = None
+        self._credited = False
+
+    def tenant_queue(self, tenant: str) -> str:
+        return f"{self.queue_name}:tenant:{tenant}"
+
+    def fetch(self, timeout: float = 1) -> Optional[str]:
+        # Retries, redeliveries and untenanted messages first, then tenants by DRR;
+        # with nothing to do, block on the shared list for up to `timeout`
+        raw = self.redis.lmove(self.queue_name, self.processing_list, src="RIGHT", dest="LEFT")
+        if raw is None:
+            raw = self._next_fair()
+        if raw is None:
+            raw = self.redis.blmove(self.queue_name, self.processing_list, timeout, src="RIGHT", dest="LEFT")
+        if raw is None:
+            return None
+        return self._claim(raw)
+
+    def _tenants(self) -> List[str]:
+        return sorted(
+            tenant.decode("utf-8") if isinstance(tenant, bytes) else tenant
+            for tenant in self.redis.smembers(self.tenants_key)
+        )
+
+    def _prune(self, tenant: str) -> None:
+        """Drop an idle tenant from the tenants set (push_fair re-adds it)."""
+        self._deficit.pop(tenant, None)
+        self.redis.srem(self.tenants_key, tenant)
+        # push_fair's LPUSH + SADD is one transaction: a push that landed
+        # before our SREM is visible here, one after it re-adds the tenant
+        if self.redis.llen(self.tenant_queue(tenant)):
+            self.redis.sadd(self.tenants_key, tenant)
+
+    def _backlogged_heads(self) -> List[tuple]:
+        """(tenant, head message) for every tenant with work, in DRR order from the current tenant."""
+        tenants = self._tenants()
+        if not tenants:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for tenant in tenants:
+            pipe.lindex(self.tenant_queue(tenant), -1)
+        heads = pipe.execute()
+
+        backlogged = []
+        for tenant, head in zip(tenants, heads):
+            if head is None:
+                # An idle tenant does not bank credit (classic DRR)
+                self._prune(tenant)
+            else:
+                backlogged.append((tenant, head))
+        if not backlogged:
+            return []
+        names = [tenant for tenant, _ in backlogged]
+        if self._current not in names:
+            # The turn passes to the next backlogged tenant after the one that went idle
+            following = [tenant for tenant in names if self._current is None or tenant > self._current]
+            self._current = (following or names)[0]
+            self._credited = False
+        start = names.index(self._current)
+        return backlogged[start:] + backlogged[:start]
+
+    def _next_fair(self) -> Optional[str]:
+        """
+        Deficit round-robin in one step: rather than visiting tenants round
+        after round until one has credit for its head message, work out how
+        many rounds each tenant needs, pick the first to get there and credit
+        every tenant with the rounds that elapsed.
+        """
+        for _ in range(3):
+            order = self._backlogged_heads()
+            if not order:
+                return None
+
+            # Round (0 = the one in progress) in which each tenant can send its head
+            rounds = []
+            for position, (tenant, head) in enumerate(order):
+                credit = self.quantum * self.weights.get(tenant, 1.0)
+                shortfall = message_cost(head) - self._deficit.get(tenant, 0.0)
+                if position == 0 and self._credited:
+                    # Already credited this turn: served now or after a full round
+                    needed = 0 if shortfall <= 0 else math.ceil(shortfall / credit)
+                else:
+                    # Credited on its next turn, whatever its deficit
+                    needed = max(1, math.ceil(shortfall / credit)) - 1
+                rounds.append((needed, position))
+            elapsed, winner = min(rounds)
+
+            for position, (tenant, _) in enumerate(order):
+                credit = self.quantum * self.weights.get(tenant, 1.0)
+                if position == 0 and self._credited:
+                    turns = elapsed
+                else:
+                    turns = elapsed + 1 if position <= winner else elapsed
+                self._deficit[tenant] = self._deficit.get(tenant, 0.0) + turns * credit
+
+            tenant = order[winner][0]
+            self._current = tenant
+            self._credited = True
+            raw = self.redis.lmove(self.tenant_queue(tenant), self.processing_list, src="RIGHT", dest="LEFT")
+            if raw is None:
+                # Another worker emptied the sub-queue first; look again
+                continue
+            self._deficit[tenant] -= message_cost(raw)
+            self._record_wait(tenant, raw)
+            return raw
+        return None
+
+    def _record_wait(self, tenant: str, raw) -> None:
+        try:
+            enqueued_at = float(json.loads(raw).get("enqueued_at"))
+        except (TypeError, ValueError):
+            return
+        wait = max(0.0, time.time() - enqueued_at)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.waits_key, f"{tenant}:count", 1)
+        pipe.hincrbyfloat(self.waits_key, f"{tenant}:seconds", wait)
+        pipe.hset(self.waits_key, f"{tenant}:last", round(wait, 3))
+        pipe.execute()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        waits = self.redis.hgetall(self.waits_key)
+        now = time.time()
+        tenants = {}
+        for tenant in self._tenants():
+            sub_queue = self.tenant_queue(tenant)
+            head = self.redis.lindex(sub_queue, -1)
+            try:
+                oldest = round(now - float(json.loads(head)["enqueued_at"]), 3) if head else 0.0
+            except (KeyError, TypeError, ValueError):
+                oldest = None
+            dispatched = int(waits.get(f"{tenant}:count", 0))
+            total_wait = float(waits.get(f"{tenant}:seconds", 0.0))
+            tenants[tenant] = {
+                "pending": self.redis.llen(sub_queue),
+                "oldest_pending_seconds": oldest,
+                "weight": self.weights.get(tenant, 1.0),
+                "dispatched": dispatched,
+                "avg_wait_seconds": round(total_wait / dispatched, 3) if dispatched else 0.0,
+                "last_wait_seconds": float(waits.get(f"{tenant}:last", 0.0)),
+            }
+        stats["pending"] += sum(tenant["pending"] for tenant in tenants.values())
+        stats["tenants"] = tenants
+        return stats
+
+
+def open_reliable_queue(redis_client, queue_name: str) -> ReliableQueue:
+    """TenantFairQueue for the fair upload queues, ReliableQueue otherwise."""
+    if is_fair_queue(queue_name):
+        return TenantFairQueue(redis_client, queue_name)
+    return ReliableQueue(redis_client, queue_name)
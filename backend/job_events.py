@@ -0,0 +1,188 @@
+"""
+Fan-out of job progress events to streaming API clients.
+
+Workers publish per-file stage events (extracted, translated, summarized,
+embedded, graphed, failed, plus a job-level completed) to the Redis channel
+`sentinel:job-events:<job_id>` with redis_pubsub.publish_job_event. The
+results and dashboard pages used to poll GET /jobs/{id}/status instead, and
+every poll cost a token check, a user lookup and a job lookup.
+
+Each API process holds exactly one Redis subscription (a pattern subscription
+on all job channels) in a background thread. GET /jobs/{id}/events registers
+an asyncio.Queue for its job and the thread hands every event to the queues
+of that job, so any number of open streams cost one Redis connection and no
+database queries after the initial access check.
+
+Usage:
+    from job_events import get_job_event_broker
+
+    broker = get_job_event_broker()
+    queue = broker.subscribe(job_id)     # from the event loop
+    try:
+        event = await queue.get()
+    finally:
+        broker.unsubscribe(job_id, queue)
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+
+from redis_pubsub import JOB_EVENTS_PREFIX
+
+# Job-level stages after which no more events are published for the job
+# ("completed" may carry failed_files; "job_failed" means no file succeeded)
+TERMINAL_STAGES = ("completed", "job_failed")
+
+
+class JobEventBroker:
+    """One Redis pattern subscription per process, fanned out to asyncio queues."""
+
+    def __init__(self, redis_client, queue_size: int = 256):
+        self.redis_client = redis_client
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Set while the pattern subscription is confirmed by Redis
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"events": 0, "delivered": 0, "dropped": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="job-events", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """
+        Wait until the Redis subscription is live. Events published before
+        that are lost, so read job state only after this returns True.
+        """
+        self.start()
+        if self._ready.is_set():
+            return True
+        return await asyncio.to_thread(self._ready.wait, timeout)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Queue receiving the job's events; call from the event loop that will read it."""
+        self.start()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if not subscribers:
+                return
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["jobs"] = len(self._subscribers)
+            stats["subscribers"] = sum(len(entries) for entries in self._subscribers.values())
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["ready"] = self._ready.is_set()
+        return stats
+
+    def _run(self) -> None:
+        pubsub = None
+        while not self._stop.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.redis_client.pubsub()
+                    pubsub.psubscribe(f"{JOB_EVENTS_PREFIX}*")
+                message = pubsub.get_message(timeout=1.0)
+            except RedisError as exc:
+                print(f"⚠️  Job event subscription failed: {exc}; reconnecting")
+                self._ready.clear()
+                self._close(pubsub)
+                pubsub = None
+                time.sleep(1)
+                continue
+            if not message:
+                continue
+            if message.get("type") == "psubscribe":
+                self._ready.set()
+                print(f"✅ Subscribed to job events ({JOB_EVENTS_PREFIX}*)")
+            elif message.get("type") == "pmessage":
+                self._dispatch(message["data"])
+        self._ready.clear()
+        self._close(pubsub)
+
+    @staticmethod
+    def _close(pubsub) -> None:
+        if pubsub is None:
+            return
+        try:
+            pubsub.close()
+        except RedisError:
+            pass
+
+    def _dispatch(self, raw: str) -> None:
+        try:
+            event = json.loads(raw)
+        except (TypeError, json.JSONDecodeError):
+            return
+        job_id = event.get("job_id")
+        with self._lock:
+            self._stats["events"] += 1
+            subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = list(
+                self._subscribers.get(job_id, ())
+            )
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # The subscriber's loop is closed; it will never unsubscribe itself
+                self.unsubscribe(job_id, queue)
+
+    def _offer(self, queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        """Runs on the subscriber's loop; a slow reader loses its oldest events."""
+        if queue.full():
+            queue.get_nowait()
+            with self._lock:
+                self._stats["dropped"] += 1
+        queue.put_nowait(event)
+        with self._lock:
+            self._stats["delivered"] += 1
+
+
+_broker: Optional[JobEventBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_job_event_broker() -> JobEventBroker:
+    """Return the process-wide broker, creating it on first use."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                from redis_pubsub import redis_pubsub
+                _broker = JobEventBroker(redis_pubsub.redis_client)
+    return _broker
+
+
+def stop_job_event_broker() -> None:
+    global _broker
+    with _broker_lock:
+        broker, _broker = _broker, None
+    if broker is not None:
+        broker.stop()
@@ -0,0 +1,183 @@
+"""
+Atomic per-job progress counters and the job completion transition.
+
+Workers used to bump `job.processed_files += 1` through the ORM (a
+read-modify-write that loses updates when two workers finish at once) and
+detect completion by re-counting the job's Document rows, or with a DISTINCT
+join over GraphEntity after every graph document. Now each stage is one
+`UPDATE processing_jobs SET <counter> = <counter> + 1 ... RETURNING` that
+hands back the new counts, so completion checks are O(1), and
+`mark_job_completed` is a conditional UPDATE that exactly one caller wins.
+
+Counters:
+- processed_files: files extracted, summarised and embedded
+- graphed_files: documents whose knowledge graph was built; guarded by
+  documents.graphed_at so a redelivered graph message is not counted twice
+- failed_files: files whose processing (or graph) failed; they count towards
+  the end of the job, so a job with failures still reaches a final status
+
+`settle_job` turns the counters into that final status: COMPLETED once every
+file is done or failed, FAILED when none succeeded.
+
+All functions leave committing to the caller.
+
+Usage:
+    from job_progress import record_file_graphed, settle_job
+
+    progress = record_file_graphed(db, job_id, document_id)
+    stage = settle_job(db, job_id, progress, "graphed_files")
+    db.commit()
+    if stage:
+        ...  # first (and only) caller to finish the job: publish `stage`
+"""
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import case, exists, func, literal, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+Progress = Dict[str, int]
+
+
+def _returning_progress(db: Session, stmt) -> Optional[Progress]:
+    job = models.ProcessingJob
+    row = db.execute(
+        stmt.returning(job.processed_files, job.graphed_files, job.failed_files, job.total_files)
+    ).first()
+    if row is None:
+        return None
+    return {
+        "processed_files": row[0] or 0,
+        "graphed_files": row[1] or 0,
+        "failed_files": row[2] or 0,
+        "total_files": row[3] or 0,
+    }
+
+
+def record_file_processed(db: Session, job_id: str) -> Optional[Progress]:
+    """
+    Count one more processed file and move a QUEUED job to PROCESSING.
+
+    Returns the job's counters after the increment, or None if it does not exist.
+    """
+    job = models.ProcessingJob
+    stmt = update(job).where(job.id == job_id).values(
+        processed_files=func.coalesce(job.processed_files, 0) + 1,
+        status=case(
+            (job.status == models.JobStatus.QUEUED, literal(models.JobStatus.PROCESSING, job.status.type)),
+            else_=job.status
+        ),
+        started_at=func.coalesce(job.started_at, datetime.now(timezone.utc))
+    )
+    return _returning_progress(db, stmt)
+
+
+def record_file_graphed(db: Session, job_id: str, document_id: int) -> Optional[Progress]:
+    """
+    Count a document's graph as built, once per document.
+
+    Returns the job's counters after the increment, or None if the document
+    was already counted (or the job does not exist).
+    """
+    document = models.Document
+    claimed = db.execute(
+        update(document).where(
+            document.id == document_id,
+            document.graphed_at.is_(None)
+        ).values(graphed_at=datetime.now(timezone.utc))
+    ).rowcount
+    if not claimed:
+        return None
+
+    job = models.ProcessingJob
+    stmt = update(job).where(job.id == job_id).values(
+        graphed_files=func.coalesce(job.graphed_files, 0) + 1
+    )
+    return _returning_progress(db, stmt)
+
+
+def record_file_failed(db: Session, job_id: str) -> Optional[Progress]:
+    """Count one more failed file; returns the job's counters after the increment."""
+    job = models.ProcessingJob
+    stmt = update(job).where(job.id == job_id).values(
+        failed_files=func.coalesce(job.failed_files, 0) + 1
+    )
+    return _returning_progress(db, stmt)
+
+
+def mark_job_completed(db: Session, job_id: str) -> bool:
+    """
+    Move the job to COMPLETED. Idempotent: returns True only for the call
+    that made the transition, so completion side effects run once.
+    """
+    job = models.ProcessingJob
+    result = db.execute(
+        update(job).where(
+            job.id == job_id,
+            job.status.notin_([models.JobStatus.COMPLETED, models.JobStatus.FAILED])
+        ).values(
+            status=models.JobStatus.COMPLETED,
+            completed_at=datetime.now(timezone.utc)
+        )
+    )
+    return result.rowcount == 1
+
+
+def mark_job_failed(db: Session, job_id: str, error_message: str) -> bool:
+    """Move the job to FAILED; like mark_job_completed, True only for the winning call."""
+    job = models.ProcessingJob
+    result = db.execute(
+        update(job).where(
+            job.id == job_id,
+            job.status.notin_([models.JobStatus.COMPLETED, models.JobStatus.FAILED])
+        ).values(
+            status=models.JobStatus.FAILED,
+            error_message=error_message,
+            completed_at=datetime.now(timezone.utc)
+        )
+    )
+    return result.rowcount == 1
+
+
+def settle_job(db: Session, job_id: str, progress: Optional[Progress], done: str) -> Optional[str]:
+    """
+    Finish the job once every file is either `done` (the counter of the
+    caller's last stage: "processed_files" or "graphed_files") or failed.
+
+    Returns the job-level event stage to publish, "completed" or
+    "job_failed", for the one caller that made the transition; else None.
+    """
+    if not progress:
+        return None
+    if progress[done] + progress["failed_files"] < progress["total_files"]:
+        return None
+    if progress[done] == 0:
+        message = f"All {progress['total_files']} file(s) failed"
+        return "job_failed" if mark_job_failed(db, job_id, message) else None
+    return "completed" if mark_job_completed(db, job_id) else None
+
+
+def backfill_graph_progress(db: Session) -> int:
+    """
+    Stamp graphed_at on documents graphed before it existed and initialise
+    graphed_files on their jobs. Returns the number of jobs initialised.
+    """
+    document = models.Document
+    db.execute(
+        update(document).where(
+            document.graphed_at.is_(None),
+            exists().where(models.GraphEntity.document_id == document.id)
+        ).values(graphed_at=document.updated_at)
+    )
+
+    job = models.ProcessingJob
+    graphed = (
+        select(func.count(document.id))
+        .where(document.job_id == job.id, document.graphed_at.isnot(None))
+        .scalar_subquery()
+    )
+    return db.execute(
+        update(job).where(job.graphed_files.is_(None)).values(graphed_files=graphed)
+    ).rowcount
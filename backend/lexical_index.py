@@ -0,0 +1,172 @@
+"""
+Lexical (full-text + trigram) search over document_chunks.chunk_text.
+
+Investigators search for names, plate numbers and IDs that embeddings handle
+poorly. Instead of a `chunk_text ILIKE '%query%'` table scan, chunks get:
+
+- a generated `chunk_tsv` tsvector column with a GIN index, ranked with
+  ts_rank_cd (cover density) against websearch_to_tsquery, and
+- a pg_trgm GIN index on chunk_text, used for partial identifiers that do
+  not match a whole token (e.g. part of a registration number).
+
+The 'simple' text search configuration is used by default so identifiers and
+names are not stemmed. The generated column is fixed at creation time; after
+changing LEXICAL_TS_CONFIG drop `chunk_tsv` and run the migration again.
+
+Adding a STORED generated column rewrites document_chunks under an ACCESS
+EXCLUSIVE lock, so it is an explicit migration step run during a maintenance
+window, not part of API startup. `ensure_lexical_index` (from init_db) only
+checks for the column; until it exists, searches use vector retrieval and the
+ILIKE keyword fallback, as on SQLite, where none of this applies.
+
+Usage:
+    python lexical_index.py status
+    python lexical_index.py migrate
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, literal, literal_column, text
+from sqlalchemy.engine import Engine
+
+from config import settings
+import models
+
+TABLE_NAME = "document_chunks"
+TSV_COLUMN_NAME = "chunk_tsv"
+TSV_INDEX_NAME = "ix_document_chunks_chunk_tsv"
+TRGM_INDEX_NAME = "ix_document_chunks_chunk_text_trgm"
+
+# Not mapped on the model: TSVECTOR cannot be rendered for SQLite's create_all
+TSV_COLUMN = literal_column(f"{TABLE_NAME}.{TSV_COLUMN_NAME}")
+
+
+# Whether chunk_tsv exists, read once per process (the migration needs a restart to take effect)
+_tsv_column_present: Optional[bool] = None
+
+
+def _tsv_column_exists(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = :table AND column_name = :column"
+    ), {"table": TABLE_NAME, "column": TSV_COLUMN_NAME}).first() is not None
+
+
+def is_lexical_supported(bind) -> bool:
+    global _tsv_column_present
+    if bind.dialect.name != "postgresql":
+        return False
+    if _tsv_column_present is None:
+        with bind.connect() as conn:
+            _tsv_column_present = _tsv_column_exists(conn)
+    return _tsv_column_present
+
+
+def get_lexical_status(engine: Engine) -> Dict[str, bool]:
+    """Which of the column and indexes exist (PostgreSQL only)."""
+    with engine.connect() as conn:
+        column = _tsv_column_exists(conn)
+        indexes = {
+            row[0] for row in conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+            ), {"table": TABLE_NAME})
+        }
+    return {
+        TSV_COLUMN_NAME: column,
+        TSV_INDEX_NAME: TSV_INDEX_NAME in indexes,
+        TRGM_INDEX_NAME: TRGM_INDEX_NAME in indexes,
+    }
+
+
+def ensure_lexical_index(engine: Engine) -> None:
+    """Startup check: warn if the lexical column or indexes have not been migrated."""
+    global _tsv_column_present
+    if engine.dialect.name != "postgresql":
+        return
+
+    status = get_lexical_status(engine)
+    _tsv_column_present = status[TSV_COLUMN_NAME]
+    missing = [name for name, present in status.items() if not present]
+    if missing:
+        print(f"⚠️  Lexical search not ready ({', '.join(missing)} missing); "
+              f"run 'python lexical_index.py migrate' during a maintenance window")
+        return
+    print(f"✅ Lexical indexes ready on {TABLE_NAME}")
+
+
+def migrate_lexical_index(engine: Engine) -> None:
+    """
+    Add the generated tsvector column and the GIN indexes if missing.
+
+    The ALTER TABLE rewrites the table and blocks reads and writes on it
+    until it finishes; the indexes are then built CONCURRENTLY. Restart the
+    API and workers afterwards so they pick up the column.
+    """
+    if engine.dialect.name != "postgresql":
+        print("Lexical indexes are PostgreSQL-only; nothing to do")
+        return
+
+    ts_config = settings.LEXICAL_TS_CONFIG
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS {TSV_COLUMN_NAME} tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{ts_config}', coalesce(chunk_text, ''))) STORED"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TSV_INDEX_NAME} "
+            f"ON {TABLE_NAME} USING gin ({TSV_COLUMN_NAME})"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX_NAME} "
+            f"ON {TABLE_NAME} USING gin (chunk_text gin_trgm_ops)"
+        ))
+    print(f"✅ Lexical indexes ready on {TABLE_NAME} ({ts_config} tsvector + trigram)")
+
+
+def lexical_search(query_obj, query: str, k: int) -> List[tuple]:
+    """
+    Rank the chunks selected by `query_obj` against `query`.
+
+    Full-text matches come first (ts_rank_cd); if there are fewer than k, the
+    remainder is filled with trigram word-similarity matches. Returns
+    (chunk, score) pairs, best first.
+    """
+    tsquery = func.websearch_to_tsquery(settings.LEXICAL_TS_CONFIG, query)
+    rank = func.ts_rank_cd(TSV_COLUMN, tsquery)
+    rows = query_obj.filter(TSV_COLUMN.op("@@")(tsquery)).add_columns(
+        rank.label("rank")
+    ).order_by(rank.desc()).limit(k).all()
+    results = [(chunk, float(score)) for chunk, score in rows]
+
+    if len(results) < k:
+        # `query <% chunk_text` is word_similarity above pg_trgm.word_similarity_threshold,
+        # served by the trigram GIN index
+        similarity = func.word_similarity(query, models.DocumentChunk.chunk_text)
+        seen_ids = {chunk.id for chunk, _ in results}
+        extra_query = query_obj.filter(
+            literal(query).op("<%")(models.DocumentChunk.chunk_text)
+        )
+        if seen_ids:
+            extra_query = extra_query.filter(models.DocumentChunk.id.notin_(seen_ids))
+        extra = extra_query.add_columns(similarity.label("similarity")).order_by(
+            similarity.desc()
+        ).limit(k - len(results)).all()
+        results.extend((chunk, float(score)) for chunk, score in extra)
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Manage the document_chunks lexical search column and indexes")
+    parser.add_argument("command", choices=["status", "migrate"])
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print(get_lexical_status(engine) if engine.dialect.name == "postgresql" else "PostgreSQL only")
+    else:
+        migrate_lexical_index(engine)
@@ -0,0 +1,218 @@
+"""
+Process-wide registry of LLM clients.
+
+/chat used to build a new ollama Client (and a new GoogleDocAgent, which calls
+genai.configure) on every request, and the video summary built a new Client
+per video, so each call paid for object construction and a fresh TCP/TLS
+connection. The registry keeps one client per Ollama host (sync and async,
+each on a keep-alive httpx connection pool) and one GoogleDocAgent per Gemini
+model, and caps how many requests run against each backend at once.
+
+Limits are per backend key ("ollama:<host>" or "gemini"): OLLAMA_MAX_CONCURRENCY
+and GEMINI_MAX_CONCURRENCY. Callers that exceed them wait instead of piling
+more parallel generations onto a GPU that is already busy.
+
+FastAPI creates the registry on startup and closes the pools on shutdown;
+processor services simply use it on first call.
+
+Usage:
+    from llm_clients import get_llm_clients
+
+    clients = get_llm_clients()
+    with clients.slot(clients.ollama_key(settings.SUMMARY_LLM_URL)):
+        response = clients.ollama(settings.SUMMARY_LLM_URL).chat(model=..., messages=...)
+
+    async with clients.async_slot(clients.ollama_key(settings.CHAT_LLM_URL)):
+        response = await clients.async_ollama(settings.CHAT_LLM_URL).chat(model=..., messages=...)
+
+    agent = clients.google_agent(settings.GOOGLE_CHAT_MODEL)
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from config import settings
+
+GEMINI_KEY = "gemini"
+
+
+class LLMClientRegistry:
+    """Shared LLM clients plus per-backend concurrency limits."""
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None
+    ):
+        self.max_connections = max_connections or settings.LLM_HTTP_MAX_CONNECTIONS
+        self.max_keepalive = max_keepalive or settings.LLM_HTTP_MAX_KEEPALIVE
+        self.keepalive_expiry = keepalive_expiry or settings.LLM_HTTP_KEEPALIVE_EXPIRY
+        self.timeout = timeout or settings.LLM_REQUEST_TIMEOUT
+        self._lock = threading.Lock()
+        self._ollama: Dict[str, Any] = {}
+        self._async_ollama: Dict[str, Any] = {}
+        self._agents: Dict[str, Any] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def ollama_key(host: str) -> str:
+        return f"ollama:{host}"
+
+    def _limit_for(self, key: str) -> int:
+        if key == GEMINI_KEY:
+            return max(1, settings.GEMINI_MAX_CONCURRENCY)
+        return max(1, settings.OLLAMA_MAX_CONCURRENCY)
+
+    def _http_options(self) -> Dict[str, Any]:
+        import httpx
+
+        return {
+            "timeout": self.timeout,
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+        }
+
+    def ollama(self, host: str):
+        """Blocking ollama Client for `host`, shared by every thread in the process."""
+        client = self._ollama.get(host)
+        if client is None:
+            with self._lock:
+                client = self._ollama.get(host)
+                if client is None:
+                    from ollama import Client
+                    client = Client(host=host, **self._http_options())
+                    self._ollama[host] = client
+        return client
+
+    def async_ollama(self, host: str):
+        """ollama AsyncClient for `host`; use it from the FastAPI event loop only."""
+        client = self._async_ollama.get(host)
+        if client is None:
+            with self._lock:
+                client = self._async_ollama.get(host)
+                if client is None:
+                    from ollama import AsyncClient
+                    client = AsyncClient(host=host, **self._http_options())
+                    self._async_ollama[host] = client
+        return client
+
+    def google_agent(self, model: Optional[str] = None):
+        """GoogleDocAgent for `model`; genai.configure runs once, not per request."""
+        model = model or settings.GOOGLE_CHAT_MODEL
+        agent = self._agents.get(model)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(model)
+                if agent is None:
+                    from agents.google_agent import GoogleDocAgent
+                    agent = GoogleDocAgent(api_key=settings.GEMINI_API_KEY, model=model)
+                    self._agents[model] = agent
+        return agent
+
+    def _count(self, key: str, field: str):
+        with self._lock:
+            stats = self._stats.setdefault(key, {"calls": 0, "active": 0, "waited": 0})
+            stats[field] += 1
+
+    def _release(self, key: str):
+        with self._lock:
+            self._stats[key]["active"] -= 1
+
+    @contextmanager
+    def slot(self, key: str) -> Iterator[None]:
+        """Hold one of the backend's concurrency slots (blocking callers)."""
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            with self._lock:
+                semaphore = self._semaphores.setdefault(key, threading.BoundedSemaphore(self._limit_for(key)))
+        if not semaphore.acquire(blocking=False):
+            self._count(key, "waited")
+            semaphore.acquire()
+        self._count(key, "calls")
+        self._count(key, "active")
+        try:
+            yield
+        finally:
+            self._release(key)
+            semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self, key: str) -> AsyncIterator[None]:
+        """Hold one of the backend's concurrency slots without blocking the event loop."""
+        semaphore = self._async_semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._async_semaphores.setdefault(key, asyncio.Semaphore(self._limit_for(key)))
+        if semaphore.locked():
+            self._count(key, "waited")
+        async with semaphore:
+            self._count(key, "calls")
+            self._count(key, "active")
+            try:
+                yield
+            finally:
+                self._release(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            backends = {key: dict(stats) for key, stats in self._stats.items()}
+        for key, stats in backends.items():
+            stats["limit"] = self._limit_for(key)
+        return {
+            "ollama_hosts": sorted(set(self._ollama) | set(self._async_ollama)),
+            "gemini_models": sorted(self._agents),
+            "backends": backends,
+        }
+
+    def close(self):
+        """Close the blocking connection pools."""
+        with self._lock:
+            clients, self._ollama = list(self._ollama.values()), {}
+            self._agents = {}
+        for client in clients:
+            try:
+                client._client.close()
+            except Exception as exc:
+                print(f"⚠️  Could not close Ollama client: {exc}")
+
+    async def aclose(self):
+        """Close every connection pool; called from the FastAPI shutdown hook."""
+        with self._lock:
+            clients, self._async_ollama = list(self._async_ollama.values()), {}
+            self._async_semaphores = {}
+        for client in clients:
+            try:
+                await client._client.aclose()
+            except Exception as exc:
+                print(f"⚠️  Could not close async Ollama client: {exc}")
+        self.close()
+
+
+_registry: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_clients() -> LLMClientRegistry:
+    """Return the process-wide registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry()
+    return _registry
+
+
+async def close_llm_clients() -> None:
+    """Close and forget the process-wide registry."""
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        await registry.aclose()
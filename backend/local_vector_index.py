@@ -0,0 +1,463 @@
+"""
+Embedded vector index for SQLite / edge deployments.
+
+SQLite has no pgvector operators, so with USE_SQLITE_FOR_DEV similarity
+search used to fall back to ILIKE. This module keeps chunk embeddings next to
+the database in a directory of NumPy segments:
+
+- each segment is a float32 (or float16) matrix of L2-normalised vectors plus
+  parallel arrays of chunk ids and document ids, opened with mmap so only the
+  pages touched by a scan are read into memory;
+- writes append a new segment and atomically replace `manifest.json`;
+  deletions are tombstones in the manifest, each covering only the segments
+  that existed when it was written (SQLite reuses rowids, so a re-indexed
+  chunk can come back with the id of a deleted one in a newer segment);
+- `compact` merges all segments into one and drops tombstoned rows.
+
+Search is a vectorised dot product per segment (cosine similarity, since rows
+are normalised), masked by an optional set of allowed document ids, followed by
+an argpartition top-k. VectorStore derives the allowed document ids from the
+same RBAC / job / document filters it applies in SQL.
+
+Usage:
+    from local_vector_index import get_local_vector_index
+
+    index = get_local_vector_index()
+    index.add(chunk_ids, document_ids, vectors)
+    hits = index.search(query_vector, k=5, document_ids={1, 2})  # [(chunk_id, distance)]
+
+    python local_vector_index.py status
+    python local_vector_index.py rebuild     # reload all embeddings from the database
+    python local_vector_index.py compact
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+DTYPES = ("float32", "float16")
+# Rows scored per block when the matrix is float16 (converted to float32 per block)
+SCAN_BLOCK_ROWS = 65536
+
+
+def is_local_backend(bind) -> bool:
+    """Use the embedded index when configured, or by default when there is no pgvector."""
+    backend = settings.VECTOR_BACKEND.lower()
+    if backend == "local":
+        return True
+    if backend == "pgvector":
+        return False
+    return bind.dialect.name != "postgresql"
+
+
+class LocalVectorIndex:
+    """Append-only, memory-mapped segment store answering top-k cosine queries."""
+
+    def __init__(self, path: str, dimension: int = 768, dtype: str = "float32", max_segments: int = 16):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}. Available: {', '.join(DTYPES)}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.max_segments = max(1, max_segments)
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._manifest: Dict[str, Any] = {}
+        self._segments: List[Dict[str, Any]] = []
+        self._tombstone_ids = np.empty(0, dtype=np.int64)
+        self._tombstone_cutoffs = np.empty(0, dtype=np.int64)
+        self._reload()
+
+    # ------------------------------------------------------------------ writes
+
+    def add(
+        self,
+        chunk_ids: Sequence[int],
+        document_ids: Sequence[int],
+        vectors: Sequence[Optional[Sequence[float]]]
+    ) -> int:
+        """Append vectors for the given chunks; chunks without an embedding are skipped."""
+        rows = [
+            (chunk_id, document_id, vector)
+            for chunk_id, document_id, vector in zip(chunk_ids, document_ids, vectors)
+            if vector is not None
+        ]
+        if not rows:
+            return 0
+
+        matrix = self._normalise(np.asarray([vector for _, _, vector in rows], dtype=np.float32))
+        ids = np.asarray([chunk_id for chunk_id, _, _ in rows], dtype=np.int64)
+        docs = np.asarray([document_id for _, document_id, _ in rows], dtype=np.int64)
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            name = f"seg-{manifest['next_segment']:06d}"
+            self._write_segment(name, matrix.astype(self.dtype), ids, docs)
+            manifest["segments"].append({"name": name, "seq": manifest["next_segment"], "rows": len(ids)})
+            manifest["next_segment"] += 1
+            self._write_manifest(manifest)
+            compact = len(manifest["segments"]) > self.max_segments
+
+        if compact:
+            self.compact()
+        return len(ids)
+
+    def delete_chunks(self, chunk_ids: Iterable[int]) -> None:
+        """
+        Tombstone chunk ids in the existing segments; the rows are dropped at
+        the next compaction. Rows added later under a reused id stay live.
+        """
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        if not chunk_ids:
+            return
+        with self._write_lock():
+            manifest = self._read_manifest()
+            cutoff = manifest["next_segment"] - 1
+            for chunk_id in chunk_ids:
+                manifest["tombstones"][str(chunk_id)] = cutoff
+            self._write_manifest(manifest)
+
+    def delete_documents(self, document_ids: Iterable[int]) -> None:
+        """Tombstone every indexed chunk of the given documents."""
+        wanted = np.asarray(list(document_ids), dtype=np.int64)
+        if not len(wanted):
+            return
+        self._reload()
+        doomed = [
+            segment["ids"][np.isin(segment["documents"], wanted)]
+            for segment in self._segments
+        ]
+        self.delete_chunks(np.concatenate(doomed).tolist() if doomed else [])
+
+    def compact(self, live_chunk_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        """
+        Merge all segments into one, dropping tombstoned rows.
+
+        `live_chunk_ids`, when given, also drops rows whose chunk no longer
+        exists in the database.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            tombstone_ids, tombstone_cutoffs = _tombstone_arrays(manifest["tombstones"])
+            live = np.asarray(list(live_chunk_ids), dtype=np.int64) if live_chunk_ids is not None else None
+
+            matrices, ids, docs = [], [], []
+            for entry in manifest["segments"]:
+                matrix, segment_ids, segment_docs = self._open_segment(entry["name"])
+                keep = ~np.isin(segment_ids, tombstone_ids[tombstone_cutoffs >= entry["seq"]])
+                if live is not None:
+                    keep &= np.isin(segment_ids, live)
+                matrices.append(np.asarray(matrix[keep]))
+                ids.append(segment_ids[keep])
+                docs.append(segment_docs[keep])
+
+            old_segments = [entry["name"] for entry in manifest["segments"]]
+            manifest["segments"] = []
+            if ids and sum(len(segment_ids) for segment_ids in ids):
+                name = f"seg-{manifest['next_segment']:06d}"
+                merged_ids = np.concatenate(ids)
+                self._write_segment(name, np.concatenate(matrices).astype(self.dtype), merged_ids, np.concatenate(docs))
+                manifest["segments"].append({"name": name, "seq": manifest["next_segment"], "rows": len(merged_ids)})
+                manifest["next_segment"] += 1
+            manifest["tombstones"] = {}
+            self._write_manifest(manifest)
+            self._remove_segments(old_segments)
+
+        self._reload()
+        stats = self.get_stats()
+        print(f"✅ Local vector index compacted: {stats['rows']} rows in {stats['segments']} segment(s)")
+        return stats
+
+    def clear(self) -> None:
+        """Drop every segment and tombstone."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            old_segments = [entry["name"] for entry in manifest["segments"]]
+            manifest["segments"] = []
+            manifest["tombstones"] = {}
+            self._write_manifest(manifest)
+            self._remove_segments(old_segments)
+        self._reload()
+
+    # ------------------------------------------------------------------- reads
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        k: int,
+        document_ids: Optional[Iterable[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Return up to k (chunk_id, cosine_distance) pairs, nearest first.
+
+        `document_ids` restricts the scan to chunks of those documents
+        (None means no restriction; an empty set matches nothing).
+        """
+        if k <= 0:
+            return []
+        self._reload()
+        with self._lock:
+            segments = list(self._segments)
+            tombstone_ids, tombstone_cutoffs = self._tombstone_ids, self._tombstone_cutoffs
+
+        allowed = None
+        if document_ids is not None:
+            allowed = np.asarray(list(document_ids), dtype=np.int64)
+            if not len(allowed):
+                return []
+
+        query = self._normalise(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        best_ids, best_scores = [], []
+        for segment in segments:
+            mask = None
+            if allowed is not None:
+                mask = np.isin(segment["documents"], allowed)
+            dead = tombstone_ids[tombstone_cutoffs >= segment["seq"]]
+            if len(dead):
+                alive = ~np.isin(segment["ids"], dead)
+                mask = alive if mask is None else mask & alive
+            if mask is not None and not mask.any():
+                continue
+
+            scores = self._scores(segment["vectors"], query)
+            if mask is not None:
+                scores[~mask] = -np.inf
+            top = min(k, len(scores))
+            candidates = np.argpartition(-scores, top - 1)[:top]
+            candidates = candidates[np.isfinite(scores[candidates])]
+            best_ids.append(segment["ids"][candidates])
+            best_scores.append(scores[candidates])
+
+        if not best_ids:
+            return []
+        ids = np.concatenate(best_ids)
+        scores = np.concatenate(best_scores)
+        order = np.argsort(-scores)[:k]
+        return [(int(ids[i]), float(1.0 - scores[i])) for i in order]
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._reload()
+        with self._lock:
+            rows = sum(len(segment["ids"]) for segment in self._segments)
+            return {
+                "path": str(self.path),
+                "dimension": self.dimension,
+                "dtype": self.dtype.name,
+                "segments": len(self._segments),
+                "rows": rows,
+                "tombstones": len(self._tombstone_ids),
+                "bytes": sum(segment["vectors"].nbytes for segment in self._segments),
+            }
+
+    # ----------------------------------------------------------------- helpers
+
+    def _scores(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        # float16 matmul is slow on CPUs; widen one block at a time
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+            block = matrix[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def _normalise(self, matrix: np.ndarray) -> np.ndarray:
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {matrix.shape[1]}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @contextmanager
+    def _read_lock(self):
+        # Shared flock: compaction cannot unlink segments while they are being opened
+        with open(self.path / LOCK_NAME, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self):
+        # Thread lock for this process, flock for other workers sharing the directory
+        with self._lock, open(self.path / LOCK_NAME, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        manifest_path = self.path / MANIFEST_NAME
+        if not manifest_path.exists():
+            return {
+                "dimension": self.dimension,
+                "dtype": self.dtype.name,
+                "segments": [],
+                "tombstones": {},
+                "next_segment": 1,
+            }
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        # Manifests written before tombstones were scoped to segments
+        for entry in manifest["segments"]:
+            entry.setdefault("seq", int(entry["name"].split("-")[-1]))
+        if isinstance(manifest["tombstones"], list):
+            cutoff = manifest["next_segment"] - 1
+            manifest["tombstones"] = {str(chunk_id): cutoff for chunk_id in manifest["tombstones"]}
+        if manifest["dimension"] != self.dimension or manifest["dtype"] != self.dtype.name:
+            raise ValueError(
+                f"Local vector index at {self.path} holds {manifest['dimension']}-d {manifest['dtype']} "
+                f"vectors; run 'python local_vector_index.py rebuild' after changing the settings"
+            )
+        return manifest
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp_path = self.path / f"{MANIFEST_NAME}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.path / MANIFEST_NAME)
+
+    def _write_segment(self, name: str, matrix: np.ndarray, ids: np.ndarray, docs: np.ndarray) -> None:
+        # Segment files are written before the manifest references them
+        for suffix, array in ((".vectors.npy", matrix), (".ids.npy", ids), (".documents.npy", docs)):
+            tmp_path = self.path / f"{name}{suffix}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, self.path / f"{name}{suffix}")
+
+    def _remove_segments(self, names: Iterable[str]) -> None:
+        # Readers that still map an old segment keep their view until they reload
+        for name in names:
+            for suffix in (".vectors.npy", ".ids.npy", ".documents.npy"):
+                try:
+                    (self.path / f"{name}{suffix}").unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _open_segment(self, name: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            np.load(self.path / f"{name}.vectors.npy", mmap_mode="r"),
+            np.load(self.path / f"{name}.ids.npy"),
+            np.load(self.path / f"{name}.documents.npy"),
+        )
+
+    def _reload(self) -> None:
+        """Re-open segments when another process (or thread) changed the manifest."""
+        manifest_path = self.path / MANIFEST_NAME
+        try:
+            mtime = manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._manifest_mtime and self._manifest:
+            return
+
+        with self._lock, self._read_lock():
+            try:
+                mtime = manifest_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            manifest = self._read_manifest()
+            segments = []
+            for entry in manifest["segments"]:
+                vectors, ids, docs = self._open_segment(entry["name"])
+                segments.append({
+                    "name": entry["name"], "seq": entry["seq"],
+                    "vectors": vectors, "ids": ids, "documents": docs
+                })
+            self._manifest = manifest
+            self._segments = segments
+            self._tombstone_ids, self._tombstone_cutoffs = _tombstone_arrays(manifest["tombstones"])
+            self._manifest_mtime = mtime
+
+
+def _tombstone_arrays(tombstones: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Tombstoned chunk ids and, per id, the last segment seq it applies to."""
+    ids = np.fromiter((int(chunk_id) for chunk_id in tombstones), dtype=np.int64, count=len(tombstones))
+    cutoffs = np.fromiter(tombstones.values(), dtype=np.int64, count=len(tombstones))
+    return ids, cutoffs
+
+
+_local_index: Optional[LocalVectorIndex] = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_vector_index() -> LocalVectorIndex:
+    """Return the process-wide embedded index at settings.LOCAL_VECTOR_INDEX_PATH."""
+    global _local_index
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                _local_index = LocalVectorIndex(
+                    settings.LOCAL_VECTOR_INDEX_PATH,
+                    dimension=settings.EMBEDDING_DIMENSION,
+                    dtype=settings.LOCAL_VECTOR_INDEX_DTYPE,
+                    max_segments=settings.LOCAL_VECTOR_INDEX_MAX_SEGMENTS
+                )
+    return _local_index
+
+
+def rebuild_from_database(db, index: Optional[LocalVectorIndex] = None, batch_size: int = 20000) -> Dict[str, Any]:
+    """Load every stored chunk embedding into a fresh index."""
+    import models
+
+    index = index or get_local_vector_index()
+    index.clear()
+
+    started = time.perf_counter()
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.query(
+            models.DocumentChunk.id,
+            models.DocumentChunk.document_id,
+            models.DocumentChunk.embedding
+        ).filter(
+            models.DocumentChunk.id > last_id,
+            models.DocumentChunk.embedding.isnot(None)
+        ).order_by(models.DocumentChunk.id).limit(batch_size).all()
+        if not rows:
+            break
+        total += index.add([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+        last_id = rows[-1][0]
+
+    stats = index.compact()
+    print(f"✅ Rebuilt local vector index with {total} chunks in {time.perf_counter() - started:.2f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Manage the embedded (SQLite/edge) vector index")
+    parser.add_argument("command", choices=("status", "rebuild", "compact"))
+    args = parser.parse_args()
+
+    index = get_local_vector_index()
+    if args.command == "status":
+        print(index.get_stats())
+    else:
+        db = SessionLocal()
+        try:
+            if args.command == "rebuild":
+                rebuild_from_database(db, index)
+            else:
+                import models
+                live_ids = [row[0] for row in db.query(models.DocumentChunk.id)]
+                index.compact(live_chunk_ids=live_ids)
+        finally:
+            db.close()
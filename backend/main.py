@@ -1,7 +1,11 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Any, AsyncIterator, Dict, List, Optional
 from sqlalchemy.orm import Session
+import asyncio
+import json
 import uuid
 
 import enum
@@ -16,18 +20,28 @@ from models import RBACLevel
 
 # Import new configurable storage system
 from storage_config import storage_manager
+from redis.exceptions import RedisError
 from redis_pubsub import redis_pubsub
+from fair_queue import open_reliable_queue
 from vector_store import VectorStore
+from embedding_cache import get_query_embedding_cache
+from embedding_gateway import set_embedding_gateway
+from job_events import TERMINAL_STAGES, get_job_event_broker, stop_job_event_broker
+from context_packer import get_context_budget, pack_context
+from answer_cache import answer_scope_key, get_answer_cache, scope_fingerprint
 try:
     from langchain_neo4j import Neo4jGraph
 except Exception:
     Neo4jGraph = None
-from agents.google_agent import GoogleDocAgent
+from llm_clients import GEMINI_KEY, close_llm_clients, get_llm_clients
 from routes.auth import router as auth_router
 from security import get_current_user
 from rbac import (
+    denied_document_ids,
     filter_documents_scope,
     filter_jobs_scope,
+    invalidate_scope_cache,
+    sync_chunk_ownership,
     user_has_document_access,
     user_has_job_access,
 )
@@ -177,10 +191,21 @@ async def startup_event():
     """Initialize database on startup"""
     init_db()
     print("Database initialized")
+    # Shared LLM clients: created once here, reused by every request
+    get_llm_clients()
     print(f"API running at {settings.API_HOST}:{settings.API_PORT}")
     print(f"Docs available at {settings.API_PREFIX}/docs")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled LLM connections and stop the embedding gateway"""
+    await close_llm_clients()
+    set_embedding_gateway(None)
+    stop_job_event_broker()
+    print("LLM clients closed")
+
+
 @app.get("/")
 async def root():
     return {
@@ -198,7 +223,11 @@ async def health_check():
         "upload_limits": {
             "max_files": settings.MAX_UPLOAD_FILES,
             "max_size_mb": settings.MAX_FILE_SIZE_MB
-        }
+        },
+        "query_embedding_cache": get_query_embedding_cache().get_stats(),
+        "llm_clients": get_llm_clients().get_stats(),
+        "answer_cache": get_answer_cache().get_stats(),
+        "job_events": get_job_event_broker().get_stats()
     }
 
 
@@ -331,6 +360,7 @@ async def admin_delete_manager(
     
     db.delete(manager)
     db.commit()
+    invalidate_scope_cache(manager_id)
     
     return {"message": f"Manager {manager.email} deleted successfully"}
 
@@ -369,6 +399,7 @@ async def admin_create_analyst(
     
     db.add(new_analyst)
     db.commit()
+    invalidate_scope_cache(user_in.manager_id)
     db.refresh(new_analyst)
     
     return new_analyst
@@ -428,8 +459,13 @@ async def admin_reassign_analyst(
     if not new_manager:
         raise HTTPException(status_code=404, detail="New manager not found")
     
+    previous_manager_id = analyst.manager_id
     analyst.manager_id = reassign_data.new_manager_id
+    db.flush()
+    # Chunks carry a copy of the owner's manager for RBAC filtering
+    sync_chunk_ownership(db, owner_user_id=analyst.id)
     db.commit()
+    invalidate_scope_cache(previous_manager_id, reassign_data.new_manager_id)
     db.refresh(analyst)
     
     return analyst
@@ -450,12 +486,37 @@ async def admin_delete_analyst(
     if not analyst:
         raise HTTPException(status_code=404, detail="Analyst not found")
     
+    manager_id = analyst.manager_id
     db.delete(analyst)
     db.commit()
+    invalidate_scope_cache(manager_id)
     
     return {"message": f"Analyst {analyst.email} deleted successfully"}
 
 
+def _queue_stats() -> Dict[str, Any]:
+    if not settings.QUEUE_RELIABLE:
+        return {"reliable": False}
+    queues = {}
+    for queue_name in (
+        settings.REDIS_QUEUE_DOCUMENT,
+        settings.REDIS_QUEUE_AUDIO,
+        settings.REDIS_QUEUE_VIDEO,
+        settings.REDIS_QUEUE_GRAPH
+    ):
+        queues[queue_name] = open_reliable_queue(redis_pubsub.redis_client, queue_name).get_stats()
+    return {"reliable": True, "tenant_fair": settings.QUEUE_TENANT_FAIR, "queues": queues}
+
+
+@app.get(f"{settings.API_PREFIX}/admin/queues")
+async def admin_queue_stats(admin_user: models.User = Depends(get_super_admin)):
+    """Admin endpoint: backlog, in-flight, dead letters and per-tenant wait times per queue."""
+    try:
+        return await run_in_threadpool(_queue_stats)
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Queue stats unavailable: {e}")
+
+
 @app.post(f"{settings.API_PREFIX}/manager/analysts", response_model=UserOut)
 async def manager_create_analyst(
     user_in: AnalystCreateByManager,
@@ -481,6 +542,7 @@ async def manager_create_analyst(
     
     db.add(new_analyst)
     db.commit()
+    invalidate_scope_cache(manager_user.id)
     db.refresh(new_analyst)
     
     return new_analyst
@@ -513,6 +575,7 @@ async def manager_delete_analyst(
     
     db.delete(analyst)
     db.commit()
+    invalidate_scope_cache(manager_user.id)
     
     return {"message": f"Analyst {analyst.email} deleted successfully"}
 
@@ -596,6 +659,7 @@ async def upload_documents(
             detail=f"Maximum {settings.MAX_UPLOAD_FILES} files allowed per upload"
         )
     
+    file_sizes = {}
     for file in files:
         file_ext = '.' + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
         if file_ext not in settings.allowed_extensions_list:
@@ -607,6 +671,7 @@ async def upload_documents(
         file.file.seek(0, 2)
         size = file.file.tell()
         file.file.seek(0)
+        file_sizes[file.filename] = size
         
         if size > settings.max_file_size_bytes:
             raise HTTPException(
@@ -701,18 +766,20 @@ async def upload_documents(
     
     # Push per-file messages to Redis queues for true parallel processing
     # Each file gets its own message in a queue, distributed to available workers
+    # (per-tenant and cost-weighted by file size, see fair_queue.py)
     messages_queued = 0
     for filename, file_type in zip(filenames, file_types):
         gcs_path = f"{gcs_prefix}{filename}"
+        size = file_sizes.get(filename)
         
         if file_type == 'document':
-            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_DOCUMENT)
+            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_DOCUMENT, size)
             messages_queued += 1
         elif file_type == 'audio':
-            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_AUDIO)
+            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_AUDIO, size)
             messages_queued += 1
         elif file_type == 'video':
-            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_VIDEO)
+            redis_pubsub.push_file_to_queue(job_id, gcs_path, filename, settings.REDIS_QUEUE_VIDEO, size)
             messages_queued += 1
     
     print(f"Job {job_id} created and queued for processing ({messages_queued} messages in queue)")
@@ -748,18 +815,101 @@ async def get_job_status(
     if job.total_files > 0:
         progress_percentage = (job.processed_files / job.total_files) * 100
     
+    cache_hits = job.embedding_cache_hits or 0
+    cache_misses = job.embedding_cache_misses or 0
+    cache_lookups = cache_hits + cache_misses
+    
     return {
         "job_id": job.id,
         "status": job.status.value,
         "total_files": job.total_files,
         "processed_files": job.processed_files,
+        "failed_files": job.failed_files or 0,
         "progress_percentage": round(progress_percentage, 2),
+        "embedding_cache": {
+            "hits": cache_hits,
+            "misses": cache_misses,
+            "hit_rate": round(cache_hits / cache_lookups, 4) if cache_lookups else 0.0
+        },
         "started_at": job.started_at.isoformat() if job.started_at else None,
         "completed_at": job.completed_at.isoformat() if job.completed_at else None,
         "error_message": job.error_message
     }
 
 
+@app.get(f"{settings.API_PREFIX}/jobs/{{job_id:path}}/events")
+async def stream_job_events(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Server-sent events with a job's progress, instead of polling /status.
+    
+    The first event is `status` (the same counters as /status). Then comes
+    one `progress` event per file stage the workers publish: extracted,
+    translated, summarized, embedded, graphed or failed. The stream ends
+    after the job-level `completed` or `job_failed`. Access is checked once
+    when the stream opens.
+    """
+    broker = get_job_event_broker()
+    # Subscribe, and wait for Redis to confirm it, before reading the job:
+    # an event published in between is then in the queue, not lost
+    queue = broker.subscribe(job_id)
+    try:
+        if not await broker.wait_ready(timeout=5):
+            raise HTTPException(status_code=503, detail="Job event stream unavailable")
+        
+        job = db.query(models.ProcessingJob).filter(
+            models.ProcessingJob.id == job_id
+        ).first()
+        
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if not user_has_job_access(current_user, job):
+            raise HTTPException(status_code=403, detail="Insufficient permissions for this job")
+        
+        snapshot = {
+            "job_id": job.id,
+            "status": job.status.value,
+            "total_files": job.total_files,
+            "processed_files": job.processed_files,
+            "failed_files": job.failed_files or 0,
+        }
+        finished = job.status in (models.JobStatus.COMPLETED, models.JobStatus.FAILED)
+    except BaseException:
+        broker.unsubscribe(job_id, queue)
+        raise
+    finally:
+        # Nothing below touches the database; do not hold a connection for the stream
+        db.close()
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            yield _sse_event("status", snapshot)
+            if finished:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.JOB_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies and load balancers from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if event.get("stage") in TERMINAL_STAGES:
+                    yield _sse_event(event["stage"], event)
+                    return
+                yield _sse_event("progress", event)
+        finally:
+            broker.unsubscribe(job_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get(f"{settings.API_PREFIX}/jobs/{{job_id:path}}/results")
 async def get_job_results(
     job_id: str,
@@ -961,16 +1111,14 @@ async def get_job_graph(
         raise HTTPException(500, "Graph database is not connected")
 
     # 2. Get document IDs (same as before)
+    doc_query = filter_documents_scope(
+        db.query(models.Document.id).filter(models.Document.job_id == job_id),
+        current_user
+    )
     if document_ids:
         selected_ids = [int(id.strip()) for id in document_ids.split(',') if id.strip()]
-        doc_ids = db.query(models.Document.id).filter(
-            models.Document.job_id == job_id,
-            models.Document.id.in_(selected_ids)
-        ).all()
-    else:
-        doc_ids = db.query(models.Document.id).filter(
-            models.Document.job_id == job_id
-        ).all()
+        doc_query = doc_query.filter(models.Document.id.in_(selected_ids))
+    doc_ids = doc_query.all()
     
     document_ids_list = [str(doc_id[0]) for doc_id in doc_ids]
     
@@ -1087,20 +1235,259 @@ async def get_job_graph(
         "relationships": relationships
     }
     
+def _build_chat_prompt(message: str, chunks: List[dict]) -> str:
+    """RAG prompt for the Ollama chat model."""
+    context_with_sources = []
+    for idx, r in enumerate(chunks):
+        context_with_sources.append(f"[Source {idx+1}]\n{r['chunk_text']}")
+    
+    full_context = "\n\n".join(context_with_sources)
+    
+    return f"""You are a helpful assistant analyzing documents. Based on the following document excerpts, answer the     user's question accurately and concisely.
+
+Document Excerpts:
+{full_context}
+
+User Question: {message}
+
+Please provide a clear and informative answer based only on the information in the excerpts above. If the answer is not in the excerpts, say so."""
+
+
+def _display_sources(chunks: List[dict]) -> List[dict]:
+    return [
+        {
+            "chunk_text": r["chunk_text"][:500],
+            "document_id": r.get("document_id"),
+            "chunk_index": r.get("chunk_index"),
+            "metadata": r.get("metadata", {})
+        }
+        for r in chunks
+    ]
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _is_cacheable_answer(answer: dict) -> bool:
+    """False for empty answers and the failure texts GoogleDocAgent returns instead of raising."""
+    text = (answer.get("response") or "").strip()
+    if not text:
+        return False
+    if answer.get("mode", "").startswith("google-"):
+        from agents.google_agent import ERROR_RESPONSE_PREFIX, FILTERED_RESPONSE
+        return text != FILTERED_RESPONSE and not text.startswith(ERROR_RESPONSE_PREFIX)
+    return True
+
+
+def _remember_answer(cache_probe: Optional[dict], answer: dict) -> None:
+    """
+    Store a generated answer in the chat answer cache (see _retrieve_chat_context).
+    
+    Failed answers are skipped; a cached one would be replayed to everyone in
+    the scope until it expires.
+    """
+    if cache_probe is None or not _is_cacheable_answer(answer):
+        return
+    get_answer_cache().store(
+        cache_probe["scope"],
+        cache_probe["embedding"],
+        cache_probe["fingerprint"],
+        answer
+    )
+
+
+async def _stream_cached_answer(answer: dict) -> AsyncIterator[str]:
+    """A cached answer as the same event sequence as _stream_chat_events."""
+    yield _sse_event("sources", {"sources": answer["sources"]})
+    yield _sse_event("token", {"text": answer["response"]})
+    yield _sse_event("done", {
+        "mode": answer["mode"],
+        "context_tokens": answer["context_tokens"],
+        "cached": True
+    })
+
+
+async def _stream_chat_events(
+    message: str,
+    job_id: Optional[str],
+    document_ids: Optional[str],
+    results: List[dict],
+    ollama_context: dict,
+    cache_probe: Optional[dict] = None
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for a streamed chat answer.
+    
+    Events: `sources` (the excerpts the answer is based on; sent again if a
+    fallback model uses a different set), `token` ({"text": ...}) for each
+    piece of the answer, then `done` ({"mode", "context_tokens"}). The fallback
+    chain matches the JSON endpoint: Gemini (dev), Ollama, then context only.
+    A model only falls back while it has not streamed anything (a stream with
+    no text, e.g. safety-filtered, counts as a failure); a failure mid-answer
+    ends the stream with an `error` event. Completed model answers
+    are stored in the answer cache.
+    """
+    if settings.USE_GEMINI_FOR_DEV and settings.GEMINI_API_KEY:
+        google_context = pack_context(results, get_context_budget(settings.GOOGLE_CHAT_MODEL))
+        yield _sse_event("sources", {"sources": _display_sources(google_context["chunks"])})
+        streamed = False
+        parts: List[str] = []
+        try:
+            clients = get_llm_clients()
+            agent = clients.google_agent(settings.GOOGLE_CHAT_MODEL)
+            async with clients.async_slot(GEMINI_KEY):
+                async for text in agent.generate_stream_async(
+                    question=message,
+                    chunks=google_context["chunks"],
+                    metadata={
+                        "job_id": job_id or "N/A",
+                        "document_ids": document_ids if document_ids else "N/A",
+                    },
+                    max_chunk_chars=None
+                ):
+                    streamed = True
+                    parts.append(text)
+                    yield _sse_event("token", {"text": text})
+            if not streamed:
+                # A safety-filtered stream has no text parts at all
+                raise RuntimeError("Gemini returned no text (content may have been filtered)")
+            mode = f"google-{settings.GOOGLE_CHAT_MODEL}"
+            _remember_answer(cache_probe, {
+                "response": "".join(parts).strip(),
+                "sources": _display_sources(google_context["chunks"]),
+                "mode": mode,
+                "context_tokens": google_context["tokens_used"]
+            })
+            yield _sse_event("done", {"mode": mode, "context_tokens": google_context["tokens_used"]})
+            return
+        except Exception as agent_error:
+            print(f"Gemini streaming error: {agent_error}")
+            if streamed:
+                yield _sse_event("error", {"detail": str(agent_error)})
+                return
+    
+    yield _sse_event("sources", {"sources": _display_sources(ollama_context["chunks"])})
+    streamed = False
+    parts = []
+    try:
+        clients = get_llm_clients()
+        ollama_client = clients.async_ollama(settings.CHAT_LLM_URL)
+        async with clients.async_slot(clients.ollama_key(settings.CHAT_LLM_URL)):
+            response = await ollama_client.chat(
+                model=settings.CHAT_LLM_MODEL,
+                messages=[{'role': 'user', 'content': _build_chat_prompt(message, ollama_context["chunks"])}],
+                stream=True,
+            )
+            async for part in response:
+                text = part['message']['content']
+                if text:
+                    streamed = True
+                    parts.append(text)
+                    yield _sse_event("token", {"text": text})
+        if not streamed:
+            raise RuntimeError("Ollama returned an empty answer")
+        mode = f"ollama-{settings.CHAT_LLM_MODEL}"
+        _remember_answer(cache_probe, {
+            "response": "".join(parts),
+            "sources": _display_sources(ollama_context["chunks"]),
+            "mode": mode,
+            "context_tokens": ollama_context["tokens_used"]
+        })
+        yield _sse_event("done", {"mode": mode, "context_tokens": ollama_context["tokens_used"]})
+        return
+    except Exception as ollama_error:
+        print(f"Ollama streaming error: {ollama_error}")
+        if streamed:
+            yield _sse_event("error", {"detail": str(ollama_error)})
+            return
+    
+    # Final fallback: the context itself
+    context = "\n\n".join(chunk["chunk_text"] for chunk in ollama_context["chunks"])
+    yield _sse_event("token", {"text": f"Based on the document excerpts:\n\n{context}\n\n(Chat LLM unavailable)"})
+    yield _sse_event("done", {"mode": "context-only", "context_tokens": ollama_context["tokens_used"]})
+
+
+def _retrieve_chat_context(
+    db: Session,
+    current_user: models.User,
+    message: str,
+    job_id: Optional[str],
+    doc_id_list: Optional[List[int]]
+) -> Dict[str, Any]:
+    """
+    Access checks, answer cache lookup and retrieval for /chat.
+    
+    Returns {"cached": answer or None, "results": [...], "cache_probe": ...};
+    retrieval is skipped on a cache hit. cache_probe (scope, query embedding,
+    scope fingerprint) is what _remember_answer needs to store the answer.
+    
+    Everything here is blocking (SQLAlchemy queries, the query embedding HTTP
+    call), so the endpoint runs it in the threadpool, off the event loop.
+    """
+    if job_id:
+        job = db.query(models.ProcessingJob).filter(models.ProcessingJob.id == job_id).first()
+        if not job:
+            raise HTTPException(404, "Job not found")
+        if not user_has_job_access(current_user, job):
+            raise HTTPException(status_code=403, detail="Insufficient permissions for this job")
+
+    # Verify access to selected documents if specified, all in one query
+    if doc_id_list:
+        denied = denied_document_ids(db, current_user, doc_id_list)
+        missing = [doc_id for doc_id, reason in denied.items() if reason == "not_found"]
+        if missing:
+            raise HTTPException(404, f"Document {missing[0]} not found")
+        if denied:
+            raise HTTPException(status_code=403, detail=f"Insufficient permissions for document {next(iter(denied))}")
+
+    vector_store = VectorStore(db)
+    cache_probe = None
+    if settings.CHAT_ANSWER_CACHE:
+        # Also warms the query embedding cache for the search below
+        query_embedding = vector_store._embed_query(message)
+        if query_embedding is not None:
+            cache_probe = {
+                "scope": answer_scope_key(current_user, job_id, doc_id_list),
+                "embedding": query_embedding,
+                "fingerprint": scope_fingerprint(db, current_user, job_id, doc_id_list),
+            }
+            cached = get_answer_cache().lookup(
+                cache_probe["scope"], query_embedding, cache_probe["fingerprint"]
+            )
+            if cached is not None:
+                return {"cached": cached, "results": [], "cache_probe": None}
+
+    # Over-fetch and keep 8 diverse chunks instead of near-duplicate neighbours
+    results = vector_store.diverse_search(
+        query=message,
+        k=8,
+        document_ids=doc_id_list,
+        job_id=job_id,
+        user=current_user
+    )
+    return {"cached": None, "results": results, "cache_probe": cache_probe}
+
+
 @app.post(f"{settings.API_PREFIX}/chat")
 async def chat_with_documents(
     message: str,
     job_id: Optional[str] = None,
     document_ids: Optional[str] = None,  # comma-separated document IDs
+    stream: bool = False,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    # (Your original code...)
+    """
+    Answer a question from the user's documents.
+    
+    With `stream=true` the response is a server-sent event stream instead of
+    JSON (see _stream_chat_events): the sources are sent first, then the
+    answer tokens as the model produces them.
+    """
     if not message:
         raise HTTPException(400, "Message is required")
     
-    vector_store = VectorStore(db)
-    
     # Parse document IDs if provided
     doc_id_list = None
     if document_ids:
@@ -1110,86 +1497,76 @@ async def chat_with_documents(
             raise HTTPException(400, "Invalid document_ids format")
     
     try:
-        if job_id:
-            job = db.query(models.ProcessingJob).filter(models.ProcessingJob.id == job_id).first()
-            if not job:
-                raise HTTPException(404, "Job not found")
-            if not user_has_job_access(current_user, job):
-                raise HTTPException(status_code=403, detail="Insufficient permissions for this job")
-
-        # Verify access to selected documents if specified
-        if doc_id_list:
-            for doc_id in doc_id_list:
-                document = db.query(models.Document).filter(models.Document.id == doc_id).first()
-                if not document:
-                    raise HTTPException(404, f"Document {doc_id} not found")
-                if not user_has_document_access(current_user, document):
-                    raise HTTPException(status_code=403, detail=f"Insufficient permissions for document {doc_id}")
-
-        results = vector_store.similarity_search(
-            query=message,
-            k=8,
-            document_ids=doc_id_list,
-            job_id=job_id,
-            user=current_user
+        # Blocking DB / embedding work runs in the threadpool so one slow chat
+        # does not stall other requests on this worker
+        retrieved = await run_in_threadpool(
+            _retrieve_chat_context, db, current_user, message, job_id, doc_id_list
         )
+        
+        # Near-identical question over an unchanged scope: answer from the cache
+        if retrieved["cached"] is not None:
+            if stream:
+                return StreamingResponse(
+                    _stream_cached_answer(retrieved["cached"]),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                )
+            return retrieved["cached"]
+        results = retrieved["results"]
+        cache_probe = retrieved["cache_probe"]
 
-        # print(f"SIMILARITY SEARCH RESULTS: {len(results)} chunks found")
-        # if results:
-        #     print(f"First result: {results[0]}")
-        # else:
-        #     print(f"NO RESULTS - Checking database...")
-        #     from sqlalchemy import func
-        #     chunk_count = db.query(func.count(models.DocumentChunk.id)).scalar()
-        # print(f"Total chunks in database: {chunk_count}")
-        # if doc_id_list:
-        #     doc_chunk_count = db.query(func.count(models.DocumentChunk.id)).filter(
-        #         models.DocumentChunk.document_id.in_(doc_id_list)
-        #     ).scalar()
-        # print(f"Chunks for selected docs {doc_id_list}: {doc_chunk_count}")
-
-        context = "\n\n".join([r["chunk_text"][:800] for r in results[:5]])
+        # Excerpts are packed to each chat model's token budget instead of fixed-length cuts
+        ollama_context = pack_context(results, get_context_budget(settings.CHAT_LLM_MODEL))
+        context = "\n\n".join(chunk["chunk_text"] for chunk in ollama_context["chunks"])
+        
+        if stream:
+            return StreamingResponse(
+                _stream_chat_events(message, job_id, document_ids, results, ollama_context, cache_probe),
+                media_type="text/event-stream",
+                # Keep proxies from buffering the stream
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
         # ===== LOCAL DEV MODE: Use Gemini if configured =====
         if settings.USE_GEMINI_FOR_DEV and settings.GEMINI_API_KEY:
             try:
                 print("Using Gemini for chat (LOCAL DEV MODE)")
-                agent = GoogleDocAgent(api_key=settings.GEMINI_API_KEY, model=settings.GOOGLE_CHAT_MODEL)
+                clients = get_llm_clients()
+                agent = clients.google_agent(settings.GOOGLE_CHAT_MODEL)
                 
+                google_context = pack_context(results, get_context_budget(settings.GOOGLE_CHAT_MODEL))
+                print(f"Packed {len(google_context['chunks'])} excerpts into {google_context['tokens_used']}/{google_context['budget']} tokens")
                 enriched_chunks = []
-                for r in results[:8]:
-                    chunk_text = r["chunk_text"][:1500] if len(r["chunk_text"]) > 1500 else r["chunk_text"]
+                for r in google_context["chunks"]:
                     enriched_chunks.append({
-                        "chunk_text": chunk_text,
+                        "chunk_text": r["chunk_text"],
                         "document_id": r.get("document_id"),
                         "chunk_index": r.get("chunk_index"),
                         "metadata": r.get("metadata", {})
                     })
                 
-                response_text = agent.generate(
-                    question=message,
-                    chunks=enriched_chunks,
-                    metadata={
-                        "job_id": job_id or "N/A",
-                        "document_ids": document_ids if document_ids else "N/A",
-                    },
-                    include_static_refs=False
-                )
+                async with clients.async_slot(GEMINI_KEY):
+                    response_text = await agent.generate_async(
+                        question=message,
+                        chunks=enriched_chunks,
+                        metadata={
+                            "job_id": job_id or "N/A",
+                            "document_ids": document_ids if document_ids else "N/A",
+                        },
+                        include_static_refs=False,
+                        max_chunk_chars=None
+                    )
                 
-                display_sources = []
-                for r in results[:5]:
-                    display_sources.append({
-                        "chunk_text": r["chunk_text"][:500],
-                        "document_id": r.get("document_id"),
-                        "chunk_index": r.get("chunk_index"),
-                        "metadata": r.get("metadata", {})
-                    })
+                display_sources = _display_sources(google_context["chunks"])
                 
-                return {
+                answer = {
                     "response": response_text,
                     "sources": display_sources,
-                    "mode": f"google-{settings.GOOGLE_CHAT_MODEL}"
+                    "mode": f"google-{settings.GOOGLE_CHAT_MODEL}",
+                    "context_tokens": google_context["tokens_used"]
                 }
+                _remember_answer(cache_probe, answer)
+                return answer
             except Exception as agent_error:
                 print(f"Gemini chat error, falling back to Ollama: {agent_error}")
                 import traceback
@@ -1198,52 +1575,35 @@ async def chat_with_documents(
         # ===== PRODUCTION MODE: Use Ollama/Gemma =====
         print("🔧 Using Ollama for chat (PRODUCTION MODE)")
         try:
-            from ollama import Client
-            ollama_client = Client(host=f"http://{settings.CHAT_LLM_HOST}:{settings.CHAT_LLM_PORT}")
+            clients = get_llm_clients()
+            ollama_client = clients.async_ollama(settings.CHAT_LLM_URL)
             
-            # Prepare context from chunks
-            context_with_sources = []
-            for idx, r in enumerate(results[:5]):
-                chunk_preview = r["chunk_text"][:800]
-                context_with_sources.append(f"[Source {idx+1}]\n{chunk_preview}")
+            # Prepare context from the packed chunks
+            print(f"Packed {len(ollama_context['chunks'])} excerpts into {ollama_context['tokens_used']}/{ollama_context['budget']} tokens")
+            prompt = _build_chat_prompt(message, ollama_context["chunks"])
             
-            full_context = "\n\n".join(context_with_sources)
-            
-            # Create RAG prompt
-            prompt = f"""You are a helpful assistant analyzing documents. Based on the following document excerpts, answer the     user's question accurately and concisely.
-
-Document Excerpts:
-{full_context}
-
-User Question: {message}
-
-Please provide a clear and informative answer based only on the information in the excerpts above. If the answer is not in the excerpts, say so."""
-            
-            # Call Ollama
-            response = ollama_client.chat(
-                model=settings.CHAT_LLM_MODEL,
-                messages=[{
-                    'role': 'user',
-                    'content': prompt,
-                }],
-            )
+            # Call Ollama without blocking the event loop
+            async with clients.async_slot(clients.ollama_key(settings.CHAT_LLM_URL)):
+                response = await ollama_client.chat(
+                    model=settings.CHAT_LLM_MODEL,
+                    messages=[{
+                        'role': 'user',
+                        'content': prompt,
+                    }],
+                )
             
             response_text = response['message']['content']
             
-            display_sources = []
-            for r in results[:5]:
-                display_sources.append({
-                    "chunk_text": r["chunk_text"][:500],
-                    "document_id": r.get("document_id"),
-                    "chunk_index": r.get("chunk_index"),
-                    "metadata": r.get("metadata", {})
-                })
+            display_sources = _display_sources(ollama_context["chunks"])
             
-            return {
+            answer = {
                 "response": response_text,
                 "sources": display_sources,
-                "mode": f"ollama-{settings.CHAT_LLM_MODEL}"
+                "mode": f"ollama-{settings.CHAT_LLM_MODEL}",
+                "context_tokens": ollama_context["tokens_used"]
             }
+            _remember_answer(cache_probe, answer)
+            return answer
         except Exception as ollama_error:
             print(f"Ollama chat error: {ollama_error}")
             import traceback
@@ -1252,9 +1612,12 @@ Please provide a clear and informative answer based only on the information in t
             # Final fallback: return context only
             return {
                 "response": f"Based on the document excerpts:\n\n{context}\n\n(Chat LLM unavailable)",
-                "sources": results[:5],
-                "mode": "context-only"
+                "sources": ollama_context["chunks"],
+                "mode": "context-only",
+                "context_tokens": ollama_context["tokens_used"]
             }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat error: {e}")
         raise HTTPException(500, f"Chat failed: {str(e)}")
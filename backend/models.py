@@ -71,6 +71,13 @@ class ProcessingJob(Base):
     file_types = Column(JSON)  # Types of files (document/audio/video)
     total_files = Column(Integer, default=0)
     processed_files = Column(Integer, default=0)
+    # Documents whose knowledge graph is built; updated atomically (see job_progress.py)
+    graphed_files = Column(Integer, default=0)
+    failed_files = Column(Integer, default=0)
+    
+    # Chunks whose embedding was reused from embedding_cache vs computed (per job)
+    embedding_cache_hits = Column(Integer, default=0)
+    embedding_cache_misses = Column(Integer, default=0)
     
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
@@ -112,6 +119,7 @@ class Document(Base):
     translated_text_path = Column(String)
     summary_path = Column(String)
     transcription_path = Column(String)  # For audio/video files
+    graphed_at = Column(DateTime)  # Set once when the graph processor counts this document
     
     # Summary text (cached for quick access)
     summary_text = Column(Text)
@@ -131,32 +139,64 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
     
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
     
     # Chunk information
     chunk_index = Column(Integer, nullable=False)
     chunk_text = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # sha256(chunk_text), for incremental re-indexing
     
     # Vector embedding (pgvector)
     embedding = Column(Vector(768))  # Gemma embedding dimension
     
     chunk_metadata = Column("metadata", JSON)
     
+    # Ownership copied from Document -> ProcessingJob -> User at ingest so RBAC
+    # filters run on this table alone (kept in sync by rbac.sync_chunk_ownership)
+    job_id = Column(String, ForeignKey("processing_jobs.id"), nullable=True)
+    owner_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    manager_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     
     document = relationship("Document", back_populates="chunks")
 
-    # similarity search
+    # The ANN index on `embedding` is managed by vector_index.py (type, build
+    # parameters and online rebuilds), not by create_all.
     __table_args__ = (
-        Index(
-            "ix_document_chunks_embedding",
-            "embedding",
-            postgresql_using="ivfflat",
-            postgresql_with={"lists": 100}
-        ),
+        Index("ix_document_chunks_owner_job", "owner_user_id", "job_id"),
+        Index("ix_document_chunks_manager_job", "manager_id", "job_id"),
+        Index("ix_document_chunks_job_id", "job_id"),
     )
 
 
+class DocumentVector(Base):
+    """Per-document centroid of chunk embeddings, for coarse two-stage retrieval"""
+    __tablename__ = "document_vectors"
+    
+    document_id = Column(Integer, ForeignKey("documents.id"), primary_key=True)
+    embedding = Column(Vector(768))  # normalised mean of the document's chunk embeddings
+    chunk_count = Column(Integer, default=0)
+    
+    # Same denormalised ownership as document_chunks (rbac.sync_chunk_ownership)
+    job_id = Column(String, ForeignKey("processing_jobs.id"), nullable=True, index=True)
+    owner_user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    manager_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmbeddingCacheEntry(Base):
+    """Content-addressed chunk embeddings, reused when the same text is ingested again"""
+    __tablename__ = "embedding_cache"
+    
+    content_hash = Column(String(64), primary_key=True)  # sha256 of the chunk text
+    model = Column(String, primary_key=True)  # embedding model that produced the vector
+    embedding = Column(Vector(768), nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class GraphEntity(Base):
     """Graph entities extracted from documents"""
     __tablename__ = "graph_entities"
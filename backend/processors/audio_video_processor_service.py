@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from redis_pubsub import redis_pubsub
+from worker_runtime import run_worker
 from storage_config import storage_manager
 from config import settings
 from database import SessionLocal
@@ -11,6 +12,7 @@ from ollama import Client
 import traceback
 import tempfile
 from datetime import datetime, timezone
+from job_progress import record_file_failed, record_file_processed, settle_job
 
 
 class AudioVideoProcessorService:
@@ -89,17 +91,19 @@ class AudioVideoProcessorService:
                 return
             
             # Process this file
-            self.process_media(db, job, gcs_path)
+            progress = self.process_media(db, job, gcs_path)
             
             # Check if all files in the job have been processed
-            self._check_job_completion(db, job)
+            self._check_job_completion(db, job_id, progress)
             
             print(f"✅ Completed processing: {filename}")
             
         except Exception as e:
             print(f"❌ Error processing file {filename}: {e}")
             traceback.print_exc()
-            # Don't mark job as failed for single file errors
+            redis_pubsub.publish_job_event(job_id, "failed", filename, error=str(e))
+            # The job still finishes: COMPLETED with failures, or FAILED if nothing succeeded
+            self._record_failure(db, job_id)
         finally:
             db.close()
     
@@ -131,9 +135,10 @@ class AudioVideoProcessorService:
             
             print(f"Found {len(media_files)} media files to process")
             
+            progress = None
             for file_path in media_files:
                 try:
-                    self.process_media(db, job, file_path)
+                    progress = self.process_media(db, job, file_path) or progress
                 except Exception as e:
                     print(f"Error processing {file_path}: {e}")
                     traceback.print_exc()
@@ -141,7 +146,7 @@ class AudioVideoProcessorService:
             print(f"✅ Media processing completed for job {job_id}")
             
             # Check if all files have been processed
-            self._check_job_completion(db, job)
+            self._check_job_completion(db, job_id, progress)
             
         except Exception as e:
             print(f"Error in audio/video processor: {e}")
@@ -149,31 +154,33 @@ class AudioVideoProcessorService:
         finally:
             db.close()
     
-    def _check_job_completion(self, db, job):
+    def _check_job_completion(self, db, job_id, progress):
         """
-        Check if all files in the job have been processed
-        If yes, mark job as completed
+        Finish the job once all of its files have been processed or failed.
+        progress is what record_file_processed/record_file_failed returned;
+        no rows are counted.
         """
-        # Count documents created for this job
-        documents_processed = db.query(models.Document).filter(
-            models.Document.job_id == job.id
-        ).count()
+        if not progress:
+            return
         
-        print(f"📊 Job {job.id}: {documents_processed}/{job.total_files} files processed")
+        print(f"📊 Job {job_id}: {progress['processed_files']}/{progress['total_files']} files processed")
         
-        # Only mark as completed if all files are done
-        if documents_processed >= job.total_files:
-            if job.status != models.JobStatus.COMPLETED:
-                job.status = models.JobStatus.COMPLETED
-                job.completed_at = datetime.now(timezone.utc)
-                db.commit()
-                print(f"✅ Job {job.id} marked as COMPLETED")
-        elif documents_processed > 0:
-            # Some files processed, ensure status is PROCESSING
-            if job.status == models.JobStatus.QUEUED:
-                job.status = models.JobStatus.PROCESSING
-                job.started_at = job.started_at or datetime.now(timezone.utc)
-                db.commit()
+        # Only one worker wins the transition, so the event is published once
+        stage = settle_job(db, job_id, progress, "processed_files")
+        if stage:
+            db.commit()
+            print(f"✅ Job {job_id} finished: {stage} ({progress['failed_files']} failed file(s))")
+            redis_pubsub.publish_job_event(job_id, stage, failed_files=progress["failed_files"])
+    
+    def _record_failure(self, db, job_id):
+        """Count a failed file towards the job so it still reaches a final status."""
+        try:
+            db.rollback()
+            progress = record_file_failed(db, job_id)
+            db.commit()
+            self._check_job_completion(db, job_id, progress)
+        except Exception as e:
+            print(f"Could not record failed file for job {job_id}: {e}")
     
     def process_media(self, db, job, gcs_path: str):
         """
@@ -213,6 +220,7 @@ class AudioVideoProcessorService:
             transcription_path = gcs_path + f'{equal_prefix}transcription.txt'
             storage_manager.upload_text(transcription, transcription_path)
             print(f"✅ Transcription saved: {len(transcription)} characters")
+            redis_pubsub.publish_job_event(job.id, "extracted", filename)
             
             # Step 2: Translation (if Hindi)
             translated_text_path = None
@@ -243,6 +251,7 @@ class AudioVideoProcessorService:
                     # Cleanup
                     os.unlink(temp_trans.name)
                     os.unlink(translated_path)
+                    redis_pubsub.publish_job_event(job.id, "translated", filename)
                     
                     print(f"✅ Translation completed: {len(final_text)} characters")
                 except Exception as e:
@@ -256,6 +265,7 @@ class AudioVideoProcessorService:
             # Save summary to storage with naming convention
             summary_path = gcs_path + f'{equal_prefix}summary.txt'
             storage_manager.upload_text(summary, summary_path)
+            redis_pubsub.publish_job_event(job.id, "summarized", filename)
             
         finally:
             # Cleanup temp file
@@ -281,14 +291,11 @@ class AudioVideoProcessorService:
         print(f"🔢 Creating embeddings from transcription...")
         try:
             from vector_store import vectorise_and_store_alloydb
-            # Delete existing chunks for this document
-            db.query(models.DocumentChunk).filter(
-                models.DocumentChunk.document_id == document.id
-            ).delete(synchronize_session=False)
-            db.commit()
+            # Chunks from an earlier run are diffed, not deleted; only changes are re-embedded
             # Vectorize the final text (translated if Hindi, original if English)
             vectorise_and_store_alloydb(db, document.id, final_text, summary)
             print(f"✅ Embeddings created for audio transcription")
+            redis_pubsub.publish_job_event(job.id, "embedded", filename, document_id=document.id)
         except Exception as e:
             print(f"⚠️ Vectorization failed: {e}")
         
@@ -302,11 +309,12 @@ class AudioVideoProcessorService:
             "username": username
         })
         
-        # Update job progress
-        job.processed_files += 1
+        # Update job progress (atomic; concurrent workers cannot lose an increment)
+        progress = record_file_processed(db, job.id)
         db.commit()
         
         print(f"✅ Completed processing: {filename}")
+        return progress
     
     def transcribe_media(self, file_path: str, filename: str, is_hindi: bool = False) -> str:
         """
@@ -407,22 +415,10 @@ def main():
     print(f"📡 Using Redis Queues for true parallel processing")
     print(f"👂 Listening to queues: {settings.REDIS_QUEUE_AUDIO}, {settings.REDIS_QUEUE_VIDEO}")
     
-    service = AudioVideoProcessorService()
-    
-    # Listen to both audio and video queues
-    # Audio queue in background thread
-    import threading
-    audio_thread = threading.Thread(
-        target=redis_pubsub.listen_queue,
-        args=(settings.REDIS_QUEUE_AUDIO, service.process_job),
-        daemon=True
-    )
-    audio_thread.start()
-    
-    # Video queue in main thread (blocking)
-    redis_pubsub.listen_queue(
-        queue_name=settings.REDIS_QUEUE_VIDEO,
-        callback=service.process_job
+    # Both queues share one thread pool (see worker_runtime.py)
+    run_worker(
+        [settings.REDIS_QUEUE_AUDIO, settings.REDIS_QUEUE_VIDEO],
+        lambda: AudioVideoProcessorService().process_job
     )
 
 
@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from redis_pubsub import redis_pubsub
+from worker_runtime import run_worker
 from storage_config import storage_manager
 from config import settings
 from database import SessionLocal
@@ -21,6 +22,7 @@ import tempfile
 import traceback
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timezone
+from job_progress import record_file_failed, record_file_processed, settle_job
 from docling_core.types.doc.document import DoclingDocument
 from docling.chunking import HybridChunker
 
@@ -83,37 +85,37 @@ class DocumentProcessorService:
                 print(f"File {filename} already processed by another worker, skipping")
                 return
             
-            self.process_document(db, job, gcs_path)
-            
-            self._check_job_completion(db, job)
+            progress = self.process_document(db, job, gcs_path)
+            if progress:
+                # Jobs complete in the graph processor once every document has a graph
+                print(f"Job {job_id}: {progress['processed_files']}/{progress['total_files']} files processed")
             
             print(f"Completed processing: {filename}\n")
             
         except Exception as e:
             print(f"Error processing file {filename}: {e}")
             traceback.print_exc()
+            redis_pubsub.publish_job_event(job_id, "failed", filename, error=str(e))
+            self._record_failure(db, job_id)
         finally:
             db.close()
     
-    def _check_job_completion(self, db, job):
-        # Count documents created for this job
-        documents_processed = db.query(models.Document).filter(
-            models.Document.job_id == job.id
-        ).count()
-        
-        print(f"Job {job.id}: {documents_processed}/{job.total_files} files processed")
-        
-        if documents_processed >= job.total_files:
-            if job.status != models.JobStatus.PROCESSING:
-                job.status = models.JobStatus.PROCESSING
-                job.started_at = job.started_at or datetime.now(timezone.utc)
-                db.commit()
-                print(f"Job {job.id}: all files processed; awaiting graph processing")
-        elif documents_processed > 0:
-            if job.status == models.JobStatus.QUEUED:
-                job.status = models.JobStatus.PROCESSING
-                job.started_at = job.started_at or datetime.now(timezone.utc)
-                db.commit()
+    def _record_failure(self, db, job_id):
+        """
+        Count a failed file towards the job. Documents finish in the graph
+        processor, but if this was the last outstanding file no graph message
+        will follow, so the job is settled here too.
+        """
+        try:
+            db.rollback()
+            progress = record_file_failed(db, job_id)
+            stage = settle_job(db, job_id, progress, "graphed_files")
+            db.commit()
+            if stage:
+                print(f"Job {job_id} finished: {stage} ({progress['failed_files']} failed file(s))")
+                redis_pubsub.publish_job_event(job_id, stage, failed_files=progress["failed_files"])
+        except Exception as e:
+            print(f"Could not record failed file for job {job_id}: {e}")
     
     def process_document(self, db, job, gcs_path: str):
         print(f"\n🔄 Processing document: {gcs_path}")
@@ -222,6 +224,9 @@ class DocumentProcessorService:
             extracted_text_path = gcs_path.replace(suffix, f'{dash_prefix}extracted{extracted_ext}')
             storage_manager.upload_text(extracted_text, extracted_text_path)
             print(f"Saved extracted text to: {extracted_text_path}")
+            redis_pubsub.publish_job_event(job.id, "extracted", filename, language=detected_language)
+            if translated_text_path:
+                redis_pubsub.publish_job_event(job.id, "translated", filename)
             
             # Step 4: Generate summary
             print(f"Generating summary...")
@@ -250,6 +255,7 @@ class DocumentProcessorService:
             summary_path = gcs_path.replace(suffix, f'{dash_prefix}summary.txt')
             storage_manager.upload_text(summary, summary_path)
             print(f"Saved summary to: {summary_path}")
+            redis_pubsub.publish_job_event(job.id, "summarized", filename)
             
             # Step 5: Create/update document record
             document = db.query(models.Document).filter(
@@ -301,11 +307,7 @@ class DocumentProcessorService:
             print(f"DEBUG: About to vectorize document ID: {document.id}")  # ADD THIS
             print(f"DEBUG: Document object: {document}")
             
-            # Delete existing chunks
-            db.query(models.DocumentChunk).filter(
-                models.DocumentChunk.document_id == document.id
-            ).delete(synchronize_session=False)
-            db.commit()
+            # Existing chunks are diffed by vectorise_and_store_alloydb; only changes are re-embedded
 
             print(f"🔍 DEBUG: Calling vectorise_and_store_alloydb with document_id={document.id}")
             
@@ -338,6 +340,7 @@ class DocumentProcessorService:
             models.DocumentChunk.document_id == document.id
             ).count()
             print(f"VERIFICATION: Document {document.id} now has {chunk_count} chunks")
+            redis_pubsub.publish_job_event(job.id, "embedded", filename, document_id=document.id, chunks=chunk_count)
             
             # Step 7: Queue for graph processing
             print(f"Queuing for graph processing...")
@@ -354,11 +357,14 @@ class DocumentProcessorService:
             redis_pubsub.push_to_queue(settings.REDIS_QUEUE_GRAPH, graph_message)
             print(f"Pushed to graph queue: {settings.REDIS_QUEUE_GRAPH}")
             
+            progress = None
             if is_new_document:
-                job.processed_files += 1
+                # Atomic increment; concurrent workers cannot lose an update
+                progress = record_file_processed(db, job.id)
                 db.commit()
             
             print(f"Completed processing: {filename}\n")
+            return progress
             
         finally:
             if os.path.exists(temp_file):
@@ -376,11 +382,8 @@ def main():
     print("="*60)
     print(f"Now listening for messages...\n")
     
-    service = DocumentProcessorService()
-    redis_pubsub.listen_queue(
-        queue_name=settings.REDIS_QUEUE_DOCUMENT,
-        callback=service.process_job
-    )
+    # Thread/process pool, prefetch and SIGTERM drain: see worker_runtime.py
+    run_worker(settings.REDIS_QUEUE_DOCUMENT, lambda: DocumentProcessorService().process_job)
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from redis_pubsub import redis_pubsub
+from worker_runtime import run_worker
 from storage_config import storage_manager
 from config import settings
 from database import SessionLocal
@@ -15,6 +16,7 @@ from collections import defaultdict
 import unicodedata
 import re
 from datetime import datetime, timezone
+from job_progress import record_file_failed, record_file_graphed, settle_job
 import time
 
 
@@ -70,11 +72,17 @@ class GraphProcessorService:
             print(f"Exception: {repr(e)}")
             print(f"This likely means the document processor failed to process this file or GCS is unreachable.")
             print(f"Skipping graph processing for document {document_id}")
+            redis_pubsub.publish_job_event(job_id, "failed", None, document_id=document_id, error=repr(e))
+            self._record_failure(db, job_id)
+            db.close()
             return
         if not text or not text.strip():
             print(f"Extracted text for document {document_id} is empty or missing after download.")
             print(f"This likely means document processor produced no output or there was a storage issue.")
             print(f"Skipping graph processing for document {document_id}")
+            redis_pubsub.publish_job_event(job_id, "failed", None, document_id=document_id, error="empty text")
+            self._record_failure(db, job_id)
+            db.close()
             return
         
         try:
@@ -103,6 +111,10 @@ class GraphProcessorService:
             
             if not graph_documents:
                 print(f"No graph documents generated")
+                redis_pubsub.publish_job_event(
+                    job_id, "failed", None, document_id=document_id, error="no graph documents generated"
+                )
+                self._record_failure(db, job_id)
                 return
             
             nodes_count = len(graph_documents[0].nodes)
@@ -202,35 +214,45 @@ class GraphProcessorService:
             
             total_time = time.time() - job_start_time
             print(f"Graph building completed for document {document_id}")
+            redis_pubsub.publish_job_event(
+                job_id, "graphed", document.original_filename,
+                document_id=document_id, nodes=nodes_count, relationships=relationships_count
+            )
             print(f"Total graph processing time: {total_time:.2f} seconds")
             
-            # Check if this was the last document to be processed for this job
-            job = db.query(models.ProcessingJob).filter(models.ProcessingJob.id == job_id).first()
-            if job:
-                # Count how many documents have been fully processed (have graph entities)
-                documents_with_graphs = db.query(models.Document).join(
-                    models.GraphEntity,
-                    models.Document.id == models.GraphEntity.document_id
-                ).filter(
-                    models.Document.job_id == job_id
-                ).distinct().count()
-                
-                print(f"Job {job_id}: {documents_with_graphs}/{job.total_files} documents have graphs")
-                
-                # If all files have been graph-processed, mark job as completed
-                if documents_with_graphs >= job.total_files:
-                    job.status = models.JobStatus.COMPLETED
-                    job.completed_at = datetime.now(timezone.utc)
-                    db.commit()
-                    print(f"Job {job_id} marked as COMPLETED")
-                    print(f"Job completion latency from graph start: {total_time:.2f} seconds")
+            # Count this document once (atomic), then complete the job if it was the last one
+            progress = record_file_graphed(db, job_id, document_id)
+            # Once every file has a graph (or failed), finish the job (exactly once)
+            stage = settle_job(db, job_id, progress, "graphed_files")
+            db.commit()
+            if progress:
+                print(f"Job {job_id}: {progress['graphed_files']}/{progress['total_files']} documents have graphs")
+            if stage:
+                print(f"Job {job_id} finished: {stage} ({progress['failed_files']} failed file(s))")
+                print(f"Job completion latency from graph start: {total_time:.2f} seconds")
+                redis_pubsub.publish_job_event(job_id, stage, failed_files=progress["failed_files"])
             
         except Exception as e:
             print(f"Error in graph processor: {e}")
             traceback.print_exc()
+            redis_pubsub.publish_job_event(job_id, "failed", None, document_id=document_id, error=str(e))
+            self._record_failure(db, job_id)
         finally:
             db.close()
     
+    def _record_failure(self, db, job_id):
+        """Count a document whose graph failed so the job still reaches a final status."""
+        try:
+            db.rollback()
+            progress = record_file_failed(db, job_id)
+            stage = settle_job(db, job_id, progress, "graphed_files")
+            db.commit()
+            if stage:
+                print(f"Job {job_id} finished: {stage} ({progress['failed_files']} failed file(s))")
+                redis_pubsub.publish_job_event(job_id, stage, failed_files=progress["failed_files"])
+        except Exception as e:
+            print(f"Could not record failed graph for job {job_id}: {e}")
+    
     @staticmethod
     def _relationship_exists(db, source_id: str, target_id: str) -> bool:
         return db.query(models.GraphRelationship).filter(
@@ -379,13 +401,9 @@ def main():
     print(f"Using Redis Queue for true parallel processing")
     print(f"Listening to queue: {settings.REDIS_QUEUE_GRAPH}")
     
-    service = GraphProcessorService()
-    
-    # Listen to Redis queue (each worker gets different messages)
-    redis_pubsub.listen_queue(
-        queue_name=settings.REDIS_QUEUE_GRAPH,
-        callback=service.process_job
-    )
+    # Each message still goes to exactly one worker; WORKER_CONCURRENCY graph
+    # builds overlap their LLM and Neo4j waits (see worker_runtime.py)
+    run_worker(settings.REDIS_QUEUE_GRAPH, lambda: GraphProcessorService().process_job)
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from redis_pubsub import redis_pubsub
+from worker_runtime import run_worker
 from gcs_storage import gcs_storage
 from storage_config import storage_manager
 from config import settings
@@ -11,6 +12,7 @@ import models
 import traceback
 import tempfile
 from datetime import datetime, timezone, timedelta
+from job_progress import record_file_failed, record_file_processed, settle_job
 from moviepy import VideoFileClip
 import numpy as np
 import base64
@@ -106,17 +108,19 @@ class VideoProcessorService:
                 return
             
             # Process this file
-            self.process_video(db, job, gcs_path)
+            progress = self.process_video(db, job, gcs_path)
             
             # Check if all files in the job have been processed
-            self._check_job_completion(db, job)
+            self._check_job_completion(db, job_id, progress)
             
             print(f"✅ Completed processing: {filename}")
             
         except Exception as e:
             print(f"❌ Error processing file {filename}: {e}")
             traceback.print_exc()
-            # Don't mark job as failed for single file errors
+            redis_pubsub.publish_job_event(job_id, "failed", filename, error=str(e))
+            # The job still finishes: COMPLETED with failures, or FAILED if nothing succeeded
+            self._record_failure(db, job_id)
         finally:
             db.close()
     
@@ -148,9 +152,10 @@ class VideoProcessorService:
             
             print(f"Found {len(video_files)} video files to process")
             
+            progress = None
             for file_path in video_files:
                 try:
-                    self.process_video(db, job, file_path)
+                    progress = self.process_video(db, job, file_path) or progress
                 except Exception as e:
                     print(f"Error processing {file_path}: {e}")
                     traceback.print_exc()
@@ -158,7 +163,7 @@ class VideoProcessorService:
             print(f"✅ Video processing completed for job {job_id}")
             
             # Check if all files have been processed
-            self._check_job_completion(db, job)
+            self._check_job_completion(db, job_id, progress)
             
         except Exception as e:
             print(f"Error in video processor: {e}")
@@ -166,31 +171,33 @@ class VideoProcessorService:
         finally:
             db.close()
     
-    def _check_job_completion(self, db, job):
+    def _check_job_completion(self, db, job_id, progress):
         """
-        Check if all files in the job have been processed
-        If yes, mark job as completed
+        Finish the job once all of its files have been processed or failed.
+        progress is what record_file_processed/record_file_failed returned;
+        no rows are counted.
         """
-        # Count documents created for this job
-        documents_processed = db.query(models.Document).filter(
-            models.Document.job_id == job.id
-        ).count()
-        
-        print(f"📊 Job {job.id}: {documents_processed}/{job.total_files} files processed")
-        
-        # Only mark as completed if all files are done
-        if documents_processed >= job.total_files:
-            if job.status != models.JobStatus.COMPLETED:
-                job.status = models.JobStatus.COMPLETED
-                job.completed_at = datetime.now(timezone.utc)
-                db.commit()
-                print(f"✅ Job {job.id} marked as COMPLETED")
-        elif documents_processed > 0:
-            # Some files processed, ensure status is PROCESSING
-            if job.status == models.JobStatus.QUEUED:
-                job.status = models.JobStatus.PROCESSING
-                job.started_at = job.started_at or datetime.now(timezone.utc)
-                db.commit()
+        if not progress:
+            return
+        
+        print(f"📊 Job {job_id}: {progress['processed_files']}/{progress['total_files']} files processed")
+        
+        # Only one worker wins the transition, so the event is published once
+        stage = settle_job(db, job_id, progress, "processed_files")
+        if stage:
+            db.commit()
+            print(f"✅ Job {job_id} finished: {stage} ({progress['failed_files']} failed file(s))")
+            redis_pubsub.publish_job_event(job_id, stage, failed_files=progress["failed_files"])
+    
+    def _record_failure(self, db, job_id):
+        """Count a failed file towards the job so it still reaches a final status."""
+        try:
+            db.rollback()
+            progress = record_file_failed(db, job_id)
+            db.commit()
+            self._check_job_completion(db, job_id, progress)
+        except Exception as e:
+            print(f"Could not record failed file for job {job_id}: {e}")
     
     def format_timedelta(self, td):
         """
@@ -341,6 +348,7 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
             analysis_path = gcs_path + f'{equal_prefix}analysis.txt'
             storage_manager.upload_text(analysis, analysis_path)
             print(f"✅ Analysis saved: {len(analysis)} characters")
+            redis_pubsub.publish_job_event(job.id, "extracted", filename)
             
             # Step 3: Translation (if Hindi)
             translated_text_path = None
@@ -371,6 +379,7 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
                     # Cleanup
                     os.unlink(temp_trans.name)
                     os.unlink(translated_path)
+                    redis_pubsub.publish_job_event(job.id, "translated", filename)
                     
                     print(f"✅ Translation completed: {len(final_text)} characters")
                 except Exception as e:
@@ -384,6 +393,7 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
             # Save summary to GCS with naming convention
             summary_path = gcs_path + f'{equal_prefix}summary.txt'
             storage_manager.upload_text(summary, summary_path)
+            redis_pubsub.publish_job_event(job.id, "summarized", filename)
             
         finally:
             # Cleanup temp files
@@ -411,14 +421,11 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
         print(f"🔢 Creating embeddings from video analysis...")
         try:
             from vector_store import vectorise_and_store_alloydb
-            # Delete existing chunks for this document
-            db.query(models.DocumentChunk).filter(
-                models.DocumentChunk.document_id == document.id
-            ).delete(synchronize_session=False)
-            db.commit()
+            # Chunks from an earlier run are diffed, not deleted; only changes are re-embedded
             # Vectorize the final text (translated if Hindi, original if English)
             vectorise_and_store_alloydb(db, document.id, final_text, summary)
             print(f"✅ Embeddings created for video analysis")
+            redis_pubsub.publish_job_event(job.id, "embedded", filename, document_id=document.id)
         except Exception as e:
             print(f"⚠️ Vectorization failed: {e}")
         
@@ -432,11 +439,12 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
             "username": username
         })
         
-        # Update job progress
-        job.processed_files += 1
+        # Update job progress (atomic; concurrent workers cannot lose an increment)
+        progress = record_file_processed(db, job.id)
         db.commit()
         
         print(f"✅ Completed processing: {filename}")
+        return progress
     
     def generate_summary(self, text: str) -> str:
         """
@@ -461,8 +469,9 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
         # ===== PRODUCTION MODE: Use local LLM =====
         print(f"🔧 Using local LLM for summarization (PRODUCTION MODE)")
         try:
-            from ollama import Client
-            client = Client(host=settings.SUMMARY_LLM_URL)
+            from llm_clients import get_llm_clients
+            clients = get_llm_clients()
+            client = clients.ollama(settings.SUMMARY_LLM_URL)
             
             prompt = f"""Summarize the following video analysis in 200 words or less:
 
@@ -470,10 +479,11 @@ Provide a comprehensive analysis that a law enforcement officer would find usefu
 
 Summary:"""
             
-            response = client.chat(
-                model=settings.SUMMARY_LLM_MODEL,
-                messages=[{'role': 'user', 'content': prompt}],
-            )
+            with clients.slot(clients.ollama_key(settings.SUMMARY_LLM_URL)):
+                response = client.chat(
+                    model=settings.SUMMARY_LLM_MODEL,
+                    messages=[{'role': 'user', 'content': prompt}],
+                )
             return response['message']['content'].strip()
         except Exception as e:
             print(f"⚠️ Summary generation error: {e}")
@@ -487,13 +497,8 @@ def main():
     print(f"🎬 Frame extraction rate: {SAVING_FRAMES_PER_SECOND} fps (1 frame every ~{1/SAVING_FRAMES_PER_SECOND:.1f} seconds)")
     print(f"👂 Listening to queue: {settings.REDIS_QUEUE_VIDEO}")
     
-    service = VideoProcessorService()
-    
-    # Listen to video queue (blocking)
-    redis_pubsub.listen_queue(
-        queue_name=settings.REDIS_QUEUE_VIDEO,
-        callback=service.process_job
-    )
+    # Thread/process pool, prefetch and SIGTERM drain: see worker_runtime.py
+    run_worker(settings.REDIS_QUEUE_VIDEO, lambda: VideoProcessorService().process_job)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,118 @@
+"""
+Role-based access control.
+
+Listing and retrieval queries get their RBAC filter from one scope compiler,
+`scope_clause`, which turns a user into a SQL condition on an owner column:
+- Admin: nothing (admins manage users, not documents)
+- Analyst: owner == the analyst
+- Manager: owner is the manager or one of their analysts, as a subquery over
+  users (no Python-side ID lists, no lazy `user.analysts` load), or as an OR
+  on the denormalised manager_id column where a table has one
+  (document_chunks, document_vectors)
+
+Jobs, documents, chunks, centroids and the graph endpoint all filter through
+it. With RBAC_SCOPE_CACHE_TTL_SECONDS > 0 a manager's team is instead read
+from a short-TTL in-process cache of accessible user IDs; user management
+endpoints call invalidate_scope_cache on reassignment or deletion.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, false, or_, select, update
 from sqlalchemy.orm import Query, Session
 
+from config import settings
 import models
 
 
+class ScopeCache:
+    """Short-TTL cache of the user IDs whose data each manager may read."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[int, Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[List[int]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[0]
+
+    def put(self, user_id: int, user_ids: List[int]) -> None:
+        with self._lock:
+            self._entries[user_id] = (user_ids, time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self, *user_ids: Optional[int]) -> None:
+        """Drop the given users' scopes; with no IDs, drop everything."""
+        with self._lock:
+            if not user_ids:
+                self._entries.clear()
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+_scope_cache = ScopeCache(settings.RBAC_SCOPE_CACHE_TTL_SECONDS)
+
+
+def invalidate_scope_cache(*user_ids: Optional[int]) -> None:
+    """Call after changing a team: pass the affected managers (or nothing to clear all)."""
+    _scope_cache.invalidate(*user_ids)
+
+
+def team_user_ids_subquery(manager_id: int):
+    """SELECT of the manager's own ID and their analysts' IDs."""
+    return select(models.User.id).where(
+        or_(models.User.id == manager_id, models.User.manager_id == manager_id)
+    )
+
+
+def accessible_user_ids(db: Session, user: models.User) -> List[int]:
+    """IDs of the users whose jobs `user` may read, through the scope cache."""
+    if user.rbac_level == models.RBACLevel.ANALYST:
+        return [user.id]
+    if user.rbac_level != models.RBACLevel.MANAGER:
+        return []
+    
+    user_ids = _scope_cache.get(user.id)
+    if user_ids is None:
+        user_ids = [row[0] for row in db.execute(team_user_ids_subquery(user.id))]
+        _scope_cache.put(user.id, user_ids)
+    return user_ids
+
+
+def scope_clause(
+    user: models.User,
+    owner_column,
+    manager_column=None,
+    db: Optional[Session] = None
+):
+    """
+    SQL condition restricting `owner_column` (a user ID column) to what
+    `user` may read; see the module docstring.
+    
+    manager_column: denormalised manager of the owner, if the table has one.
+    db: enables the scope cache (when RBAC_SCOPE_CACHE_TTL_SECONDS > 0).
+    """
+    if user.rbac_level == models.RBACLevel.ANALYST:
+        return owner_column == user.id
+    
+    if user.rbac_level == models.RBACLevel.MANAGER:
+        if manager_column is not None:
+            return or_(owner_column == user.id, manager_column == user.id)
+        if db is not None and _scope_cache.ttl_seconds > 0:
+            return owner_column.in_(accessible_user_ids(db, user))
+        return owner_column.in_(team_user_ids_subquery(user.id))
+    
+    # Admins (and unknown roles) have no access to jobs or documents
+    return false()
+
+
 def get_analyst_manager(db: Session, analyst: models.User) -> models.User:
     """Get the manager of an analyst"""
     if analyst.rbac_level != models.RBACLevel.ANALYST:
@@ -62,6 +172,36 @@ def user_has_document_access(user: models.User, document: models.Document) -> bo
     return user_has_job_access(user, document.job)
 
 
+def denied_document_ids(db: Session, user: models.User, document_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Set-based user_has_document_access for many documents in one statement.
+    
+    Returns {document_id: reason} for every ID the user may not read, with
+    reason "not_found" or "forbidden"; an empty dict means all are allowed.
+    """
+    document_ids = list(dict.fromkeys(document_ids))
+    if not document_ids:
+        return {}
+    
+    job = models.ProcessingJob
+    allowed = scope_clause(user, job.user_id, db=db)
+    rows = db.query(
+        models.Document.id,
+        and_(job.id.isnot(None), allowed)
+    ).outerjoin(
+        job, models.Document.job_id == job.id
+    ).filter(models.Document.id.in_(document_ids)).all()
+    
+    found = {row[0]: bool(row[1]) for row in rows}
+    denied = {}
+    for document_id in document_ids:
+        if document_id not in found:
+            denied[document_id] = "not_found"
+        elif not found[document_id]:
+            denied[document_id] = "forbidden"
+    return denied
+
+
 def filter_jobs_scope(query: Query, user: models.User) -> Query:
     """
     Apply RBAC filters to a ProcessingJob query.
@@ -69,23 +209,13 @@ def filter_jobs_scope(query: Query, user: models.User) -> Query:
     - Manager: All jobs from their analysts + their own jobs
     - Analyst: Only their own jobs
     """
-    if user.rbac_level == models.RBACLevel.ADMIN:
-        # Admins have no access to jobs
-        return query.filter(models.ProcessingJob.id == None)
-    
-    if user.rbac_level == models.RBACLevel.ANALYST:
-        # Analysts see only their own jobs
-        return query.filter(models.ProcessingJob.user_id == user.id)
-    
-    if user.rbac_level == models.RBACLevel.MANAGER:
-        # Managers see their own jobs and their analysts' jobs
-        # Get all analyst IDs under this manager
-        analyst_ids = [analyst.id for analyst in user.analysts]
-        analyst_ids.append(user.id)  # Include manager's own jobs
-        
-        return query.filter(models.ProcessingJob.user_id.in_(analyst_ids))
-    
-    return query.filter(models.ProcessingJob.id == None)
+    return query.filter(scope_clause(user, models.ProcessingJob.user_id, db=query.session))
+
+
+def job_ids_in_scope(user: models.User, db: Optional[Session] = None):
+    """SELECT of the IDs of the jobs `user` may read, for use as a subquery."""
+    job = models.ProcessingJob
+    return select(job.id).where(scope_clause(user, job.user_id, db=db))
 
 
 def filter_documents_scope(query: Query, user: models.User) -> Query:
@@ -93,22 +223,84 @@ def filter_documents_scope(query: Query, user: models.User) -> Query:
     Apply RBAC filters to a Document query.
     Documents are filtered via their associated jobs.
     """
-    if user.rbac_level == models.RBACLevel.ADMIN:
-        return query.filter(models.Document.id == None)
+    return query.filter(models.Document.job_id.in_(job_ids_in_scope(user, query.session)))
+
+
+def chunk_ownership(db: Session, document_id: int) -> dict:
+    """
+    Ownership columns to stamp on a document's chunks at ingest:
+    job_id, owner_user_id (job owner) and manager_id (the owner's manager).
+    """
+    row = db.query(
+        models.Document.job_id,
+        models.ProcessingJob.user_id,
+        models.User.manager_id
+    ).join(
+        models.ProcessingJob, models.Document.job_id == models.ProcessingJob.id
+    ).join(
+        models.User, models.ProcessingJob.user_id == models.User.id
+    ).filter(models.Document.id == document_id).first()
     
-    if user.rbac_level == models.RBACLevel.ANALYST:
-        # Filter to documents from jobs owned by this analyst
-        return query.join(models.ProcessingJob).filter(
-            models.ProcessingJob.user_id == user.id
-        )
+    if not row:
+        return {"job_id": None, "owner_user_id": None, "manager_id": None}
+    return {"job_id": row[0], "owner_user_id": row[1], "manager_id": row[2]}
+
+
+def filter_owned_rows(query: Query, user: Optional[models.User], model=models.DocumentChunk) -> Query:
+    """
+    Apply RBAC to a query on a table with denormalised ownership columns
+    (owner_user_id, manager_id): document_chunks or document_vectors.
+    - No user / Admin: unfiltered (retrieval is not restricted for admins)
+    - Manager: their own rows and their analysts' rows
+    - Analyst: only their own rows
+    """
+    if user is None or user.rbac_level == models.RBACLevel.ADMIN:
+        return query
     
-    if user.rbac_level == models.RBACLevel.MANAGER:
-        # Filter to documents from jobs owned by manager or their analysts
-        analyst_ids = [analyst.id for analyst in user.analysts]
-        analyst_ids.append(user.id)
-        
-        return query.join(models.ProcessingJob).filter(
-            models.ProcessingJob.user_id.in_(analyst_ids)
-        )
+    return query.filter(scope_clause(user, model.owner_user_id, model.manager_id))
+
+
+def sync_chunk_ownership(
+    db: Session,
+    owner_user_id: Optional[int] = None,
+    only_missing: bool = False
+) -> int:
+    """
+    Recompute denormalised ownership on document_chunks and document_vectors
+    from documents/jobs/users.
+    
+    - owner_user_id: only refresh rows owned by this user (e.g. after an
+      analyst is reassigned to another manager)
+    - only_missing: only fill rows that have never been stamped (backfill)
     
-    return query.filter(models.Document.id == None)
+    The caller commits. Returns the number of rows updated.
+    """
+    updated = 0
+    for table in (models.DocumentChunk.__table__, models.DocumentVector.__table__):
+        owner = (
+            select(models.ProcessingJob.user_id)
+            .where(models.ProcessingJob.id == models.Document.job_id)
+            .where(models.Document.id == table.c.document_id)
+            .scalar_subquery()
+        )
+        job = (
+            select(models.Document.job_id)
+            .where(models.Document.id == table.c.document_id)
+            .scalar_subquery()
+        )
+        manager = (
+            select(models.User.manager_id)
+            .where(models.User.id == models.ProcessingJob.user_id)
+            .where(models.ProcessingJob.id == models.Document.job_id)
+            .where(models.Document.id == table.c.document_id)
+            .scalar_subquery()
+        )
+        
+        stmt = update(table).values(job_id=job, owner_user_id=owner, manager_id=manager)
+        if owner_user_id is not None:
+            stmt = stmt.where(table.c.owner_user_id == owner_user_id)
+        if only_missing:
+            stmt = stmt.where(table.c.job_id.is_(None))
+        
+        updated += db.execute(stmt).rowcount
+    return updated
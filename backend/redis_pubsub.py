@@ -1,9 +1,19 @@
 import redis
 import json
-from typing import Dict, Any, Callable
+import time
+import uuid
+from typing import Dict, Any, Callable, Optional
 from config import settings
+from fair_queue import estimate_cost, is_fair_queue, push_fair, tenant_of
 import threading
 
+# Per-job progress events: sentinel:job-events:<job_id> (see job_events.py)
+JOB_EVENTS_PREFIX = "sentinel:job-events:"
+
+
+def job_events_channel(job_id: str) -> str:
+    return f"{JOB_EVENTS_PREFIX}{job_id}"
+
 
 class RedisPubSub:
     
@@ -42,18 +52,58 @@ class RedisPubSub:
         }
         return self.publish(channel, message)
     
+    def publish_job_event(self, job_id: str, stage: str, filename: Optional[str] = None, **details) -> int:
+        """
+        Publish a progress event for one file of a job (stage: extracted,
+        translated, summarized, embedded, graphed, failed) or for the whole
+        job (stage: completed, no filename). Never raises: progress reporting
+        must not fail processing.
+        """
+        message = {
+            "job_id": job_id,
+            "stage": stage,
+            "filename": filename,
+            "timestamp": time.time(),
+            **details
+        }
+        try:
+            return self.publish(job_events_channel(job_id), message)
+        except redis.RedisError as e:
+            print(f"Could not publish job event {stage} for {job_id}: {e}")
+            return 0
+    
     def push_to_queue(self, queue_name: str, message: Dict[str, Any]) -> int:
-        """Push message to Redis queue (LIST) for work distribution"""
-        message_json = json.dumps(message)
+        """
+        Push message to Redis queue (LIST) for work distribution. Messages
+        for the tenant-fair upload queues go to their tenant's sub-queue
+        (see fair_queue.py).
+        """
+        # Reliable consumers count delivery attempts per message_id
+        message_json = json.dumps({
+            **message,
+            "message_id": message.get("message_id") or uuid.uuid4().hex,
+            "enqueued_at": time.time()
+        })
+        if is_fair_queue(queue_name) and message.get("job_id"):
+            return push_fair(self.redis_client, queue_name, message_json, tenant_of(message["job_id"]))
         return self.redis_client.lpush(queue_name, message_json)
     
-    def push_file_to_queue(self, job_id: str, gcs_path: str, filename: str, queue_name: str) -> int:
+    def push_file_to_queue(
+        self,
+        job_id: str,
+        gcs_path: str,
+        filename: str,
+        queue_name: str,
+        size_bytes: Optional[int] = None
+    ) -> int:
         """Push file to queue for parallel processing by multiple workers"""
         message = {
             "job_id": job_id,
             "gcs_path": gcs_path,
             "filename": filename,
-            "action": "process_file"
+            "action": "process_file",
+            "size_bytes": size_bytes,
+            "cost": estimate_cost(filename, size_bytes)
         }
         return self.push_to_queue(queue_name, message)
     
@@ -90,7 +140,16 @@ class RedisPubSub:
         """
         Listen to Redis queue (blocking pop) for work distribution
         Each message is consumed by only ONE worker (true parallelism)
+
+        With QUEUE_RELIABLE the message stays in this worker's processing
+        list until the callback returns, and is re-delivered if the worker
+        dies or the callback raises (see reliable_queue.py).
         """
+        if settings.QUEUE_RELIABLE:
+            from fair_queue import open_reliable_queue
+            open_reliable_queue(self.redis_client, queue_name).run(callback)
+            return
+
         print(f"Listening to queue: {queue_name}")
         
         while True:
@@ -0,0 +1,296 @@
+"""
+At-least-once work queue on top of the Redis lists the processors use.
+
+listen_queue used BRPOP, so a message was gone as soon as a worker popped it:
+a worker killed mid-Docling lost the file and left its job in PROCESSING
+forever. In reliable mode a worker instead BLMOVEs each message into its own
+processing list, `<queue>:processing:<worker_id>`, and removes it from there
+(ack) only after the callback returns.
+
+- Heartbeats: every worker refreshes `<queue>:heartbeat:<worker_id>` with a
+  TTL of QUEUE_VISIBILITY_TIMEOUT_SECONDS from a background thread and is
+  listed in `<queue>:workers`.
+- Redelivery: workers periodically look for registered workers whose
+  heartbeat has expired and LMOVE their in-flight messages back to the head
+  of the queue (atomic per message, so two reapers never duplicate one).
+- Attempts: deliveries are counted per message in `<queue>:attempts`; a
+  message delivered more than QUEUE_MAX_ATTEMPTS times, or whose callback
+  raised that many times, goes to the dead-letter list `<queue>:dead`.
+
+Producers keep using redis_pubsub.push_to_queue, which stamps a message_id.
+
+Usage:
+    from reliable_queue import ReliableQueue
+
+    ReliableQueue(redis_client, settings.REDIS_QUEUE_DOCUMENT).run(service.process_job)
+
+    python reliable_queue.py status document_queue
+    python reliable_queue.py requeue-dead document_queue
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from redis.exceptions import RedisError
+
+from config import settings
+
+
+def _message_key(raw: str) -> str:
+    """message_id stamped by push_to_queue, or a hash of the payload for older messages."""
+    try:
+        message_id = json.loads(raw).get("message_id")
+    except (ValueError, AttributeError):
+        message_id = None
+    return message_id or hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReliableQueue:
+    """One worker's view of a Redis list queue with in-flight tracking."""
+
+    def __init__(
+        self,
+        redis_client,
+        queue_name: str,
+        worker_id: Optional[str] = None,
+        visibility_timeout: Optional[int] = None,
+        max_attempts: Optional[int] = None
+    ):
+        self.redis = redis_client
+        self.queue_name = queue_name
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.visibility_timeout = max(3, visibility_timeout or settings.QUEUE_VISIBILITY_TIMEOUT_SECONDS)
+        self.max_attempts = max(1, max_attempts or settings.QUEUE_MAX_ATTEMPTS)
+        self.processing_list = f"{queue_name}:processing:{self.worker_id}"
+        self.heartbeat_key = f"{queue_name}:heartbeat:{self.worker_id}"
+        self.workers_key = f"{queue_name}:workers"
+        self.attempts_key = f"{queue_name}:attempts"
+        self.dead_letter_list = f"{queue_name}:dead"
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    # --- worker lifecycle -------------------------------------------------
+
+    def register(self) -> None:
+        self.heartbeat()
+
+    def heartbeat(self) -> None:
+        # Re-register too: a reaper drops a worker that missed one heartbeat
+        # from the workers set, and it would never be reaped again
+        pipe = self.redis.pipeline()
+        pipe.set(self.heartbeat_key, str(time.time()), ex=self.visibility_timeout)
+        pipe.sadd(self.workers_key, self.worker_id)
+        pipe.execute()
+
+    def start_heartbeat(self) -> None:
+        """Keep this worker's lease alive and reap dead workers in a daemon thread."""
+        self.register()
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, name=f"heartbeat-{self.queue_name}", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def stop(self) -> None:
+        """Stop heartbeating and hand any in-flight messages back to the queue."""
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join(timeout=5)
+        try:
+            self._requeue_worker(self.worker_id)
+            self.redis.delete(self.heartbeat_key)
+        except RedisError as e:
+            print(f"Could not release in-flight messages of {self.worker_id}: {e}")
+
+    def _heartbeat_loop(self) -> None:
+        interval = self.visibility_timeout / 3
+        while not self._stop.wait(interval):
+            try:
+                self.heartbeat()
+                self.requeue_expired()
+            except RedisError as e:
+                print(f"Heartbeat for {self.worker_id} failed: {e}")
+
+    # --- messages ---------------------------------------------------------
+
+    def fetch(self, timeout: float = 1) -> Optional[str]:
+        """
+        Move the next message into this worker's processing list and return
+        it (raw JSON), or None on timeout. Messages over the attempt limit
+        are dead-lettered here and not returned.
+        """
+        raw = self.redis.blmove(self.queue_name, self.processing_list, timeout, src="RIGHT", dest="LEFT")
+        if raw is None:
+            return None
+        return self._claim(raw)
+
+    def _claim(self, raw) -> Optional[str]:
+        """Count a delivery of a message now in the processing list."""
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        attempts = self.redis.hincrby(self.attempts_key, _message_key(raw), 1)
+        if attempts > self.max_attempts:
+            self.dead_letter(raw, f"delivered {attempts - 1} times without an ack")
+            return None
+        return raw
+
+    def ack(self, raw: str) -> None:
+        pipe = self.redis.pipeline()
+        pipe.lrem(self.processing_list, 1, raw)
+        pipe.hdel(self.attempts_key, _message_key(raw))
+        pipe.execute()
+
+    def retry(self, raw: str, error: str) -> None:
+        """Callback failed: put the message back at the head of the queue (or dead-letter it)."""
+        attempts = int(self.redis.hget(self.attempts_key, _message_key(raw)) or 0)
+        if attempts >= self.max_attempts:
+            self.dead_letter(raw, error)
+            return
+        pipe = self.redis.pipeline()
+        pipe.lrem(self.processing_list, 1, raw)
+        pipe.rpush(self.queue_name, raw)
+        pipe.execute()
+
+    def dead_letter(self, raw: str, reason: str) -> None:
+        entry = json.dumps({
+            "message": raw,
+            "reason": reason,
+            "worker_id": self.worker_id,
+            "failed_at": time.time(),
+        })
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.dead_letter_list, entry)
+        pipe.lrem(self.processing_list, 1, raw)
+        pipe.hdel(self.attempts_key, _message_key(raw))
+        pipe.execute()
+        print(f"⚠️  Dead-lettered message from {self.queue_name}: {reason}")
+
+    def requeue_expired(self) -> int:
+        """Return in-flight messages of workers whose heartbeat expired to the queue."""
+        moved = 0
+        for worker_id in self.redis.smembers(self.workers_key):
+            if isinstance(worker_id, bytes):
+                worker_id = worker_id.decode("utf-8")
+            if worker_id == self.worker_id:
+                continue
+            if self.redis.exists(f"{self.queue_name}:heartbeat:{worker_id}"):
+                continue
+            moved += self._requeue_worker(worker_id)
+        if moved:
+            print(f"✅ Re-delivered {moved} message(s) from expired workers on {self.queue_name}")
+        return moved
+
+    def _requeue_worker(self, worker_id: str) -> int:
+        processing_list = f"{self.queue_name}:processing:{worker_id}"
+        moved = 0
+        # fetch pushes to the LEFT of the processing list, so the oldest message is
+        # on its right. Moving newest-first (LEFT) onto the consuming end of the
+        # queue (RIGHT) leaves the oldest message next in line.
+        while self.redis.lmove(processing_list, self.queue_name, src="LEFT", dest="RIGHT") is not None:
+            moved += 1
+        self.redis.srem(self.workers_key, worker_id)
+        return moved
+
+    # --- consumer loop ----------------------------------------------------
+
+    def handle(self, raw: str, callback: Callable[[Dict[str, Any]], None]) -> bool:
+        """Run the callback on a fetched message, then ack, retry or dead-letter it."""
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding message: {e}")
+            self.dead_letter(raw, f"invalid JSON: {e}")
+            return False
+        try:
+            callback(data)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            traceback.print_exc()
+            self.retry(raw, str(e))
+            return False
+        self.ack(raw)
+        return True
+
+    def run(self, callback: Callable[[Dict[str, Any]], None], stop_event: Optional[threading.Event] = None) -> None:
+        """Process messages until stop_event is set (or KeyboardInterrupt)."""
+        stop_event = stop_event or threading.Event()
+        self.start_heartbeat()
+        print(f"Listening to queue: {self.queue_name} (reliable, worker {self.worker_id})")
+        try:
+            while not stop_event.is_set():
+                try:
+                    raw = self.fetch(timeout=1)
+                except RedisError as e:
+                    print(f"Error in queue listener: {e}")
+                    time.sleep(1)
+                    continue
+                if raw is not None:
+                    self.handle(raw, callback)
+        except KeyboardInterrupt:
+            print("\nShutting down worker...")
+        finally:
+            self.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        workers = [
+            worker_id.decode("utf-8") if isinstance(worker_id, bytes) else worker_id
+            for worker_id in self.redis.smembers(self.workers_key)
+        ]
+        in_flight = {
+            worker_id: self.redis.llen(f"{self.queue_name}:processing:{worker_id}")
+            for worker_id in workers
+        }
+        return {
+            "queue": self.queue_name,
+            "pending": self.redis.llen(self.queue_name),
+            "in_flight": sum(in_flight.values()),
+            "workers": {
+                worker_id: {
+                    "in_flight": count,
+                    "alive": bool(self.redis.exists(f"{self.queue_name}:heartbeat:{worker_id}")),
+                }
+                for worker_id, count in in_flight.items()
+            },
+            "dead_letters": self.redis.llen(self.dead_letter_list),
+        }
+
+    def requeue_dead_letters(self) -> int:
+        """Move every dead-lettered message back to the queue with a fresh attempt count."""
+        moved = 0
+        while True:
+            entry = self.redis.rpop(self.dead_letter_list)
+            if entry is None:
+                return moved
+            raw = json.loads(entry)["message"]
+            pipe = self.redis.pipeline()
+            pipe.hdel(self.attempts_key, _message_key(raw))
+            pipe.lpush(self.queue_name, raw)
+            pipe.execute()
+            moved += 1
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect reliable work queues")
+    parser.add_argument("command", choices=["status", "requeue-expired", "requeue-dead"])
+    parser.add_argument("queue", help="queue name, e.g. settings.REDIS_QUEUE_DOCUMENT")
+    args = parser.parse_args()
+
+    from fair_queue import TenantFairQueue, is_fair_queue
+    from redis_pubsub import redis_pubsub
+
+    queue_class = TenantFairQueue if is_fair_queue(args.queue) else ReliableQueue
+    queue = queue_class(redis_pubsub.redis_client, args.queue, worker_id="cli")
+    if args.command == "status":
+        print(json.dumps(queue.get_stats(), indent=2))
+    elif args.command == "requeue-expired":
+        print(f"Re-delivered {queue.requeue_expired()} message(s)")
+    else:
+        print(f"Requeued {queue.requeue_dead_letters()} dead-lettered message(s)")
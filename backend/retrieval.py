@@ -0,0 +1,77 @@
+"""
+Result fusion and re-ranking helpers for RAG retrieval.
+"""
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[Sequence[Tuple[Any, Any]]],
+    key=lambda item: item.id,
+    rrf_k: int = 60
+) -> List[Tuple[Any, float]]:
+    """
+    Fuse several ranked result lists with Reciprocal Rank Fusion.
+
+    Each list holds (item, raw_score) pairs, best first. An item's fused score
+    is the sum of 1 / (rrf_k + rank) over the lists it appears in, so only
+    ranks matter and lexical / vector scores need no calibration.
+    Returns (item, fused_score) pairs, best first.
+    """
+    fused: Dict[Hashable, float] = {}
+    items: Dict[Hashable, Any] = {}
+    for ranked in ranked_lists:
+        for rank, (item, _) in enumerate(ranked, start=1):
+            item_key = key(item)
+            items.setdefault(item_key, item)
+            fused[item_key] = fused.get(item_key, 0.0) + 1.0 / (rrf_k + rank)
+
+    ordered = sorted(fused.items(), key=lambda entry: entry[1], reverse=True)
+    return [(items[item_key], score) for item_key, score in ordered]
+
+
+def mmr_select(
+    relevance: Sequence[float],
+    embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    duplicate_threshold: Optional[float] = None
+) -> List[int]:
+    """
+    Pick k diverse candidates with Maximal Marginal Relevance.
+
+    `relevance` holds one score per candidate (higher is better) and
+    `embeddings` the candidates' vectors as an (n, d) matrix; all-zero rows
+    (no embedding) count as dissimilar to everything. Each step takes the
+    candidate maximising
+        lambda_mult * relevance - (1 - lambda_mult) * max cosine to the picked ones
+    using one pairwise similarity matrix, so the loop is O(k) vector ops.
+    Candidates whose cosine to a picked one reaches `duplicate_threshold` are
+    dropped outright (overlapping chunks, document vs summary copies).
+    Returns candidate indexes in pick order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(n, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    similarity = matrix @ matrix.T
+
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+    while len(selected) < k and available.any():
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        max_similarity = np.maximum(max_similarity, similarity[pick])
+        if duplicate_threshold is not None:
+            available &= similarity[pick] < duplicate_threshold
+    return selected
@@ -0,0 +1,133 @@
+"""
+Redelivery and dead-lettering tests for reliable_queue.ReliableQueue.
+
+Runs against fakeredis, so no Redis server is needed. Worker death is
+simulated by deleting the worker's heartbeat key, which is what its TTL
+expiring looks like to the other workers.
+
+Usage:
+    pip install fakeredis
+    python -m pytest test_reliable_queue.py
+    python test_reliable_queue.py
+"""
+import json
+
+import fakeredis
+
+from reliable_queue import ReliableQueue
+
+QUEUE = "test_queue"
+
+
+def _queue(redis_client, worker_id: str, max_attempts: int = 3) -> ReliableQueue:
+    queue = ReliableQueue(redis_client, QUEUE, worker_id=worker_id, visibility_timeout=30, max_attempts=max_attempts)
+    queue.register()
+    return queue
+
+
+def _push(redis_client, message_id: str) -> str:
+    raw = json.dumps({"message_id": message_id, "job_id": "manager/analyst/job"})
+    redis_client.lpush(QUEUE, raw)
+    return raw
+
+
+def _kill(queue: ReliableQueue) -> None:
+    queue.redis.delete(queue.heartbeat_key)
+
+
+def test_redelivers_messages_of_dead_worker():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    dying, survivor = _queue(redis_client, "dying"), _queue(redis_client, "survivor")
+    raw = _push(redis_client, "m1")
+
+    assert dying.fetch(timeout=0.1) == raw
+    assert redis_client.llen(QUEUE) == 0
+    _kill(dying)
+
+    assert survivor.requeue_expired() == 1
+    assert redis_client.llen(dying.processing_list) == 0
+    assert not redis_client.sismember(survivor.workers_key, "dying")
+
+    assert survivor.fetch(timeout=0.1) == raw
+    assert redis_client.hget(survivor.attempts_key, "m1") == "2"
+    survivor.ack(raw)
+    assert redis_client.llen(survivor.processing_list) == 0
+    assert redis_client.hget(survivor.attempts_key, "m1") is None
+
+
+def test_requeue_keeps_delivery_order():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    dying, survivor = _queue(redis_client, "dying"), _queue(redis_client, "survivor")
+    # Prefetch: several messages in flight at once, plus one not yet delivered
+    prefetched = [_push(redis_client, f"m{i}") for i in range(3)]
+    waiting = _push(redis_client, "m-waiting")
+    assert [dying.fetch(timeout=0.1) for _ in prefetched] == prefetched
+    _kill(dying)
+
+    assert survivor.requeue_expired() == 3
+    # Re-delivered oldest first, ahead of the message that was never delivered
+    assert [survivor.fetch(timeout=0.1) for _ in range(4)] == prefetched + [waiting]
+
+
+def test_dead_letters_after_max_attempts():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    reaper = _queue(redis_client, "reaper", max_attempts=2)
+    raw = _push(redis_client, "m2")
+
+    for attempt in range(2):
+        worker = _queue(redis_client, f"worker-{attempt}", max_attempts=2)
+        assert worker.fetch(timeout=0.1) == raw
+        _kill(worker)
+        assert reaper.requeue_expired() == 1
+
+    # Third delivery is over the limit: dead-lettered instead of returned
+    assert reaper.fetch(timeout=0.1) is None
+    assert redis_client.llen(QUEUE) == 0
+    assert redis_client.llen(reaper.processing_list) == 0
+    entry = json.loads(redis_client.lindex(reaper.dead_letter_list, 0))
+    assert entry["message"] == raw
+    assert "delivered 2 times" in entry["reason"]
+    assert redis_client.hget(reaper.attempts_key, "m2") is None
+
+
+def test_dead_letters_after_repeated_callback_failures():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    worker = _queue(redis_client, "worker", max_attempts=2)
+    raw = _push(redis_client, "m3")
+
+    def fail(message):
+        raise RuntimeError("boom")
+
+    for _ in range(2):
+        assert worker.handle(worker.fetch(timeout=0.1), fail) is False
+    assert redis_client.llen(QUEUE) == 0
+    entry = json.loads(redis_client.lindex(worker.dead_letter_list, 0))
+    assert entry["message"] == raw
+    assert entry["reason"] == "boom"
+
+
+def test_heartbeat_re_registers_reaped_worker():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    slow, reaper = _queue(redis_client, "slow"), _queue(redis_client, "reaper")
+    raw = _push(redis_client, "m4")
+    assert slow.fetch(timeout=0.1) == raw
+
+    # One missed heartbeat: the message is redelivered and the worker unregistered
+    _kill(slow)
+    reaper.requeue_expired()
+    assert not redis_client.sismember(reaper.workers_key, "slow")
+
+    # The worker comes back and picks up new work; if it dies now it must be reaped again
+    slow.heartbeat()
+    assert redis_client.sismember(reaper.workers_key, "slow")
+    assert slow.fetch(timeout=0.1) == raw
+    _kill(slow)
+    assert reaper.requeue_expired() == 1
+    assert redis_client.llen(QUEUE) == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,70 @@
+"""
+MMR re-ranking tests for VectorStore.diverse_search.
+
+The search itself is stubbed: diverse_search only re-ranks the candidates
+similarity_search returns, so no database or embedding server is needed.
+
+Usage:
+    python -m pytest test_vector_store.py
+    python test_vector_store.py
+"""
+import numpy as np
+
+from config import settings
+from vector_store import VectorStore
+
+
+def _store(candidates, query_vector) -> VectorStore:
+    store = VectorStore.__new__(VectorStore)
+    store.similarity_search = lambda query, k, include_embeddings=False, **kwargs: [
+        dict(candidate) for candidate in candidates[:k]
+    ]
+    store._embed_query = lambda query: list(query_vector)
+    return store
+
+
+def _hybrid_candidates(lexical_rank: int, count: int = 24):
+    """
+    Candidates in hybrid (RRF) order: `count - 1` chunks close to the query
+    vector plus one exact identifier match at `lexical_rank` whose embedding
+    is orthogonal to the query.
+    """
+    rng = np.random.default_rng(7)
+    dimension = settings.EMBEDDING_DIMENSION
+    query_vector = np.zeros(dimension, dtype=np.float32)
+    query_vector[0] = 1.0
+    candidates = []
+    for index in range(count - 1):
+        embedding = query_vector + rng.normal(0, 0.04, dimension).astype(np.float32)
+        candidates.append({"chunk_text": f"semantic neighbour {index}", "embedding": embedding.tolist()})
+    lexical_embedding = np.zeros(dimension, dtype=np.float32)
+    lexical_embedding[1] = 1.0
+    candidates.insert(lexical_rank, {
+        "chunk_text": "Vehicle MH12AB1234 registered to the suspect",
+        "embedding": lexical_embedding.tolist(),
+    })
+    return candidates, query_vector
+
+
+def test_lexical_top_hit_survives_mmr():
+    candidates, query_vector = _hybrid_candidates(lexical_rank=0)
+    results = _store(candidates, query_vector).diverse_search("MH12AB1234", k=8, fetch_k=24, lambda_mult=0.6)
+
+    assert len(results) == 8
+    assert results[0]["chunk_text"] == candidates[0]["chunk_text"]
+    assert all("embedding" not in result for result in results)
+
+
+def test_high_ranked_lexical_hit_survives_mmr():
+    candidates, query_vector = _hybrid_candidates(lexical_rank=2)
+    texts = [result["chunk_text"] for result in
+             _store(candidates, query_vector).diverse_search("MH12AB1234", k=8, fetch_k=24, lambda_mult=0.6)]
+
+    assert candidates[2]["chunk_text"] in texts
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,459 @@
+"""
+Managed pgvector index for document_chunks.embedding.
+
+The index used to be declared on the model and created by create_all on an
+empty table, so IVFFlat centroids were trained on nothing. It is now owned by
+this module:
+
+- The index type (HNSW or IVFFlat) and its build parameters come from settings
+  (VECTOR_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS).
+- `ensure_vector_index` runs from init_db and only creates a missing index,
+  or replaces one left INVALID by an interrupted build (IVFFlat is deferred
+  until the table has rows to train on).
+- `rebuild_vector_index` builds a replacement CONCURRENTLY and swaps it in,
+  so reads and ingestion keep running during the rebuild.
+- `apply_search_params` sets hnsw.ef_search / ivfflat.probes for the current
+  transaction, letting each query trade latency for recall.
+
+Quantized first pass (VECTOR_QUANTIZATION):
+- 'halfvec': an expression index over `embedding::halfvec`, half the size of
+  the float32 index.
+- 'binary': an expression index over `binary_quantize(embedding)::bit`,
+  searched by Hamming distance; about 1/30 of the float32 index.
+The table keeps a single full-precision copy of each vector. `quantized_search`
+shortlists k * QUANTIZED_RERANK_MULTIPLIER chunks through the compact index
+and re-ranks them by exact cosine distance on `embedding`.
+
+Usage:
+    python vector_index.py status
+    python vector_index.py rebuild --type hnsw --m 16 --ef-construction 64
+    python vector_index.py rebuild --type ivfflat --lists 1000
+    python vector_index.py rebuild --quantization binary
+    python vector_index.py benchmark --quantization halfvec --queries 50 --k 10
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import Float, cast, func, literal, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+import models
+
+INDEX_NAME = "ix_document_chunks_embedding"
+TABLE_NAME = "document_chunks"
+COLUMN_NAME = "embedding"
+# similarity_search orders by cosine distance (<=>), so the index must use cosine ops
+OPCLASS = "vector_cosine_ops"
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+ITERATIVE_SCAN_MODES = ("relaxed_order", "strict_order")
+
+QUANTIZATIONS = ("none", "halfvec", "binary")
+# quantization -> (index name, opclass); both are expression indexes on `embedding`
+QUANTIZED_INDEXES = {
+    "halfvec": (f"{INDEX_NAME}_half", "halfvec_cosine_ops"),
+    "binary": (f"{INDEX_NAME}_bit", "bit_hamming_ops"),
+}
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+# pgvector extension version, read once per process (hnsw/ivfflat.iterative_scan need >= 0.8)
+_pgvector_version: Optional[tuple] = None
+
+
+def pgvector_version(bind) -> tuple:
+    """Installed pgvector version as a tuple of ints, e.g. (0, 8, 0); () if unknown."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        row = bind.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).first()
+        try:
+            _pgvector_version = tuple(int(part) for part in row[0].split(".")) if row else ()
+        except ValueError:
+            _pgvector_version = ()
+        if settings.VECTOR_ITERATIVE_SCAN.lower() != "off" and _pgvector_version < (0, 8):
+            print(f"⚠️  pgvector {row[0] if row else 'unknown'} has no iterative index scans; ignoring VECTOR_ITERATIVE_SCAN")
+    return _pgvector_version
+
+
+def build_index_sql(
+    index_name: str = INDEX_NAME,
+    index_type: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    concurrently: bool = True,
+    table_name: str = TABLE_NAME,
+    column_name: str = COLUMN_NAME,
+    opclass: str = OPCLASS
+) -> str:
+    """Return the CREATE INDEX statement for the configured index type."""
+    index_type = (index_type or settings.VECTOR_INDEX_TYPE).lower()
+    if index_type == "hnsw":
+        params = f"m = {int(m or settings.HNSW_M)}, ef_construction = {int(ef_construction or settings.HNSW_EF_CONSTRUCTION)}"
+    elif index_type == "ivfflat":
+        params = f"lists = {int(lists or settings.IVFFLAT_LISTS)}"
+    else:
+        raise ValueError(f"Unknown vector index type: {index_type}. Available: {', '.join(INDEX_TYPES)}")
+
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    return (
+        f"CREATE INDEX {concurrent}IF NOT EXISTS {index_name} "
+        f"ON {table_name} USING {index_type} ({column_name} {opclass}) "
+        f"WITH ({params})"
+    )
+
+
+def _resolve_quantization(quantization: Optional[str]) -> str:
+    quantization = (quantization or settings.VECTOR_QUANTIZATION).lower()
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown vector quantization: {quantization}. Available: {', '.join(QUANTIZATIONS)}")
+    return quantization
+
+
+def quantized_expression_sql(quantization: str, column_name: str = COLUMN_NAME) -> str:
+    """SQL for the compact form of `column_name`; must match the query expression exactly."""
+    dimension = settings.EMBEDDING_DIMENSION
+    if quantization == "halfvec":
+        return f"(CAST({column_name} AS HALFVEC({dimension})))"
+    if quantization == "binary":
+        return f"(CAST(binary_quantize({column_name}) AS BIT({dimension})))"
+    raise ValueError(f"No quantized expression for: {quantization}")
+
+
+def _managed_indexes(quantization: Optional[str] = None) -> List[tuple]:
+    """(index name, opclass, indexed expression) for every index this module owns."""
+    indexes = [(INDEX_NAME, OPCLASS, COLUMN_NAME)]
+    quantization = _resolve_quantization(quantization)
+    if quantization != "none":
+        index_name, opclass = QUANTIZED_INDEXES[quantization]
+        indexes.append((index_name, opclass, quantized_expression_sql(quantization)))
+    return indexes
+
+
+def get_index_status(engine: Engine, index_name: str = INDEX_NAME) -> Dict[str, Any]:
+    """Describe the current vector index (definition, size, validity)."""
+    if not _is_postgres(engine):
+        return {"exists": False, "reason": f"{engine.dialect.name} has no pgvector indexes"}
+
+    with engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT i.indexdef,
+                   pg_size_pretty(pg_relation_size(c.oid)) AS size,
+                   ix.indisvalid
+            FROM pg_indexes i
+            JOIN pg_class c ON c.relname = i.indexname
+            JOIN pg_index ix ON ix.indexrelid = c.oid
+            WHERE i.tablename = :table AND i.indexname = :name
+        """), {"table": TABLE_NAME, "name": index_name}).first()
+        rows = conn.execute(text(f"SELECT count(*) FROM {TABLE_NAME}")).scalar()
+
+    if not row:
+        return {"exists": False, "rows": rows}
+    return {
+        "exists": True,
+        "definition": row[0],
+        "size": row[1],
+        "valid": row[2],
+        "rows": rows,
+    }
+
+
+def ensure_vector_index(engine: Engine) -> None:
+    """
+    Create the vector index (and the quantized index, if enabled) if missing
+    or left INVALID by an interrupted concurrent build.
+
+    HNSW needs no training data and is created straight away. IVFFlat is only
+    built once the table has rows; on an empty table the centroids would be
+    meaningless, so run `python vector_index.py rebuild` after ingestion.
+    """
+    if not _is_postgres(engine):
+        return
+
+    with engine.connect() as conn:
+        pgvector_version(conn)
+
+    for index_name, opclass, expression in _managed_indexes():
+        status = get_index_status(engine, index_name)
+        if status.get("exists") and not status["valid"]:
+            # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index that the
+            # planner never uses and that IF NOT EXISTS would take for a real one
+            print(f"⚠️  {index_name} is INVALID (interrupted build); dropping it")
+            with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            status["exists"] = False
+        if status.get("exists"):
+            if opclass not in status["definition"]:
+                print(f"⚠️  {index_name} does not use {opclass}; searches cannot use it. Run 'python vector_index.py rebuild'")
+            continue
+
+        if settings.VECTOR_INDEX_TYPE.lower() == "ivfflat" and not status.get("rows"):
+            print(f"⚠️  Skipping IVFFlat index {index_name} on empty {TABLE_NAME}; run 'python vector_index.py rebuild' after ingestion")
+            continue
+
+        with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+            conn.execute(text(build_index_sql(index_name=index_name, column_name=expression, opclass=opclass)))
+        print(f"✅ Vector index {index_name} created ({settings.VECTOR_INDEX_TYPE})")
+
+
+def rebuild_vector_index(
+    engine: Engine,
+    index_type: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    quantization: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Rebuild the vector index online.
+
+    A replacement index is built CONCURRENTLY next to the live one, then the
+    old index is dropped CONCURRENTLY and the new one renamed into place.
+    Queries keep using the old index until the swap. Pass `quantization`
+    ('halfvec' / 'binary') to rebuild that quantized index instead.
+    """
+    if not _is_postgres(engine):
+        raise RuntimeError("Vector index rebuild requires PostgreSQL/AlloyDB with pgvector")
+
+    index_name, opclass, expression = INDEX_NAME, OPCLASS, COLUMN_NAME
+    if quantization and quantization.lower() != "none":
+        quantization = _resolve_quantization(quantization)
+        index_name, opclass = QUANTIZED_INDEXES[quantization]
+        expression = quantized_expression_sql(quantization)
+
+    new_name = f"{index_name}_new"
+    create_sql = build_index_sql(
+        index_name=new_name,
+        index_type=index_type,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+        concurrently=True,
+        column_name=expression,
+        opclass=opclass
+    )
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        # A failed concurrent build leaves an INVALID index behind; clear it first
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))
+        print(f"Building {new_name}: {create_sql}")
+        conn.execute(text(create_sql))
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+        conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {index_name}"))
+        conn.execute(text(f"ANALYZE {TABLE_NAME}"))
+
+    status = get_index_status(engine, index_name)
+    print(f"✅ Vector index rebuilt: {status.get('definition')} ({status.get('size')})")
+    return status
+
+
+def apply_search_params(
+    db: Session,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    iterative_scan: Optional[str] = None
+) -> None:
+    """
+    Set per-query ANN knobs for the current transaction.
+
+    hnsw.ef_search (HNSW) and ivfflat.probes (IVFFlat) trade latency for
+    recall; SET LOCAL scopes them to the transaction running the search.
+    `iterative_scan` ('relaxed_order' / 'strict_order') keeps scanning the
+    index until enough rows pass the query's filters; it is skipped when the
+    installed pgvector is older than 0.8.
+    """
+    if not _is_postgres(db.get_bind()):
+        return
+
+    ef_search = ef_search or settings.HNSW_EF_SEARCH
+    probes = probes or settings.IVFFLAT_PROBES
+    # SET does not accept bind parameters; values are coerced to int above
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+
+    if iterative_scan and iterative_scan.lower() != "off":
+        if iterative_scan not in ITERATIVE_SCAN_MODES:
+            raise ValueError(f"Unknown iterative scan mode: {iterative_scan}. Available: off, {', '.join(ITERATIVE_SCAN_MODES)}")
+        if pgvector_version(db) < (0, 8):
+            # The GUCs do not exist before 0.8 and SET LOCAL would abort the transaction
+            return
+        db.execute(text(f"SET LOCAL hnsw.iterative_scan = {iterative_scan}"))
+        db.execute(text(f"SET LOCAL ivfflat.iterative_scan = {iterative_scan}"))
+
+
+def quantized_distance(column, query_embedding: List[float], quantization: str):
+    """
+    First-pass distance on the compact representation.
+
+    The expressions mirror `quantized_expression_sql` so the planner can
+    serve the ORDER BY from the quantized expression index.
+    """
+    dimension = settings.EMBEDDING_DIMENSION
+    query_vector = literal(query_embedding, Vector(dimension))
+    if quantization == "halfvec":
+        return cast(column, HALFVEC(dimension)).op("<=>", return_type=Float)(
+            cast(query_vector, HALFVEC(dimension))
+        )
+    if quantization == "binary":
+        return cast(func.binary_quantize(column), BIT(dimension)).op("<~>", return_type=Float)(
+            cast(func.binary_quantize(query_vector), BIT(dimension))
+        )
+    raise ValueError(f"No quantized distance for: {quantization}")
+
+
+def quantized_search(
+    candidates,
+    query_embedding: List[float],
+    k: int,
+    quantization: Optional[str] = None,
+    rerank_multiplier: Optional[int] = None
+) -> List[tuple]:
+    """
+    Shortlist chunks through the quantized index, then re-rank them exactly.
+
+    `candidates` is a DocumentChunk query carrying the caller's filters. The
+    shortlist holds k * rerank_multiplier ids; only those rows are compared
+    against the full-precision vectors. Returns (chunk, distance) pairs.
+    """
+    quantization = _resolve_quantization(quantization)
+    rerank_multiplier = max(1, rerank_multiplier or settings.QUANTIZED_RERANK_MULTIPLIER)
+    chunk = models.DocumentChunk
+
+    first_pass = quantized_distance(chunk.embedding, query_embedding, quantization)
+    shortlist = candidates.with_entities(chunk.id).order_by(first_pass).limit(
+        k * rerank_multiplier
+    ).subquery()
+
+    # `+ 0` keeps the re-rank off the float32 index: it only sorts the shortlist
+    exact_distance = chunk.embedding.cosine_distance(query_embedding) + 0
+    session = candidates.session
+    return session.query(chunk).filter(chunk.id.in_(select(shortlist.c.id))).add_columns(
+        exact_distance.label("distance")
+    ).order_by(exact_distance).limit(k).all()
+
+
+def benchmark_quantization(
+    db: Session,
+    quantization: Optional[str] = None,
+    queries: int = 20,
+    k: int = 10,
+    ef_search: Optional[int] = None,
+    rerank_multiplier: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Compare recall@k and latency of exact, ANN and quantized+re-rank search.
+
+    Stored chunk embeddings are sampled as queries; exact search is the
+    ground truth.
+    """
+    quantization = _resolve_quantization(quantization)
+    if quantization == "none":
+        raise ValueError("Pick a quantization to benchmark: halfvec or binary")
+
+    chunk = models.DocumentChunk
+    samples = [
+        [float(value) for value in row[0]]
+        for row in db.query(chunk.embedding).filter(chunk.embedding.isnot(None)).order_by(func.random()).limit(queries)
+    ]
+    db.rollback()
+    if not samples:
+        raise RuntimeError(f"No embedded chunks in {TABLE_NAME} to benchmark")
+
+    candidates = db.query(chunk).filter(chunk.embedding.isnot(None))
+
+    def run_exact(query_embedding):
+        distance = chunk.embedding.cosine_distance(query_embedding) + 0
+        return candidates.add_columns(distance.label("distance")).order_by(distance).limit(k).all()
+
+    def run_ann(query_embedding):
+        apply_search_params(db, ef_search=ef_search)
+        distance = chunk.embedding.cosine_distance(query_embedding)
+        return candidates.add_columns(distance.label("distance")).order_by(distance).limit(k).all()
+
+    def run_quantized(query_embedding):
+        apply_search_params(db, ef_search=ef_search)
+        return quantized_search(candidates, query_embedding, k, quantization, rerank_multiplier)
+
+    paths = {"exact": run_exact, "ann": run_ann, quantization: run_quantized}
+    latencies = {name: [] for name in paths}
+    recalls = {name: [] for name in paths}
+    for query_embedding in samples:
+        truth = None
+        for name, run in paths.items():
+            started = time.perf_counter()
+            ids = {row[0].id for row in run(query_embedding)}
+            latencies[name].append((time.perf_counter() - started) * 1000)
+            # End the transaction so SET LOCAL does not leak into the next path
+            db.rollback()
+            if truth is None:
+                truth = ids
+            recalls[name].append(len(ids & truth) / len(truth) if truth else 1.0)
+
+    report = {"queries": len(samples), "k": k}
+    for name in paths:
+        ordered = sorted(latencies[name])
+        report[name] = {
+            "recall_at_k": round(sum(recalls[name]) / len(recalls[name]), 4),
+            "mean_ms": round(sum(ordered) / len(ordered), 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Manage the document_chunks vector index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show the current index definition and size")
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the index CONCURRENTLY")
+    rebuild_parser.add_argument("--type", choices=INDEX_TYPES, default=None)
+    rebuild_parser.add_argument("--m", type=int, default=None, help="HNSW: max connections per layer")
+    rebuild_parser.add_argument("--ef-construction", type=int, default=None, help="HNSW: build candidate list size")
+    rebuild_parser.add_argument("--lists", type=int, default=None, help="IVFFlat: number of inverted lists")
+    rebuild_parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                                help="Rebuild the quantized index instead of the float32 one")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Recall@k and latency: exact vs ANN vs quantized")
+    benchmark_parser.add_argument("--quantization", choices=QUANTIZATIONS[1:], default=None)
+    benchmark_parser.add_argument("--queries", type=int, default=20)
+    benchmark_parser.add_argument("--k", type=int, default=10)
+    benchmark_parser.add_argument("--ef-search", type=int, default=None)
+    benchmark_parser.add_argument("--rerank-multiplier", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for index_name, _, _ in _managed_indexes():
+            print(index_name, get_index_status(engine, index_name))
+    elif args.command == "rebuild":
+        rebuild_vector_index(
+            engine,
+            index_type=args.type,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            lists=args.lists,
+            quantization=args.quantization
+        )
+    else:
+        db = SessionLocal()
+        try:
+            print(benchmark_quantization(
+                db,
+                quantization=args.quantization,
+                queries=args.queries,
+                k=args.k,
+                ef_search=args.ef_search,
+                rerank_multiplier=args.rerank_multiplier
+            ))
+        finally:
+            db.close()
@@ -1,10 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, insert, update
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_ollama import OllamaEmbeddings
+import numpy as np
 from config import settings
+from embedding_gateway import get_embedding_gateway
+from embedding_cache import (
+    ChunkEmbeddingCache,
+    content_hash,
+    get_query_embedding_cache,
+    record_job_cache_stats,
+)
+from vector_index import apply_search_params, quantized_search
+from local_vector_index import get_local_vector_index, is_local_backend
+from lexical_index import is_lexical_supported, lexical_search
+from retrieval import mmr_select, reciprocal_rank_fusion
+from rbac import chunk_ownership, filter_owned_rows
+from document_vectors import delete_document_vector, refresh_document_vector, top_documents
 import models
 
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+
+_text_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """One splitter per process; it holds no per-call state, so stores share it."""
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings.CHUNK_SIZE,
+            chunk_overlap=settings.CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+    return _text_splitter
+
 
 class VectorStore:
     
@@ -12,26 +46,62 @@ class VectorStore:
         self.db = db
         self.embeddings = None
         self.embedding_available = True
+        self.last_ingest_stats: Dict[str, Any] = {}
         
         try:
-            self.embeddings = OllamaEmbeddings(
-                model=settings.EMBEDDING_MODEL,
-                base_url=settings.EMBEDDING_LLM_URL
-            )
+            # Shared, micro-batching client instead of one OllamaEmbeddings per store
+            self.embeddings = get_embedding_gateway()
         except Exception as exc:
             self.embedding_available = False
             print(f"Embedding model unavailable ({exc}). Falling back to keyword search.")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        self.text_splitter = _get_text_splitter()
+    
+    def _embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed a batch of texts in one request; yields None per text when embeddings are unavailable."""
+        if not texts or not self.embedding_available or self.embeddings is None:
+            return [None] * len(texts)
+        try:
+            return self.embeddings.embed_documents(texts)
+        except Exception as exc:
+            self.embedding_available = False
+            print(f"Failed to generate embeddings ({exc}). Using fallback mode.")
+            return [None] * len(texts)
+    
+    def _bulk_insert_chunks(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Write all chunk rows with a single multi-row INSERT ... RETURNING id."""
+        if not rows:
+            return []
+        table = models.DocumentChunk.__table__
+        result = self.db.execute(insert(table).values(rows).returning(table.c.id))
+        return [row[0] for row in result]
+    
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a search query, serving repeated questions from the query embedding cache."""
+        if not self.embedding_available or self.embeddings is None:
+            return None
+        
+        model_name = getattr(self.embeddings, "model_name", settings.EMBEDDING_MODEL)
+        cache = get_query_embedding_cache()
+        cached = cache.get(query, model_name)
+        if cached is not None:
+            return cached
+        
+        try:
+            query_embedding = self.embeddings.embed_query(query)
+        except Exception as exc:
+            self.embedding_available = False
+            print(f"Failed to embed query ({exc}). Using fallback keyword search.")
+            return None
+        
+        cache.put(query, model_name, query_embedding)
+        return query_embedding
     
     def add_document_chunks(
         self,
         document_id: int,
         text: str,
-        metadata: Dict[str, Any] = None
+        metadata: Dict[str, Any] = None,
+        batch_size: Optional[int] = None
     ) -> List[int]:
 
         # if not document_id or document_id == 0:
@@ -39,117 +109,494 @@ class VectorStore:
 
         chunks = self.text_splitter.split_text(text)
         print(f"Created {len(chunks)} chunks for document {document_id}")
+        return self._insert_chunks(document_id, list(enumerate(chunks)), metadata, batch_size)
+    
+    def _insert_chunks(
+        self,
+        document_id: int,
+        indexed_chunks: List[tuple],
+        metadata: Dict[str, Any] = None,
+        batch_size: Optional[int] = None
+    ) -> List[int]:
+        """Embed (cache-aware) and insert (chunk_index, chunk_text) pairs, then commit."""
+        if not indexed_chunks:
+            self.db.commit()
+            return []
         
-        chunk_ids = []
-        for idx, chunk_text in enumerate(chunks):
-            embedding_vector = None
-            if self.embedding_available and self.embeddings is not None:
-                try:
-                    embedding_vector = self.embeddings.embed_query(chunk_text)
-                except Exception as exc:
-                    self.embedding_available = False
-                    embedding_vector = None
-                    print(f"Failed to generate embedding ({exc}). Using fallback mode.")
-            
-            chunk = models.DocumentChunk(
-                document_id=document_id,
-                chunk_index=idx,
-                chunk_text=chunk_text,
-                embedding=embedding_vector,
-                chunk_metadata=metadata or {}
-            )
-            self.db.add(chunk)
-            self.db.flush()  # Get the ID
-            chunk_ids.append(chunk.id)
+        chunk_indexes = [idx for idx, _ in indexed_chunks]
+        chunks = [chunk_text for _, chunk_text in indexed_chunks]
+        batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+        started = time.perf_counter()
+        
+        # Reuse embeddings of chunk texts seen before (re-uploads, repeated boilerplate)
+        model_name = getattr(self.embeddings, "model_name", settings.EMBEDDING_MODEL)
+        hashes = [content_hash(chunk_text) for chunk_text in chunks]
+        cached: Dict[str, Any] = {}
+        if settings.CHUNK_EMBEDDING_CACHE:
+            cached = ChunkEmbeddingCache(self.db).get_many(hashes, model_name)
+        
+        # Embed each distinct uncached text once, in batches: one HTTP round-trip per batch
+        pending = list(dict.fromkeys(
+            (key, chunk_text) for key, chunk_text in zip(hashes, chunks) if key not in cached
+        ))
+        computed: Dict[str, Any] = {}
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = self._embed_batch([chunk_text for _, chunk_text in batch])
+            computed.update((key, vector) for (key, _), vector in zip(batch, vectors) if vector is not None)
+        embed_seconds = time.perf_counter() - started
         
+        vectors_by_hash = {**computed, **cached}
+        embedding_vectors = [vectors_by_hash.get(key) for key in hashes]
+        cache_hits = sum(1 for key in hashes if key in cached)
+        
+        ownership = chunk_ownership(self.db, document_id)
+        rows = [
+            {
+                "document_id": document_id,
+                "chunk_index": idx,
+                "chunk_text": chunk_text,
+                "content_hash": key,
+                "embedding": embedding_vector,
+                "metadata": metadata or {},
+                **ownership,
+            }
+            for idx, chunk_text, key, embedding_vector in zip(chunk_indexes, chunks, hashes, embedding_vectors)
+        ]
+        chunk_ids = self._bulk_insert_chunks(rows)
+        if settings.CHUNK_EMBEDDING_CACHE:
+            ChunkEmbeddingCache(self.db).put_many(computed, model_name)
+            if ownership.get("job_id"):
+                record_job_cache_stats(self.db, ownership["job_id"], cache_hits, len(chunks) - cache_hits)
         self.db.commit()
-        print(f"Stored {len(chunks)} chunks with embeddings")
+        
+        if is_local_backend(self.db.get_bind()):
+            try:
+                get_local_vector_index().add(chunk_ids, [document_id] * len(chunk_ids), embedding_vectors)
+            except Exception as exc:
+                print(f"⚠️  Could not add chunks of document {document_id} to the local vector index: {exc}")
+        
+        elapsed = time.perf_counter() - started
+        throughput = len(chunks) / elapsed if elapsed > 0 else float(len(chunks))
+        self.last_ingest_stats = {
+            "document_id": document_id,
+            "chunks": len(chunks),
+            "embedded": sum(1 for vector in embedding_vectors if vector is not None),
+            "cache_hits": cache_hits,
+            "embed_seconds": round(embed_seconds, 3),
+            "total_seconds": round(elapsed, 3),
+            "chunks_per_second": round(throughput, 1),
+        }
+        print(
+            f"Stored {len(chunks)} chunks for document {document_id} in {elapsed:.2f}s "
+            f"(embedding {embed_seconds:.2f}s, {throughput:.1f} chunks/sec, "
+            f"{cache_hits}/{len(chunks)} embeddings from cache)"
+        )
         
         return chunk_ids
     
+    def sync_document_chunks(
+        self,
+        document_id: int,
+        text: str,
+        metadata: Dict[str, Any] = None,
+        batch_size: Optional[int] = None
+    ) -> List[int]:
+        """
+        Re-index a document's chunks of one source by diffing against the stored rows.
+        
+        New chunks are matched to stored chunks of the same metadata source by
+        content hash: a match at the same chunk_index is kept as is, a match at
+        another index only has its chunk_index moved. Only unmatched chunks are
+        embedded and inserted, and only stored chunks left over are deleted, so
+        reprocessing a barely changed file costs almost no embedding or writes.
+        Returns the ids of the document's chunks for this source.
+        """
+        metadata = metadata or {}
+        source = metadata.get("source")
+        chunks = self.text_splitter.split_text(text) if text else []
+        hashes = [content_hash(chunk_text) for chunk_text in chunks]
+        
+        chunk = models.DocumentChunk
+        stored = [
+            row for row in self.db.query(
+                chunk.id,
+                chunk.chunk_index,
+                chunk.chunk_text,
+                chunk.content_hash,
+                chunk.chunk_metadata,
+                chunk.embedding.is_(None).label("missing_embedding")
+            ).filter(chunk.document_id == document_id)
+            if (row.chunk_metadata or {}).get("source") == source
+        ]
+        
+        # Rows written before content_hash existed are hashed here; rows that
+        # never got an embedding are not reused so they get embedded this time
+        available: Dict[str, List[Any]] = {}
+        stored_hashes: Dict[int, str] = {}
+        for row in stored:
+            if row.missing_embedding:
+                continue
+            stored_hashes[row.id] = row.content_hash or content_hash(row.chunk_text)
+            available.setdefault(stored_hashes[row.id], []).append(row)
+        
+        kept: List[int] = []
+        updates: List[Dict[str, Any]] = []
+        unmatched: List[int] = []
+        # First pass: same text at the same position
+        for idx, key in enumerate(hashes):
+            rows = available.get(key, [])
+            row = next((r for r in rows if r.chunk_index == idx), None)
+            if row is None:
+                unmatched.append(idx)
+                continue
+            rows.remove(row)
+            kept.append(row.id)
+            if row.content_hash is None:
+                updates.append({"row_id": row.id, "new_index": idx, "new_hash": key})
+        # Second pass: same text that moved (e.g. a paragraph inserted above it)
+        to_insert = []
+        for idx in unmatched:
+            rows = available.get(hashes[idx])
+            if rows:
+                row = rows.pop(0)
+                kept.append(row.id)
+                updates.append({"row_id": row.id, "new_index": idx, "new_hash": hashes[idx]})
+            else:
+                to_insert.append((idx, chunks[idx]))
+        
+        kept_ids = set(kept)
+        deleted_ids = [row.id for row in stored if row.id not in kept_ids]
+        
+        table = chunk.__table__
+        if updates:
+            self.db.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(
+                    chunk_index=bindparam("new_index"),
+                    content_hash=bindparam("new_hash")
+                ),
+                updates
+            )
+        if deleted_ids:
+            self.db.query(chunk).filter(chunk.id.in_(deleted_ids)).delete(synchronize_session=False)
+        
+        # Tombstone before inserting: SQLite may hand the deleted ids to the new
+        # chunks, and a later tombstone would hide them from the local index
+        if deleted_ids and is_local_backend(self.db.get_bind()):
+            try:
+                get_local_vector_index().delete_chunks(deleted_ids)
+            except Exception as exc:
+                print(f"⚠️  Could not remove deleted chunks from the local vector index: {exc}")
+        
+        # Commits the updates and deletes together with the inserts
+        inserted_ids = self._insert_chunks(document_id, to_insert, metadata, batch_size)
+        
+        print(
+            f"Re-indexed document {document_id} ({source}): {len(kept) - len(updates)} unchanged, "
+            f"{len(updates)} updated in place, {len(inserted_ids)} inserted, {len(deleted_ids)} deleted"
+        )
+        return kept + inserted_ids
+    
+    def delete_document_chunks(self, document_id: int) -> int:
+        """Delete every chunk of a document (and its local index entries); the caller commits."""
+        deleted = self.db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == document_id
+        ).delete(synchronize_session=False)
+        delete_document_vector(self.db, document_id)
+        if deleted and is_local_backend(self.db.get_bind()):
+            try:
+                get_local_vector_index().delete_documents([document_id])
+            except Exception as exc:
+                print(f"⚠️  Could not remove document {document_id} from the local vector index: {exc}")
+        return deleted
+    
     def similarity_search(
         self,
         query: str,
         k: int = 5,
         document_ids: List[int] = None,
         job_id: str = None,
-        user: Optional[models.User] = None
+        user: Optional[models.User] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        strategy: Optional[str] = None,
+        mode: Optional[str] = None,
+        include_embeddings: bool = False
     ) -> List[Dict[str, Any]]:
+        """
+        Return the k chunks most relevant to `query` that the user may access.
         
-        query_embedding = None
-        if self.embedding_available and self.embeddings is not None:
-            try:
-                query_embedding = self.embeddings.embed_query(query)
-            except Exception as exc:
-                self.embedding_available = False
-                print(f"Failed to embed query ({exc}). Using fallback keyword search.")
-                query_embedding = None
+        `mode` is 'vector', 'lexical' or 'hybrid' (both, fused with reciprocal
+        rank fusion); it defaults to settings.RETRIEVAL_MODE and degrades to
+        lexical search when embeddings are unavailable.
+        `ef_search` (HNSW) and `probes` (IVFFlat) override the index search
+        defaults for this query: higher values raise recall at the cost of latency.
+        `strategy` forces 'exact' or 'ann'; by default ('auto') scoped searches
+        over few chunks are exact and everything else uses the ANN index.
+        `include_embeddings` adds each chunk's stored vector as "embedding".
+        """
+        mode = (mode or settings.RETRIEVAL_MODE).lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}. Available: {', '.join(RETRIEVAL_MODES)}")
+        lexical_supported = is_lexical_supported(self.db.get_bind())
         
-        query_obj = self.db.query(models.DocumentChunk).join(models.Document).join(models.ProcessingJob)
-
-        # Apply RBAC filtering
-        if user:
-            if user.rbac_level == models.RBACLevel.ADMIN:
-                # Admin can access all documents
-                pass
-            elif user.rbac_level == models.RBACLevel.MANAGER:
-                # Manager can access their own documents and their analysts' documents
-                from sqlalchemy import or_
-                query_obj = query_obj.filter(
-                    or_(
-                        models.ProcessingJob.user_id == user.id,
-                        models.User.manager_id == user.id
-                    )
-                ).join(models.User, models.ProcessingJob.user_id == models.User.id)
-            else:  # ANALYST
-                # Analyst can only access their own documents
-                query_obj = query_obj.filter(models.ProcessingJob.user_id == user.id)
+        # RBAC, job and document filters all use columns denormalised onto
+        # document_chunks, so the filter and the ANN scan hit a single table
+        query_obj = filter_owned_rows(self.db.query(models.DocumentChunk), user)
     
         # Filter by document IDs if specified
         if document_ids:
             query_obj = query_obj.filter(models.DocumentChunk.document_id.in_(document_ids))
     
         if job_id:
-            query_obj = query_obj.filter(models.Document.job_id == job_id)
+            query_obj = query_obj.filter(models.DocumentChunk.job_id == job_id)
+        
+        vector_kwargs = {
+            "scoped": bool(document_ids or job_id),
+            "strategy": strategy,
+            "ef_search": ef_search,
+            "probes": probes,
+        }
         
-        if query_embedding is not None:
-            from sqlalchemy import text
+        if mode == "hybrid" and lexical_supported:
+            candidate_k = k * settings.HYBRID_CANDIDATE_MULTIPLIER
+            # Embed on a worker thread while the lexical query runs on this session
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                embedding_future = pool.submit(self._embed_query, query)
+                lexical = lexical_search(query_obj, query, candidate_k)
+                query_embedding = embedding_future.result()
             
-            results = query_obj.filter(models.DocumentChunk.embedding.isnot(None)).order_by(
-                text(f"embedding <=> '{query_embedding}'::vector")
-            ).limit(k).all()
+            vector = []
+            if query_embedding is not None:
+                vector_query_obj, vector_kwargs["scoped"] = self._narrow_to_documents(
+                    query_obj, query_embedding, user, vector_kwargs["scoped"]
+                )
+                vector = self._vector_search(vector_query_obj, query_embedding, k=candidate_k, **vector_kwargs)
+            distances = {chunk.id: distance for chunk, distance in vector}
+            fused = reciprocal_rank_fusion([vector, lexical], rrf_k=settings.RRF_K)[:k]
+            scored = [(chunk, distances.get(chunk.id), score) for chunk, score in fused]
         else:
-            # Fallback: keyword search by simple substring match
-            like_query = f"%{query}%"
-            results = query_obj.filter(
-                models.DocumentChunk.chunk_text.ilike(like_query)
-            ).limit(k).all()
+            query_embedding = self._embed_query(query) if mode != "lexical" else None
             
-            if len(results) < k:
-                # If not enough matches, pad with recent chunks
-                extra = query_obj.order_by(models.DocumentChunk.created_at.desc()).limit(k - len(results)).all()
-                # Avoid duplicates
-                seen_ids = {r.id for r in results}
-                results.extend([r for r in extra if r.id not in seen_ids])
-        
-        return [
-            {
+            if query_embedding is not None:
+                vector_query_obj, vector_kwargs["scoped"] = self._narrow_to_documents(
+                    query_obj, query_embedding, user, vector_kwargs["scoped"]
+                )
+                scored = [
+                    (chunk, distance, 1.0 - distance)
+                    for chunk, distance in self._vector_search(vector_query_obj, query_embedding, k=k, **vector_kwargs)
+                ]
+            elif lexical_supported:
+                scored = [(chunk, None, score) for chunk, score in lexical_search(query_obj, query, k)]
+            else:
+                # SQLite: keyword search by simple substring match
+                like_query = f"%{query}%"
+                results = query_obj.filter(
+                    models.DocumentChunk.chunk_text.ilike(like_query)
+                ).limit(k).all()
+                
+                if len(results) < k:
+                    # If not enough matches, pad with recent chunks
+                    extra = query_obj.order_by(models.DocumentChunk.created_at.desc()).limit(k - len(results)).all()
+                    # Avoid duplicates
+                    seen_ids = {r.id for r in results}
+                    results.extend([r for r in extra if r.id not in seen_ids])
+                scored = [(chunk, None, None) for chunk in results]
+        
+        results = []
+        for chunk, distance, score in scored:
+            result = {
                 "chunk_text": chunk.chunk_text,
                 "document_id": chunk.document_id,
                 "chunk_index": chunk.chunk_index,
-                "metadata": chunk.chunk_metadata
+                "metadata": chunk.chunk_metadata,
+                "distance": distance,
+                "score": score
             }
-            for chunk in results
-        ]
+            if include_embeddings:
+                result["embedding"] = chunk.embedding
+            results.append(result)
+        return results
+    
+    def diverse_search(
+        self,
+        query: str,
+        k: int = 5,
+        fetch_k: Optional[int] = None,
+        lambda_mult: Optional[float] = None,
+        **search_kwargs
+    ) -> List[Dict[str, Any]]:
+        """
+        similarity_search over fetch_k candidates, re-ranked to k diverse chunks with MMR.
+        
+        Overlapping neighbour chunks and the document / summary copies of the
+        same passage are near-duplicates; MMR trades a little relevance for
+        coverage so the LLM context is not spent on repeated text. Relevance
+        is each candidate's rank in the search results, so the top hit is
+        always kept.
+        """
+        fetch_k = max(k, fetch_k or settings.MMR_FETCH_K)
+        lambda_mult = settings.MMR_LAMBDA if lambda_mult is None else lambda_mult
+        candidates = self.similarity_search(query, k=fetch_k, include_embeddings=True, **search_kwargs)
+        
+        if len(candidates) > k:
+            dimension = settings.EMBEDDING_DIMENSION
+            embeddings = np.zeros((len(candidates), dimension), dtype=np.float32)
+            for row, candidate in enumerate(candidates):
+                if candidate["embedding"] is not None:
+                    embeddings[row] = candidate["embedding"]
+            
+            # Relevance is the search's own ranking (hybrid RRF, lexical or vector),
+            # not cosine to the query: an exact name / ID hit ranked first by the
+            # lexical side can sit far from the query vector. Embeddings are only
+            # used for the redundancy term.
+            relevance = 1.0 - np.arange(len(candidates), dtype=np.float32) / len(candidates)
+            
+            picked = mmr_select(
+                relevance,
+                embeddings,
+                k,
+                lambda_mult=lambda_mult,
+                duplicate_threshold=settings.MMR_DUPLICATE_THRESHOLD
+            )
+            candidates = [candidates[idx] for idx in picked]
+        
+        for candidate in candidates:
+            candidate.pop("embedding", None)
+        return candidates[:k]
+    
+    def _narrow_to_documents(self, query_obj, query_embedding: List[float], user, scoped: bool) -> tuple:
+        """
+        Coarse first stage for wide queries: keep only the chunks of the
+        TWO_STAGE_TOP_DOCUMENTS documents whose centroid is closest to the query.
+        
+        Returns the (possibly narrowed) query and whether it is now scoped.
+        Scoped queries and the embedded local index skip this stage.
+        """
+        if scoped or not settings.TWO_STAGE_RETRIEVAL or is_local_backend(self.db.get_bind()):
+            return query_obj, scoped
+        
+        # Filtered HNSW scan over document centroids needs iterative scans as well
+        apply_search_params(self.db, iterative_scan=settings.VECTOR_ITERATIVE_SCAN)
+        document_ids = top_documents(self.db, query_embedding, user, settings.TWO_STAGE_TOP_DOCUMENTS)
+        if not document_ids:
+            # No centroids yet (e.g. before the backfill); search all chunks
+            return query_obj, scoped
+        return query_obj.filter(models.DocumentChunk.document_id.in_(document_ids)), True
+    
+    def _choose_strategy(self, query_obj, scoped: bool, strategy: Optional[str]) -> str:
+        """
+        Pick exact or ANN search.
+        
+        Scoped searches (a job or explicit document_ids) usually cover a few
+        hundred chunks, where an exact scan is both faster than the ANN index
+        and never loses rows to post-filtering.
+        """
+        strategy = (strategy or settings.VECTOR_SEARCH_STRATEGY).lower()
+        if strategy in ("exact", "ann"):
+            return strategy
+        if not scoped:
+            return "ann"
+        
+        candidates = query_obj.filter(models.DocumentChunk.embedding.isnot(None)).order_by(None).count()
+        return "exact" if candidates <= settings.EXACT_SEARCH_MAX_CANDIDATES else "ann"
+    
+    def _vector_search(
+        self,
+        query_obj,
+        query_embedding: List[float],
+        k: int,
+        scoped: bool,
+        strategy: Optional[str],
+        ef_search: Optional[int],
+        probes: Optional[int]
+    ) -> List[tuple]:
+        if is_local_backend(self.db.get_bind()):
+            return self._local_vector_search(query_obj, query_embedding, k)
+        
+        # Bound vector parameter: one cached statement instead of a 768-float literal per query
+        distance = models.DocumentChunk.embedding.cosine_distance(query_embedding)
+        candidates = query_obj.filter(models.DocumentChunk.embedding.isnot(None))
+        
+        chosen = self._choose_strategy(query_obj, scoped, strategy)
+        if chosen == "ann":
+            apply_search_params(
+                self.db,
+                ef_search=ef_search,
+                probes=probes,
+                iterative_scan=settings.VECTOR_ITERATIVE_SCAN
+            )
+            if settings.VECTOR_QUANTIZATION.lower() != "none":
+                # Compact index for the first pass, full-precision re-rank of the shortlist
+                rows = quantized_search(candidates, query_embedding, k)
+            else:
+                rows = candidates.add_columns(distance.label("distance")).order_by(distance).limit(k).all()
+            if len(rows) < k:
+                # The ANN scan ran out of candidates that pass the filters; fall back to exact
+                chosen = "exact"
+        
+        if chosen == "exact":
+            # `+ 0` keeps the planner off the ANN index: filters first, then an exact sort
+            exact_distance = distance + 0
+            rows = candidates.add_columns(exact_distance.label("distance")).order_by(exact_distance).limit(k).all()
+        
+        # Iterative scans return rows in relaxed order; re-sort by the true distance
+        return sorted(((chunk, float(dist)) for chunk, dist in rows), key=lambda item: item[1])
+
+    
+    def _local_vector_search(self, query_obj, query_embedding: List[float], k: int) -> List[tuple]:
+        """Top-k through the embedded NumPy index, restricted by the filters on `query_obj`."""
+        allowed_document_ids = None
+        if query_obj.whereclause is not None:
+            allowed_document_ids = {
+                row[0] for row in query_obj.with_entities(models.DocumentChunk.document_id).distinct()
+            }
+        
+        # Over-fetch: chunks deleted from the database since they were indexed are dropped below
+        hits = get_local_vector_index().search(query_embedding, k * 2, document_ids=allowed_document_ids)
+        if not hits:
+            return []
+        chunks = {
+            chunk.id: chunk
+            for chunk in query_obj.filter(models.DocumentChunk.id.in_([chunk_id for chunk_id, _ in hits]))
+        }
+        return [(chunks[chunk_id], distance) for chunk_id, distance in hits if chunk_id in chunks][:k]
 
 
 def vectorise_and_store_alloydb(
     db: Session,
     document_id: int,
     text_content: str,
-    summary: str = None
+    summary: str = None,
+    incremental: Optional[bool] = None
 ) -> List[int]:
+    """
+    Store (or refresh) the chunks of a document's text and summary.
+    
+    With incremental re-indexing (settings.INCREMENTAL_REINDEX, the default)
+    existing chunks are diffed and only the changes are embedded and written;
+    otherwise all of the document's chunks are replaced.
+    """
     vector_store = VectorStore(db)
+    incremental = settings.INCREMENTAL_REINDEX if incremental is None else incremental
+    
+    if incremental:
+        chunk_ids = vector_store.sync_document_chunks(
+            document_id=document_id,
+            text=text_content,
+            metadata={"source": "document"}
+        )
+        # An empty summary removes previously stored summary chunks
+        chunk_ids.extend(vector_store.sync_document_chunks(
+            document_id=document_id,
+            text=summary or "",
+            metadata={"source": "summary"}
+        ))
+        _refresh_document_vector(db, document_id)
+        return chunk_ids
+    
+    vector_store.delete_document_chunks(document_id)
+    db.commit()
     
     # Store document chunks
     chunk_ids = vector_store.add_document_chunks(
@@ -167,4 +614,15 @@ def vectorise_and_store_alloydb(
         )
         chunk_ids.extend(summary_ids)
     
+    _refresh_document_vector(db, document_id)
     return chunk_ids
+
+
+def _refresh_document_vector(db: Session, document_id: int) -> None:
+    """Update the document centroid used by two-stage retrieval."""
+    try:
+        refresh_document_vector(db, document_id)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        print(f"⚠️  Could not refresh document vector for document {document_id}: {exc}")
@@ -0,0 +1,273 @@
+"""
+Shared runtime for the processor services' queue consumers.
+
+Every processor's main() used to call redis_pubsub.listen_queue, which runs
+one message at a time on one thread. A graph worker spends most of its time
+waiting on LLM HTTP calls and Neo4j round-trips, so we scaled by copying
+graph-worker-1/2 and document-worker-1/2/3 in docker-compose.yml. The runtime
+lets one container do that work:
+
+- WORKER_CONCURRENCY threads run the service callback in parallel (the
+  services keep no per-message state, and each call opens its own
+  SessionLocal() session from the shared engine pool).
+- WORKER_PREFETCH extra messages are fetched ahead into this worker's
+  processing list, so a thread never waits on Redis between messages.
+- WORKER_PROCESSES > 0 runs that many forked child processes, each with its
+  own thread pool, service instance and DB connection pool; a child exits
+  after WORKER_MAX_TASKS_PER_CHILD messages and is replaced (memory recycle
+  for Docling / Whisper / LangChain leaks).
+- SIGTERM (and Ctrl-C) drains: no new messages are fetched, running ones
+  finish within WORKER_DRAIN_TIMEOUT_SECONDS, and prefetched messages that
+  never started are handed back to the queue.
+
+Messages are consumed through reliable_queue.ReliableQueue when QUEUE_RELIABLE
+is on, otherwise with plain BRPOP (and no prefetch, since a popped message
+would be lost with the process).
+
+Usage:
+    from worker_runtime import run_worker
+
+    run_worker(settings.REDIS_QUEUE_GRAPH, lambda: GraphProcessorService().process_job)
+"""
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from redis.exceptions import RedisError
+
+from config import settings
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+class _PopQueue:
+    """Legacy at-most-once consumer (BRPOP) with the ReliableQueue interface."""
+
+    def __init__(self, redis_client, queue_name: str):
+        self.redis = redis_client
+        self.queue_name = queue_name
+        self.worker_id = f"{os.getpid()}"
+
+    def start_heartbeat(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def fetch(self, timeout: float = 1) -> Optional[str]:
+        result = self.redis.brpop(self.queue_name, timeout=timeout)
+        if not result:
+            return None
+        raw = result[1]
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    def handle(self, raw: str, callback: Handler) -> bool:
+        try:
+            callback(json.loads(raw))
+            return True
+        except json.JSONDecodeError as e:
+            print(f"Error decoding message: {e}")
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            traceback.print_exc()
+        return False
+
+
+def _open_queue(redis_client, queue_name: str):
+    if settings.QUEUE_RELIABLE:
+        from fair_queue import open_reliable_queue
+        return open_reliable_queue(redis_client, queue_name)
+    return _PopQueue(redis_client, queue_name)
+
+
+class WorkerRuntime:
+    """Bounded-concurrency consumer of one or more queues in this process."""
+
+    def __init__(
+        self,
+        queue_names: Union[str, Sequence[str]],
+        handler: Handler,
+        concurrency: Optional[int] = None,
+        prefetch: Optional[int] = None,
+        max_tasks: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+        redis_client=None
+    ):
+        self.queue_names = [queue_names] if isinstance(queue_names, str) else list(queue_names)
+        self.handler = handler
+        self.concurrency = max(1, concurrency or settings.WORKER_CONCURRENCY)
+        self.prefetch = max(0, settings.WORKER_PREFETCH if prefetch is None else prefetch)
+        if not settings.QUEUE_RELIABLE:
+            # A popped message only lives in memory; never hold more than we can run
+            self.prefetch = 0
+        self.max_tasks = max_tasks or 0
+        self.drain_timeout = settings.WORKER_DRAIN_TIMEOUT_SECONDS if drain_timeout is None else drain_timeout
+        if redis_client is None:
+            from redis_pubsub import redis_pubsub
+            redis_client = redis_pubsub.redis_client
+        self.redis_client = redis_client
+        self.stop_event = threading.Event()
+        # concurrency running + prefetch reserved messages per process
+        self._window = threading.BoundedSemaphore(self.concurrency + self.prefetch)
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "succeeded": 0, "failed": 0}
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+    def run(self) -> bool:
+        """
+        Consume until stop() (or max_tasks messages). Returns False if running
+        messages did not finish within the drain timeout.
+        """
+        queues = [_open_queue(self.redis_client, name) for name in self.queue_names]
+        for queue in queues:
+            queue.start_heartbeat()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="worker")
+        futures: List[Any] = []
+        fetchers = [
+            threading.Thread(
+                target=self._fetch_loop, args=(queue, executor, futures),
+                name=f"fetch-{queue.queue_name}", daemon=True
+            )
+            for queue in queues
+        ]
+        print(
+            f"✅ Worker {os.getpid()} consuming {', '.join(self.queue_names)} "
+            f"(concurrency={self.concurrency}, prefetch={self.prefetch}, max_tasks={self.max_tasks or '∞'})"
+        )
+        for fetcher in fetchers:
+            fetcher.start()
+        for fetcher in fetchers:
+            fetcher.join()
+
+        # Drain: prefetched messages that never started go back to the queue
+        executor.shutdown(wait=False, cancel_futures=settings.QUEUE_RELIABLE)
+        with self._lock:
+            pending = [future for future in futures if not future.done()]
+        if pending:
+            print(f"Draining {len(pending)} message(s) (up to {self.drain_timeout:.0f}s)...")
+        _, not_done = wait(pending, timeout=self.drain_timeout)
+        if not_done:
+            print(f"⚠️  {len(not_done)} message(s) still running after drain timeout; "
+                  f"they will be re-delivered once this worker's heartbeat expires")
+            return False
+        for queue in queues:
+            queue.stop()
+        return True
+
+    def _fetch_loop(self, queue, executor: ThreadPoolExecutor, futures: List[Any]) -> None:
+        while not self.stop_event.is_set():
+            if not self._window.acquire(timeout=1):
+                continue
+            try:
+                raw = queue.fetch(timeout=1)
+            except RedisError as e:
+                self._window.release()
+                print(f"Error in queue listener: {e}")
+                time.sleep(1)
+                continue
+            if raw is None:
+                self._window.release()
+                continue
+            with self._lock:
+                self._stats["started"] += 1
+                if self.max_tasks and self._stats["started"] >= self.max_tasks:
+                    self.stop_event.set()
+                futures[:] = [future for future in futures if not future.done()]
+                futures.append(executor.submit(self._execute, queue, raw))
+
+    def _execute(self, queue, raw: str) -> None:
+        try:
+            succeeded = queue.handle(raw, self.handler)
+            with self._lock:
+                self._stats["succeeded" if succeeded else "failed"] += 1
+        finally:
+            self._window.release()
+
+
+def _install_drain_handlers(on_signal: Callable[[], None]) -> None:
+    def handle(signum, frame):
+        print(f"\nReceived {signal.Signals(signum).name}, draining worker...")
+        on_signal()
+
+    signal.signal(signal.SIGTERM, handle)
+    signal.signal(signal.SIGINT, handle)
+
+
+def _child_main(queue_names: List[str], handler_factory: Callable[[], Handler], max_tasks: int) -> None:
+    # Connections inherited from the supervisor must not be shared across processes
+    from database import engine
+    engine.dispose(close=False)
+
+    runtime = WorkerRuntime(queue_names, handler_factory(), max_tasks=max_tasks)
+    _install_drain_handlers(runtime.stop)
+    drained = runtime.run()
+    # Hard exit when messages are stuck: pool threads would block interpreter shutdown
+    os._exit(0 if drained else 1)
+
+
+def _supervise(queue_names: List[str], handler_factory: Callable[[], Handler], processes: int) -> None:
+    """Keep `processes` children running, replacing recycled or crashed ones."""
+    context = multiprocessing.get_context("fork")
+    stopping = threading.Event()
+    children: List[Any] = []
+
+    def spawn():
+        child = context.Process(
+            target=_child_main,
+            args=(queue_names, handler_factory, settings.WORKER_MAX_TASKS_PER_CHILD),
+            daemon=False
+        )
+        child.start()
+        return child
+
+    _install_drain_handlers(stopping.set)
+    children = [spawn() for _ in range(processes)]
+    print(f"✅ Supervising {processes} worker process(es): {[child.pid for child in children]}")
+
+    while not stopping.wait(1):
+        for index, child in enumerate(children):
+            if child.is_alive():
+                continue
+            child.join()
+            reason = "recycled" if child.exitcode == 0 else f"exited with code {child.exitcode}"
+            children[index] = spawn()
+            print(f"Worker {child.pid} {reason}; started {children[index].pid}")
+
+    for child in children:
+        if child.is_alive():
+            os.kill(child.pid, signal.SIGTERM)
+    deadline = time.monotonic() + settings.WORKER_DRAIN_TIMEOUT_SECONDS + 5
+    for child in children:
+        child.join(timeout=max(0.0, deadline - time.monotonic()))
+        if child.is_alive():
+            print(f"⚠️  Worker {child.pid} did not drain in time; killing it")
+            child.kill()
+            child.join()
+
+
+def run_worker(queue_names: Union[str, Sequence[str]], handler_factory: Callable[[], Handler]) -> None:
+    """
+    Entry point for processor services. `handler_factory` builds the service
+    and returns its process_job; it runs once per worker process, after fork.
+    """
+    queue_names = [queue_names] if isinstance(queue_names, str) else list(queue_names)
+    if settings.WORKER_PROCESSES > 0:
+        _supervise(queue_names, handler_factory, settings.WORKER_PROCESSES)
+        return
+
+    runtime = WorkerRuntime(queue_names, handler_factory(), max_tasks=0)
+    _install_drain_handlers(runtime.stop)
+    if not runtime.run():
+        os._exit(1)